@@ -20,4 +20,4 @@ OUTRO="sounds/you-died-dark-souls.mp3"
 DURATION=100000
 OUTPUT_NAME="dung-pie"
 
-python scripts/analyze_mix.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME" "$INTRO" "$OUTRO"
+python scripts/mix_client.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME" "$INTRO" "$OUTRO"
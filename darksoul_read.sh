@@ -12,7 +12,7 @@ OUTRO="sounds/you-died-dark-souls.mp3"
 DURATION=900000
 OUTPUT_NAME="Firekeeper-reads-to-you-at-night"
 
-python scripts/analyze_mix.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME"  "$INTRO" "$OUTRO"
+python scripts/mix_client.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME"  "$INTRO" "$OUTRO"
 # Feedback from VLM
 
 python scripts/analyze_with_vlm.py "results/$OUTPUT_NAME"
@@ -15,6 +15,6 @@ OUTPUT_NAME="sodagreen-rainy-bird"
 DURATION=400000
 
 # Call the sound mixer script
-python scripts/analyze_mix.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME"
+python scripts/mix_client.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL" "$DURATION" "$OUTPUT_NAME"
 
 # python scripts/analyze_with_vlm.py "results/$OUTPUT_NAME"
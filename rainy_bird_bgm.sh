@@ -9,5 +9,5 @@ FIRE_SOUND="sounds/fireplace-with-crackling-sounds.mp3"
 BIRD_CALL="voices/Vinous-throated-parrotbill-call.mp3"
 
 # Call the sound mixer script
-python scripts/analyze_mix.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL"
+python scripts/mix_client.py "$FOREST_SOUND" "$RAIN_SOUND" "$FIRE_SOUND" "$BIRD_CALL"
 
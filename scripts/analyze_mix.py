@@ -1,6 +1,10 @@
 import os
-from sound_mixer import create_ambient_mix, add_timed_bird_calls, add_intro_outro
+from mix_graph import render_mix
+from mix_recipe import plan_mix, stream_mix
+from preview import confirm, print_preview_report, render_preview
 from audio_pipeline import AudioAnalysisPipeline
+from export_stage import DEFAULT_TARGETS, export_blocks, export_segment, print_export_report
+from noise_generator import is_noise_spec
 from datetime import datetime
 
 def analyze_mix_with_components(
@@ -11,7 +15,16 @@ def analyze_mix_with_components(
     duration_ms: int = 300000,  # 5 minutes
     output_name: str = None,
     intro_sound: str = None,
-    outro_sound: str = None
+    outro_sound: str = None,
+    export_formats=DEFAULT_TARGETS,
+    auto_balance: bool = False,
+    duck: bool = False,
+    compact: bool = False,
+    seed: int = None,
+    results_dir: str = "results",
+    streaming: bool = False,
+    renderer=None,
+    plan: dict = None
 ) -> dict:
     """Create an ambient mix and analyze all components including the final mix.
     
@@ -24,6 +37,19 @@ def analyze_mix_with_components(
         outro_sound: Optional path to outro sound file
         duration_ms: Duration of the mix in milliseconds
         output_name: Optional name for the output directory
+        export_formats: "format[:bitrate]" specs to encode concurrently; the
+            first one is the file that gets analyzed as the final mix
+        auto_balance: Solve layer gains and EQ for a flat mix spectrum
+        duck: Duck rain, fire and bird calls under the forest layer (narration/songs)
+        compact: Store analysis arrays in one analysis.npz instead of PNG/JSON per component
+        seed: Bird call timing seed (e.g. from an accepted preview)
+        results_dir: Base directory for the exports and analysis results
+        streaming: Analyze the files block by block from ffmpeg in constant memory
+        renderer: mix_graph.MixGraphRenderer to render the mix in memory with
+            memoized nodes (long-running workers); by default the mix is
+            rendered block by block straight into the encoders
+        plan: Mix already planned from these arguments (see plan_from_kwargs,
+            e.g. for an accepted preview), so the sources are not decoded again
         
     Returns:
         Dictionary containing analysis results for all components and final mix
@@ -31,46 +57,35 @@ def analyze_mix_with_components(
     if output_name is None:
         output_name = f"mix_{datetime.now().strftime('%m%d_%H%M')}"
         
-    # Create the mix
-    ambient_mix = create_ambient_mix(
-        forest_sound,
-        rain_sound,
-        fire_sound,
-        duration_ms=duration_ms
-    )
-    
-    # Add bird calls if provided
-    if bird_call_sound:
-        ambient_mix = add_timed_bird_calls(
-            ambient_mix,
-            bird_call_sound,
-            interval_ms=30000,  # Call every 30 seconds
-            call_duration_ms=5000  # Each call lasts 5 seconds
-        )
-    
-    # Add intro/outro if provided
-    final_mix = add_intro_outro(
-        ambient_mix,
-        intro_sound=intro_sound,
-        outro_sound=outro_sound
-    )
-    
-    # Export the mix
-    os.makedirs("results", exist_ok=True)
-    mix_path = f"results/{output_name}/{output_name}.mp3"
-    os.makedirs(os.path.dirname(mix_path), exist_ok=True)
-    final_mix.export(mix_path, format="mp3", bitrate="320k")
+    # Create the mix (bed -> bird calls -> intro/outro) and export it to all formats at once
+    mix_base = os.path.join(results_dir, output_name, output_name)
+    recipe = (forest_sound, rain_sound, fire_sound, bird_call_sound)
+    options = dict(duration_ms=duration_ms, intro_sound=intro_sound, outro_sound=outro_sound,
+                   auto_balance=auto_balance, duck=duck, seed=seed)
+    if renderer is None:
+        # Encoders consume the blocks while the rest of the mix is rendered
+        plan = plan or plan_mix(*recipe, **options)
+        exports = export_blocks(stream_mix(plan), mix_base, plan["frame_rate"], plan["channels"], export_formats)
+    else:
+        exports = export_segment(render_mix(*recipe, **options, renderer=renderer), mix_base, export_formats)
+    print("\nExported formats:")
+    print_export_report(exports)
+    primary = next(iter(exports.values()))
+    if primary["error"]:
+        raise RuntimeError(f"Export of final mix failed: {primary['error']}")
+    mix_path = primary["path"]
     
     # Initialize pipeline
-    pipeline = AudioAnalysisPipeline()
+    pipeline = AudioAnalysisPipeline(results_dir)
     
-    # Analyze all components
+    # Analyze all components (procedural noise layers have no file to analyze)
     components = {
         "forest": forest_sound,
         "rain": rain_sound,
         "fire": fire_sound,
         "final_mix": mix_path
     }
+    components = {name: path for name, path in components.items() if not is_noise_spec(path)}
     
     if bird_call_sound:
         components["bird_calls"] = bird_call_sound
@@ -80,10 +95,10 @@ def analyze_mix_with_components(
         components["outro"] = outro_sound
         
     # Run analysis
-    results = pipeline.analyze_mix_components(components, output_name)
+    results = pipeline.analyze_mix_components(components, output_name, compact=compact, streaming=streaming)
     
     # Print noise analysis summary
-    print(f"\nAnalysis complete! Results saved to results/{output_name}/")
+    print(f"\nAnalysis complete! Results saved to {os.path.join(results_dir, output_name)}/")
     print(f"Final mix saved as: {mix_path}")
     print("\nNoise Analysis Summary:")
     print("-" * 50)
@@ -108,30 +123,80 @@ def analyze_mix_with_components(
     
     return results
 
+USAGE = ("Usage: python analyze_mix.py <forest_sound> <rain_sound> <fire_sound> [bird_call_sound] [duration_ms] [output_name] [intro_sound] [outro_sound] "
+         "[--formats=mp3:320k,opus:160k,flac] [--auto-balance] [--duck] [--compact] [--streaming] [--preview]")
+EXAMPLE = "Example: python analyze_mix.py sounds/birds-forest-morning.mp3 sounds/indoor-hard-rain-sound.mp3 sounds/fireplace-with-crackling-sounds.mp3"
+
+def parse_cli_args(argv) -> dict:
+    """Parse the analyze_mix.py command line into analyze_mix_with_components kwargs.
+    
+    Returns:
+        kwargs plus a "preview" flag, or None if required arguments are missing
+    """
+    # Options: --formats=mp3:320k,opus:160k,flac --auto-balance --duck --compact --streaming --preview
+    options = dict(a[2:].split("=", 1) for a in argv if a.startswith("--") and "=" in a)
+    flags = {a[2:] for a in argv if a.startswith("--") and "=" not in a}
+    args = [a for a in argv if not a.startswith("--")]
+    
+    if len(args) < 3:
+        return None
+        
+    return {
+        "forest_sound": args[0],
+        "rain_sound": args[1],
+        "fire_sound": args[2],
+        "bird_call_sound": args[3] if len(args) > 3 else None,
+        "duration_ms": int(args[4]) if len(args) > 4 else 300000,
+        "output_name": args[5] if len(args) > 5 else f"mix_{datetime.now().strftime('%m%d_%H%M')}",
+        "intro_sound": args[6] if len(args) > 6 else None,
+        "outro_sound": args[7] if len(args) > 7 else None,
+        "export_formats": options.get("formats", ",".join(DEFAULT_TARGETS)),
+        "auto_balance": "auto-balance" in flags,
+        "duck": "duck" in flags,
+        "compact": "compact" in flags,
+        "streaming": "streaming" in flags,
+        "preview": "preview" in flags
+    }
+
+def plan_from_kwargs(kwargs: dict) -> dict:
+    """Plan the mix for analyze_mix_with_components kwargs (see mix_recipe.plan_mix)."""
+    return plan_mix(
+        kwargs["forest_sound"],
+        kwargs["rain_sound"],
+        kwargs["fire_sound"],
+        kwargs.get("bird_call_sound"),
+        duration_ms=kwargs.get("duration_ms", 300000),
+        intro_sound=kwargs.get("intro_sound"),
+        outro_sound=kwargs.get("outro_sound"),
+        auto_balance=kwargs.get("auto_balance", False),
+        duck=kwargs.get("duck", False),
+        seed=kwargs.get("seed")
+    )
+
+def preview_mix(kwargs: dict) -> dict:
+    """Render the preview for analyze_mix_with_components kwargs (see preview.render_preview).
+
+    Uses kwargs["plan"] if it is set, otherwise plans the mix first.
+    """
+    plan = kwargs.get("plan") or plan_from_kwargs(kwargs)
+    output_path = os.path.join(kwargs.get("results_dir", "results"), kwargs["output_name"], "preview.wav")
+    return render_preview(plan, output_path=output_path)
+
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) < 4:
-        print("Usage: python analyze_mix.py <forest_sound> <rain_sound> <fire_sound> [bird_call_sound] [intro_sound] [outro_sound]")
-        print("Example: python analyze_mix.py sounds/birds-forest-morning.mp3 sounds/indoor-hard-rain-sound.mp3 sounds/fireplace-with-crackling-sounds.mp3")
+    kwargs = parse_cli_args(sys.argv[1:])
+    if kwargs is None:
+        print(USAGE)
+        print(EXAMPLE)
         sys.exit(1)
-        
-    forest_sound = sys.argv[1]
-    rain_sound = sys.argv[2]
-    fire_sound = sys.argv[3]
-    bird_call_sound = sys.argv[4] if len(sys.argv) > 4 else None
-    duration_ms = sys.argv[5] if len(sys.argv) > 5 else 300000
-    output_name = sys.argv[6] if len(sys.argv) > 6 else f"mix_{datetime.now().strftime('%m%d_%H%M')}"
-    intro_sound = sys.argv[7] if len(sys.argv) > 7 else None
-    outro_sound = sys.argv[8] if len(sys.argv) > 8 else None
     
-    results = analyze_mix_with_components(
-        forest_sound,
-        rain_sound,
-        fire_sound,
-        bird_call_sound,
-        duration_ms=duration_ms,
-        output_name=output_name,
-        intro_sound=intro_sound,
-        outro_sound=outro_sound
-    )
\ No newline at end of file
+    # Quick low-fidelity excerpt first; the full render only runs once it is accepted
+    if kwargs.pop("preview"):
+        # The full render reuses the previewed plan (same sources, same bird call timing)
+        kwargs["plan"] = plan_from_kwargs(kwargs)
+        print_preview_report(preview_mix(kwargs))
+        if not confirm():
+            sys.exit(0)
+    
+    results = analyze_mix_with_components(**kwargs)
@@ -9,7 +9,10 @@ from PIL import Image
 import io
 from openai import OpenAI
 import sys
+import time
 from datetime import datetime
+from results_store import COMPACT_FILENAME, load_compact_results, render_component
+from vlm_gate import DEFAULT_THRESHOLD, ReviewGate, file_fingerprint, metric_vector, print_gate_report
 
 class VLMAnalyzer:
     def __init__(self, api_key: str):
@@ -38,12 +41,16 @@ class VLMAnalyzer:
             
         return base64.b64encode(img_byte_arr).decode('utf-8')
         
-    def analyze_results(self, result_dir: str, stream: bool = True) -> Dict:
+    def analyze_results(self, result_dir: str, stream: bool = True,
+                        gate: bool = True, threshold: float = DEFAULT_THRESHOLD) -> Dict:
         """Analyze results in the specified directory using GPT-4V.
         
         Args:
             result_dir: Path to results directory
             stream: Whether to stream the response
+            gate: Reuse the feedback of an already reviewed mix with nearly the
+                same metrics and spectrogram instead of calling the VLM
+            threshold: Largest review distance at which feedback is reused
             
         Returns:
             Dictionary containing VLM analysis results
@@ -93,6 +100,34 @@ class VLMAnalyzer:
             else:
                 summary["components"][component_name] = component_data
         
+        # Compact results: metadata from analysis.npz, figures rendered only for the final mix
+        compact_path = result_path / COMPACT_FILENAME
+        compact = not metadata_files and compact_path.exists()
+        if compact:
+            summary = self._load_compact_summary(compact_path)
+        
+        # Gate: reuse the review of a nearly identical mix
+        review_key = self._review_key(summary["final_mix"], result_path) if gate and summary["final_mix"] else None
+        review_gate = ReviewGate(threshold=threshold) if review_key else None
+        if review_gate:
+            vector, fingerprint = review_key
+            match = review_gate.lookup(vector, fingerprint)
+            if match:
+                review_gate.record_hit(match)
+                print(f"Reusing the review of {match['result_dir']} (distance {match['distance']:.2f}), "
+                      f"VLM call skipped")
+                response = f"> 复用 {match['result_dir']} 的分析 (距离 {match['distance']:.2f})\n\n{match['feedback']}"
+                self._save_feedback(result_path, summary, response)
+                print_gate_report(review_gate.report())
+                return {
+                    "summary": summary,
+                    "vlm_analysis": response,
+                    "reused_from": match["result_dir"]
+                }
+        
+        if compact and summary["final_mix"]:
+            summary["final_mix"].update(render_component(result_dir, "final_mix"))
+        
         prompt = self._prepare_analysis_prompt(summary)
         
         images = []
@@ -108,10 +143,31 @@ class VLMAnalyzer:
                     "path": summary["final_mix"]["noise_analysis_image"]
                 })
         
+        start = time.perf_counter()
         response = self._call_gpt4v(prompt, images, stream=stream)
+        if review_gate and not response.startswith("Error calling"):
+            review_gate.record_review(result_dir, vector, fingerprint, response, time.perf_counter() - start)
+            print_gate_report(review_gate.report())
         
-        # Save analysis results to the result directory
-        result_path = Path(result_dir)
+        self._save_feedback(result_path, summary, response)
+        
+        return {
+            "summary": summary,
+            "vlm_analysis": response
+        }
+    
+    def _review_key(self, final_mix: Dict, result_path: Path) -> Optional[tuple]:
+        """Metric vector and spectrogram fingerprint of the final mix for the review gate (None without audio).
+
+        The fingerprint is always computed from the audio file: the stored mel
+        arrays differ between the in-memory and streaming analyses.
+        """
+        vector = metric_vector(final_mix["noise_analysis"])
+        audio_file = next(result_path.glob(f"**/{final_mix['metadata']['filename']}"), None)
+        return (vector, file_fingerprint(str(audio_file))) if audio_file else None
+    
+    def _save_feedback(self, result_path: Path, summary: Dict, response: str):
+        """Write the markdown report to the result directory."""
         feedback_path = result_path / "vlm_feedback.md"
         
         # Create markdown content with timestamp
@@ -144,11 +200,26 @@ class VLMAnalyzer:
             f.write(markdown_content)
             
         print(f"\n分析报告已保存至: {feedback_path}")
-        
-        return {
-            "summary": summary,
-            "vlm_analysis": response
+    
+    def _load_compact_summary(self, compact_path: Path) -> Dict:
+        """Build the analysis summary from a compact analysis.npz without rendering figures."""
+        summary = {
+            "components": {},
+            "final_mix": None
         }
+        for component_name, data in load_compact_results(str(compact_path)).items():
+            metadata = data["metadata"]
+            component_data = {
+                "metadata": metadata,
+                "noise_analysis": metadata.get("noise_analysis", {}),
+                "analysis_image": None,
+                "noise_analysis_image": None
+            }
+            if component_name == "final_mix":
+                summary["final_mix"] = component_data
+            else:
+                summary["components"][component_name] = component_data
+        return summary
     
     def _prepare_analysis_prompt(self, summary: Dict) -> str:
         """Prepare prompt for GPT-4V analysis."""
@@ -282,6 +353,9 @@ def main():
     parser.add_argument("result_dir", help="Directory containing analysis results")
     parser.add_argument("--output", help="Output file for analysis results")
     parser.add_argument("--no-stream", action="store_true", help="Disable response streaming")
+    parser.add_argument("--no-gate", action="store_true", help="Always call the VLM, even for an already reviewed mix")
+    parser.add_argument("--gate-threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Largest metric/spectrogram distance at which prior feedback is reused")
     
     args = parser.parse_args()
     api_key = open("configs/api.key").read().strip()
@@ -290,7 +364,8 @@ def main():
         sys.exit(1)
         
     analyzer = VLMAnalyzer(api_key)
-    results = analyzer.analyze_results(args.result_dir, stream=not args.no_stream)
+    results = analyzer.analyze_results(args.result_dir, stream=not args.no_stream,
+                                       gate=not args.no_gate, threshold=args.gate_threshold)
     
     if args.output:
         with open(args.output, 'w') as f:
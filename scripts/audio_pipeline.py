@@ -1,13 +1,23 @@
 import os
 import numpy as np
 import matplotlib.pyplot as plt
-from pydub import AudioSegment
 import librosa
 import librosa.display
 from datetime import datetime
 from typing import Optional, Tuple, Dict
-import json
-from signal_analysis import SignalAnalyzer
+from concurrent.futures import ThreadPoolExecutor
+from signal_analysis import SignalAnalyzer, analyze, analyze_channels, analyze_windows
+from gain_staging import load_segment
+from streaming_analysis import analyze_file_streaming
+from results_store import (
+    COMPACT_FILENAME, atomic_savefig, atomic_write_json, decimate_columns,
+    save_compact_results, waveform_envelope
+)
+
+MAX_SPECTROGRAM_COLUMNS = 1024  # Mel spectrogram frames kept in compact mode
+COMPACT_WORKERS = 2  # Components decoded and analyzed at once in compact mode (each holds its file in memory)
+LONG_FILE_S = 120.0  # Files longer than this also get a per-window analysis
+WINDOW_S = 30.0      # Window length of that analysis
 
 class AudioAnalysisPipeline:
     def __init__(self, output_base_dir: str = "results"):
@@ -17,7 +27,6 @@ class AudioAnalysisPipeline:
             output_base_dir: Base directory for saving results
         """
         self.output_base_dir = output_base_dir
-        self.signal_analyzer = SignalAnalyzer()
         
     def create_output_directory(self, name: Optional[str] = None) -> str:
         """Create and return the output directory path."""
@@ -28,45 +37,80 @@ class AudioAnalysisPipeline:
         os.makedirs(output_dir, exist_ok=True)
         return output_dir
         
-    def analyze_audio(self, audio_path: str, name: Optional[str] = None) -> Dict:
+    def analyze_audio(self, audio_path: str, name: Optional[str] = None, compact: bool = False) -> Dict:
         """Analyze audio file and generate visualizations.
         
         Args:
             audio_path: Path to the audio file
             name: Optional name for the output directory
+            compact: Write nothing; return the raw analysis arrays under
+                "arrays" instead of rendering PNGs (see results_store)
             
         Returns:
             Dictionary containing analysis results and paths
         """
         # Load audio
-        audio = AudioSegment.from_file(audio_path)
+        audio = load_segment(audio_path)
         
         # Create output directory
-        output_dir = self.create_output_directory(name)
+        output_dir = self.create_output_directory(name) if not compact else None
         base_name = os.path.splitext(os.path.basename(audio_path))[0]
         
+        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+        sr = audio.frame_rate
+        samples = samples / (2**15)  # Normalize
+        
+        # Perform signal analysis (stateless core; the wrapper only for the plots)
+        if compact:
+            noise_analysis = analyze(samples, sr, {"arrays": True})
+            arrays = noise_analysis.pop("arrays")
+        else:
+            signal_analyzer = SignalAnalyzer()
+            signal_analyzer.load_samples(samples, sr)
+            noise_analysis = signal_analyzer.analyze_noise(os.path.join(output_dir, base_name))
+        
+        # Per-channel and per-window metrics, each fanned out over a thread pool
+        frames = samples.reshape(-1, audio.channels)
+        channel_analysis = analyze_channels(frames, sr) if audio.channels > 1 else None
+        window_analysis = analyze_windows(frames.mean(axis=1), sr, WINDOW_S) if len(frames) > LONG_FILE_S * sr else None
+        
+        S = librosa.feature.melspectrogram(y=samples, sr=sr, n_mels=128)
+        
+        # Calculate audio statistics
+        duration = len(audio) / 1000.0  # in seconds
+        channels = audio.channels
+        sample_width = audio.sample_width
+        frame_rate = audio.frame_rate
+        
+        metadata = {
+            "filename": os.path.basename(audio_path),
+            "duration": duration,
+            "channels": channels,
+            "sample_width": sample_width,
+            "frame_rate": frame_rate,
+            "noise_analysis": noise_analysis  # Add noise analysis results
+        }
+        if channel_analysis:
+            metadata["channel_analysis"] = channel_analysis
+        if window_analysis:
+            metadata["window_analysis"] = window_analysis
+        
+        if compact:
+            arrays["mel_spectrogram"] = decimate_columns(S, MAX_SPECTROGRAM_COLUMNS).astype(np.float32)
+            arrays["waveform_envelope"] = waveform_envelope(samples).astype(np.float32)
+            metadata["arrays"] = arrays
+            return metadata
+        
         # Create figure with subplots
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
         
         # Plot waveform
-        samples = np.array(audio.get_array_of_samples())
-        ax1.plot(samples, color='navy')
+        ax1.plot(np.array(audio.get_array_of_samples()), color='navy')
         ax1.set_title("Waveform")
         ax1.set_xlabel("Samples")
         ax1.set_ylabel("Amplitude")
         
         # Plot spectrogram
-        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
-        sr = audio.frame_rate
-        samples = samples / (2**15)  # Normalize
-        
-        # Perform signal analysis
-        self.signal_analyzer.load_samples(samples, sr)
-        noise_analysis = self.signal_analyzer.analyze_noise(
-            os.path.join(output_dir, base_name)
-        )
-        
-        S = librosa.feature.melspectrogram(y=samples, sr=sr, n_mels=128)
         S_dB = librosa.power_to_db(S, ref=np.max)
         
         img = librosa.display.specshow(S_dB, sr=sr, x_axis='time', y_axis='mel', 
@@ -79,40 +123,60 @@ class AudioAnalysisPipeline:
         
         # Save visualization
         viz_path = os.path.join(output_dir, f"{base_name}_analysis.png")
-        plt.savefig(viz_path, dpi=300, bbox_inches='tight')
+        atomic_savefig(viz_path, dpi=300, bbox_inches='tight')
         plt.close()
         
-        # Calculate audio statistics
-        duration = len(audio) / 1000.0  # in seconds
-        channels = audio.channels
-        sample_width = audio.sample_width
-        frame_rate = audio.frame_rate
-        
         # Save metadata
-        metadata = {
-            "filename": os.path.basename(audio_path),
-            "duration": duration,
-            "channels": channels,
-            "sample_width": sample_width,
-            "frame_rate": frame_rate,
-            "visualization_path": viz_path,
-            "noise_analysis": noise_analysis  # Add noise analysis results
-        }
+        metadata["visualization_path"] = viz_path
         
         metadata_path = os.path.join(output_dir, f"{base_name}_metadata.json")
-        with open(metadata_path, 'w') as f:
-            json.dump(metadata, f, indent=4)
+        atomic_write_json(metadata_path, metadata)
             
         return metadata
         
+    def analyze_audio_streaming(self, audio_path: str, name: Optional[str] = None, compact: bool = False) -> Dict:
+        """Analyze an audio file while ffmpeg decodes it, in constant memory.
+        
+        The file is analyzed as a mono downmix and the results are stored
+        compactly (see streaming_analysis and results_store).
+        
+        Args:
+            audio_path: Path to the audio file
+            name: Optional name for the output directory
+            compact: Write nothing; return the raw analysis arrays under "arrays"
+            
+        Returns:
+            Dictionary containing analysis results and paths
+        """
+        metadata = analyze_file_streaming(audio_path)
+        if compact:
+            return metadata
+        
+        output_dir = self.create_output_directory(name)
+        base_name = os.path.splitext(os.path.basename(audio_path))[0]
+        metadata["analysis_path"] = os.path.join(output_dir, COMPACT_FILENAME)
+        arrays = metadata.pop("arrays")
+        save_compact_results(metadata["analysis_path"], {base_name: {"metadata": metadata, "arrays": arrays}})
+        return metadata
+        
     def analyze_mix_components(self, 
                              components: Dict[str, str],
-                             output_name: Optional[str] = None) -> Dict:
+                             output_name: Optional[str] = None,
+                             compact: bool = False,
+                             max_workers: Optional[int] = None,
+                             streaming: bool = False) -> Dict:
         """Analyze multiple audio components and their mix.
         
         Args:
             components: Dictionary mapping component names to file paths
             output_name: Optional name for the output directory
+            compact: Store all components in one compressed analysis.npz
+                instead of PNG + JSON files per component
+            max_workers: Components analyzed concurrently in compact mode
+                (default COMPACT_WORKERS, every component in streaming mode;
+                pyplot is not thread-safe, so PNG mode stays sequential)
+            streaming: Decode and analyze each file block by block in
+                constant memory (always stored compactly)
             
         Returns:
             Dictionary containing analysis results for all components
@@ -121,18 +185,43 @@ class AudioAnalysisPipeline:
             output_name = f"mix_analysis_{datetime.now().strftime('%m%d_%H%M')}"
             
         results = {}
-        for name, path in components.items():
-            results[name] = self.analyze_audio(path, f"{output_name}/{name}")
+        if not compact and not streaming:
+            for name, path in components.items():
+                results[name] = self.analyze_audio(path, f"{output_name}/{name}")
+            return results
+        
+        analyze_audio = self.analyze_audio_streaming if streaming else self.analyze_audio
+        if max_workers is None:
+            # Streaming analysis runs in constant memory; in-memory analysis
+            # decodes inside each task, so the pool bounds the decoded files
+            max_workers = len(components) if streaming else COMPACT_WORKERS
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {
+                name: pool.submit(analyze_audio, path, f"{output_name}/{name}", True)
+                for name, path in components.items()
+            }
+            arrays = {}
+            for name, future in futures.items():
+                results[name] = future.result()
+                arrays[name] = {"metadata": results[name], "arrays": results[name].pop("arrays")}
+        
+        output_dir = self.create_output_directory(output_name)
+        save_compact_results(os.path.join(output_dir, COMPACT_FILENAME), arrays)
             
         return results
 
 if __name__ == "__main__":
     import sys
     
-    if len(sys.argv) < 2:
-        print("Usage: python audio_pipeline.py <audio_file>")
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(args) < 1:
+        print("Usage: python audio_pipeline.py <audio_file> [--streaming]")
         sys.exit(1)
         
     pipeline = AudioAnalysisPipeline()
-    results = pipeline.analyze_audio(sys.argv[1])
-    print(f"Analysis complete. Results saved to: {results['visualization_path']}") 
\ No newline at end of file
+    if "--streaming" in sys.argv:
+        results = pipeline.analyze_audio_streaming(args[0])
+        print(f"Analysis complete. Results saved to: {results['analysis_path']}")
+    else:
+        results = pipeline.analyze_audio(args[0])
+        print(f"Analysis complete. Results saved to: {results['visualization_path']}") 
\ No newline at end of file
@@ -0,0 +1,180 @@
+import numpy as np
+from scipy import signal
+from scipy.optimize import lsq_linear
+from typing import Dict, List, Optional, Sequence, Tuple
+from gain_staging import db_to_gain, source_key
+from signal_analysis import SignalAnalyzer
+
+# Spectral matching auto-balance
+# PSDs of independent layers add linearly, so the per-layer gains and band EQ
+# that make the mix PSD as flat as possible are a bounded least-squares problem
+# over the cached layer PSDs - no re-rendering needed.
+
+BAND_EDGES = (20, 250, 1000, 4000, 16000)  # Hz, 4 bands
+MAX_EQ_DB = 12.0      # Per layer and band boost/cut limit
+REGULARIZATION = 0.05  # Pull towards the manual balance (no change)
+EQ_TAPS = 1025         # Linear-phase FIR length used to apply the EQ
+STREAM_EXCERPT_S = 60  # Seconds of a stream source (procedural noise) analyzed
+
+# PSD cache: (source key, frame_rate) -> (frequencies, psd)
+_psd_cache: Dict[Tuple, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def layer_psd(samples: np.ndarray, sample_rate: int, path: Optional[str] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Welch PSD of a layer's mono downmix, cached per source file.
+
+    Args:
+        samples: Layer samples of shape (frames, channels), or a stream source
+            such as noise_generator.NoiseGenerator (an excerpt is analyzed)
+        sample_rate: Sample rate of samples
+        path: Source file the samples were decoded from, or the noise spec (enables caching)
+
+    Returns:
+        Tuple of (frequencies, psd)
+    """
+    stream = hasattr(samples, "excerpt")
+    key = (path if stream else source_key(path), sample_rate) if path else None
+    if key in _psd_cache:
+        return _psd_cache[key]
+    if stream:
+        samples = samples.excerpt(STREAM_EXCERPT_S * sample_rate)
+    analyzer = SignalAnalyzer()
+    analyzer.load_samples(samples.mean(axis=1), sample_rate)
+    result = analyzer.compute_psd()
+    if key is not None:
+        _psd_cache[key] = result
+    return result
+
+
+def _band_index(frequencies: np.ndarray, band_edges: Sequence[float]) -> np.ndarray:
+    """Band number of each frequency bin, -1 outside the balanced range"""
+    index = np.searchsorted(band_edges, frequencies, side="right") - 1
+    index[(frequencies < band_edges[0]) | (frequencies >= band_edges[-1])] = -1
+    return index
+
+
+def psd_flatness(psd: np.ndarray) -> float:
+    """Spectral flatness (geometric / arithmetic mean) of a PSD"""
+    psd = psd + 1e-20
+    return float(np.exp(np.mean(np.log(psd))) / np.mean(psd))
+
+
+def solve_balance(psds: Sequence[np.ndarray],
+                  frequencies: np.ndarray,
+                  gains_db: Sequence[float],
+                  band_edges: Sequence[float] = BAND_EDGES,
+                  max_eq_db: float = MAX_EQ_DB,
+                  regularization: float = REGULARIZATION) -> Dict:
+    """Solve for per-layer gain and band EQ that flatten the mix PSD.
+
+    Args:
+        psds: Source PSD of each layer (same frequency grid)
+        frequencies: Frequency grid of the PSDs
+        gains_db: Current gain of each layer (the manual balance)
+        band_edges: EQ band edges in Hz
+        max_eq_db: Bound on every layer/band gain change
+        regularization: Weight of the pull towards the current balance
+
+    Returns:
+        Dictionary with per-layer "gain_db" offsets, "eq_db" (layers x bands)
+        and the predicted PSD flatness before and after
+    """
+    band = _band_index(frequencies, band_edges)
+    in_range = band >= 0
+    num_layers, num_bands = len(psds), len(band_edges) - 1
+
+    # Column (layer, band) = that layer's PSD restricted to the band at its current gain
+    layer_psds = np.array([db_to_gain(2 * g) * p[in_range] for p, g in zip(psds, gains_db)])
+    masks = np.array([band[in_range] == b for b in range(num_bands)], dtype=float)
+    A = (layer_psds[:, np.newaxis, :] * masks[np.newaxis, :, :]).reshape(num_layers * num_bands, -1).T
+
+    mix_psd = layer_psds.sum(axis=0)
+    target = np.full(A.shape[0], mix_psd.mean())
+
+    # Scale to unit target and append the regularization rows (w ~ 1)
+    A_scaled = np.vstack([A / target[0], np.sqrt(regularization) * np.eye(A.shape[1])])
+    t_scaled = np.concatenate([np.ones(A.shape[0]), np.sqrt(regularization) * np.ones(A.shape[1])])
+    limit = 10 ** (max_eq_db / 10)  # power ratio
+    solution = lsq_linear(A_scaled, t_scaled, bounds=(1 / limit, limit))
+    w = solution.x.reshape(num_layers, num_bands)
+
+    # Split power weights into a broadband gain and a relative EQ per layer
+    band_power = layer_psds @ masks.T + 1e-20
+    layer_gain = (w * band_power).sum(axis=1) / band_power.sum(axis=1)
+    eq = w / layer_gain[:, np.newaxis]
+
+    return {
+        "gain_db": (10 * np.log10(layer_gain)).tolist(),
+        "eq_db": (10 * np.log10(eq)).tolist(),
+        "band_edges": list(band_edges),
+        "flatness_before": psd_flatness(mix_psd),
+        "flatness_after": psd_flatness(A @ w.reshape(-1))
+    }
+
+
+def design_eq(eq_db: Sequence[float],
+              sample_rate: int,
+              band_edges: Sequence[float] = BAND_EDGES,
+              numtaps: int = EQ_TAPS) -> Optional[np.ndarray]:
+    """Design a linear-phase FIR for a band EQ, None if the EQ is flat.
+
+    Band gains are placed at the geometric band centers and interpolated
+    on a log-frequency axis so the response has no steps at the edges.
+    """
+    eq_db = np.asarray(eq_db, dtype=float)
+    if np.allclose(eq_db, 0.0, atol=0.05):
+        return None
+    nyquist = sample_rate / 2
+    edges = np.asarray(band_edges, dtype=float)
+    centers = np.sqrt(edges[:-1] * edges[1:])
+    freqs = np.geomspace(10.0, nyquist, 256)
+    response = 10 ** (np.interp(np.log(freqs), np.log(centers), eq_db) / 20)
+    freqs = np.concatenate([[0.0], freqs[:-1], [nyquist]])
+    response = np.concatenate([[response[0]], response[:-1], [response[-1]]])
+    return signal.firwin2(numtaps, freqs, response, fs=sample_rate).astype(np.float32)
+
+
+def apply_eq(samples: np.ndarray, fir: Optional[np.ndarray]) -> np.ndarray:
+    """Filter samples of shape (frames, channels) with an EQ FIR (overlap-add FFT convolution)"""
+    if fir is None:
+        return samples
+    filtered = signal.oaconvolve(samples, fir[:, np.newaxis], mode="same", axes=0)
+    return filtered.astype(np.float32, copy=False)
+
+
+def balance_layers(layers: List[Tuple[np.ndarray, float, int]],
+                   sample_rate: int,
+                   paths: Sequence[Optional[str]] = ()) -> Tuple[List[Tuple[np.ndarray, float, int]], Dict]:
+    """Auto-balance a gain_staging layer plan for maximum mix flatness.
+
+    Args:
+        layers: (samples, gain_db, fade_frames) per layer
+        sample_rate: Sample rate of the layers
+        paths: Source file of each layer, used to cache the PSDs
+
+    Returns:
+        (balanced layer plan, solution from solve_balance)
+    """
+    paths = list(paths) + [None] * (len(layers) - len(paths))
+    spectra = [layer_psd(samples, sample_rate, path) for (samples, _, _), path in zip(layers, paths)]
+    frequencies = spectra[0][0]
+    solution = solve_balance([psd for _, psd in spectra], frequencies, [g for _, g, _ in layers])
+
+    balanced = []
+    for (samples, gain_db, fade_frames), delta_db, eq_db in zip(
+            layers, solution["gain_db"], solution["eq_db"]):
+        fir = design_eq(eq_db, sample_rate)
+        samples = samples.with_fir(fir) if hasattr(samples, "with_fir") else apply_eq(samples, fir)
+        balanced.append((samples, gain_db + delta_db, fade_frames))
+    return balanced, solution
+
+
+def print_balance_report(solution: Dict, names: Sequence[str]):
+    """Print the solved gains and EQ per layer"""
+    edges = solution["band_edges"]
+    bands = ", ".join(f"{lo}-{hi}Hz" for lo, hi in zip(edges[:-1], edges[1:]))
+    print(f"Auto-balance (EQ bands: {bands})")
+    for name, gain_db, eq_db in zip(names, solution["gain_db"], solution["eq_db"]):
+        eq = " ".join(f"{g:+.1f}" for g in eq_db)
+        print(f"  {name}: gain {gain_db:+.1f} dB, EQ [{eq}] dB")
+    print(f"  PSD flatness: {solution['flatness_before']:.4f} -> {solution['flatness_after']:.4f}")
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy import signal
+
+# Sidechain ducking
+# Turns the background layers (rain, fire, bird calls) down while the
+# foreground layer (narration or music in the forest slot) is active. The
+# foreground level is measured per ENVELOPE_MS block, mapped to a gain
+# reduction and smoothed at block rate with two one-pole filters (fast attack,
+# slow release; the larger reduction wins). The per-block gains are linearly
+# interpolated to samples and applied to the background in one multiply.
+# Gains only depend on completed blocks, so the in-memory and streaming paths
+# produce the same output however the audio is cut into blocks.
+
+ENVELOPE_MS = 10       # Envelope resolution
+THRESHOLD_DB = -40.0   # Foreground RMS (dBFS) where ducking starts
+KNEE_DB = 10.0         # Ducking reaches DEPTH_DB this far above the threshold
+DEPTH_DB = 8.0         # Maximum background reduction
+ATTACK_MS = 50.0
+RELEASE_MS = 600.0
+
+
+def _one_pole(time_ms: float):
+    """lfilter coefficients of a one-pole smoother with time_ms at block rate"""
+    a = np.exp(-ENVELOPE_MS / time_ms)
+    return [1 - a], [1, -a]
+
+
+class Ducker:
+    def __init__(self,
+                 frame_rate: int,
+                 threshold_db: float = THRESHOLD_DB,
+                 depth_db: float = DEPTH_DB,
+                 attack_ms: float = ATTACK_MS,
+                 release_ms: float = RELEASE_MS):
+        """Stateful ducker; feed consecutive chunks of foreground and background to process().
+
+        Args:
+            frame_rate: Sample rate of both signals
+            threshold_db: Foreground RMS level in dBFS where ducking starts
+            depth_db: Maximum gain reduction of the background
+            attack_ms, release_ms: Smoothing of rising / falling reduction
+        """
+        self.block = max(1, frame_rate * ENVELOPE_MS // 1000)
+        self.threshold_db = threshold_db
+        self.depth_db = depth_db
+        self.attack = _one_pole(attack_ms)
+        self.release = _one_pole(release_ms)
+        self.position = 0                      # Frames processed
+        self.completed = 0                     # Envelope blocks completed
+        self.power_carry = np.zeros(0)         # Foreground power of the incomplete block
+        self.attack_state = np.zeros(1)
+        self.release_state = np.zeros(1)
+        self.last_gains = np.zeros(2)          # dB gains of the last two completed blocks
+
+    def block_gains_db(self, block_power: np.ndarray) -> np.ndarray:
+        """Smoothed background gain in dB for consecutive blocks of foreground power"""
+        if len(block_power) == 0:
+            return np.zeros(0)  # lfilter on empty input does not return the state
+        level_db = 10 * np.log10(block_power + 1e-12)
+        reduction = self.depth_db * np.clip((level_db - self.threshold_db) / KNEE_DB, 0.0, 1.0)
+        fast, self.attack_state = signal.lfilter(*self.attack, reduction, zi=self.attack_state)
+        slow, self.release_state = signal.lfilter(*self.release, reduction, zi=self.release_state)
+        return -np.maximum(fast, slow)
+
+    def gain(self, foreground: np.ndarray) -> np.ndarray:
+        """Per-frame linear background gain for the next chunk of foreground frames.
+
+        Frames of envelope block k ramp from the gain of block k - 2 to that
+        of block k - 1, so every frame's gain is known when it arrives.
+        """
+        frames = len(foreground)
+        power = np.square(foreground, dtype=np.float64)
+        if power.ndim > 1:
+            power = power.mean(axis=1)
+        power = np.concatenate([self.power_carry, power])
+        count = len(power) // self.block
+        gains_db = self.block_gains_db(power[:count * self.block].reshape(count, self.block).mean(axis=1))
+        self.power_carry = power[count * self.block:]
+
+        # known[i] is the gain of block completed - 2 + i
+        known = np.concatenate([self.last_gains, gains_db])
+        index = np.arange(self.position, self.position + frames)
+        block = index // self.block - self.completed
+        fraction = (index % self.block) / self.block
+        curve_db = known[block] + fraction * (known[block + 1] - known[block])
+
+        self.last_gains = known[-2:]
+        self.completed += count
+        self.position += frames
+        return np.power(10, curve_db / 20).astype(np.float32)
+
+    def process(self, foreground: np.ndarray, background: np.ndarray) -> np.ndarray:
+        """Duck background (frames, channels) in place by the envelope of foreground and return it"""
+        background *= self.gain(foreground)[:, np.newaxis]
+        return background
+
@@ -0,0 +1,227 @@
+import os
+import queue
+import subprocess
+import threading
+import time
+import numpy as np
+from pydub import AudioSegment
+from typing import Dict, Iterable, List, Sequence
+
+# Export stage
+# PCM is converted once and piped into one ffmpeg encoder process per target
+# format. Every encoder runs concurrently and is fed by its own writer thread,
+# so a render can keep producing blocks while the encoders consume them.
+
+# format name -> (ffmpeg codec, file extension, default bitrate or None for lossless)
+FORMATS = {
+    "mp3": ("libmp3lame", "mp3", "320k"),
+    "opus": ("libopus", "ogg", "160k"),
+    "ogg": ("libvorbis", "ogg", "192k"),
+    "flac": ("flac", "flac", None),
+    "wav": ("pcm_s16le", "wav", None),
+}
+
+DEFAULT_TARGETS = ("mp3:320k",)
+
+QUEUE_BLOCKS = 32  # blocks buffered per encoder before write() blocks
+
+
+def parse_target(spec: str) -> Dict:
+    """Parse a "format[:bitrate]" spec such as "mp3:320k", "opus:128k" or "flac"."""
+    name, _, bitrate = spec.partition(":")
+    name = name.strip().lower()
+    if name not in FORMATS:
+        raise ValueError(f"Unsupported export format: {name} (choose from {', '.join(FORMATS)})")
+    codec, extension, default_bitrate = FORMATS[name]
+    return {
+        "format": name,
+        "codec": codec,
+        "extension": extension,
+        "bitrate": bitrate or default_bitrate
+    }
+
+
+def parse_targets(specs) -> List[Dict]:
+    """Parse a comma separated string or sequence of target specs."""
+    if isinstance(specs, str):
+        specs = [s for s in specs.split(",") if s.strip()]
+    return [parse_target(s) for s in specs]
+
+
+def _target_path(output_base: str, target: Dict, targets: Sequence[Dict]) -> str:
+    # Two targets sharing an extension (opus/ogg) get the format name as suffix
+    shared = sum(1 for t in targets if t["extension"] == target["extension"]) > 1
+    suffix = f".{target['format']}" if shared else ""
+    return f"{output_base}{suffix}.{target['extension']}"
+
+
+class _Encoder:
+    """One ffmpeg process fed from a bounded queue by a writer thread."""
+
+    def __init__(self, target: Dict, path: str, frame_rate: int, channels: int):
+        self.target = target
+        self.path = path
+        self.queue = queue.Queue(maxsize=QUEUE_BLOCKS)
+        self.error = None
+        self.encode_time = None
+        self.start_time = None  # First write; encode_time runs from here to the encoder's exit
+
+        command = [
+            AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "s16le", "-ar", str(frame_rate), "-ac", str(channels), "-i", "pipe:0",
+            "-c:a", target["codec"]
+        ]
+        if target["bitrate"]:
+            command += ["-b:a", target["bitrate"]]
+        command.append(path)
+
+        self.process = subprocess.Popen(
+            command, stdin=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                if self.start_time is None:
+                    self.start_time = time.perf_counter()
+                if self.error is None:
+                    self.process.stdin.write(data)
+        except (BrokenPipeError, OSError) as e:
+            self.error = str(e)
+            # Keep draining so the producer never blocks on a dead encoder
+            while self.queue.get() is not None:
+                pass
+        finally:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            stderr = self.process.stderr.read().decode(errors="replace")
+            returncode = self.process.wait()
+            end_time = time.perf_counter()
+            self.encode_time = end_time - (self.start_time or end_time)
+            if returncode != 0 and self.error is None:
+                self.error = stderr.strip() or f"ffmpeg exited with code {returncode}"
+
+
+class MultiFormatExporter:
+    def __init__(self,
+                 output_base: str,
+                 frame_rate: int,
+                 channels: int,
+                 targets=DEFAULT_TARGETS):
+        """Start one encoder per target format.
+
+        Args:
+            output_base: Output path without extension
+            frame_rate: Sample rate of the PCM that will be written
+            channels: Channel count of the PCM that will be written
+            targets: Comma separated string or sequence of "format[:bitrate]" specs
+        """
+        self.targets = parse_targets(targets)
+        self.frame_rate = frame_rate
+        self.channels = channels
+        self.frames_written = 0
+        self.results = None
+
+        directory = os.path.dirname(output_base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.encoders = [
+            _Encoder(t, _target_path(output_base, t, self.targets), frame_rate, channels)
+            for t in self.targets
+        ]
+
+    @property
+    def paths(self) -> Dict[str, str]:
+        """Output path per format"""
+        return {e.target["format"]: e.path for e in self.encoders}
+
+    def write(self, block):
+        """Queue a block for every encoder.
+
+        Args:
+            block: Float array of shape (frames, channels) in [-1, 1],
+                or raw 16-bit little endian PCM bytes
+        """
+        if isinstance(block, np.ndarray):
+            if block.ndim == 1:
+                block = block[:, np.newaxis]
+            self.frames_written += len(block)
+            block = np.clip(block * 32768.0, -32768, 32767).astype("<i2").tobytes()
+        else:
+            self.frames_written += len(block) // (2 * self.channels)
+        for encoder in self.encoders:
+            encoder.queue.put(block)
+
+    def close(self) -> Dict[str, Dict]:
+        """Flush all encoders and wait for them to finish.
+
+        Returns:
+            Dictionary mapping format to path, encode time and error (if any)
+        """
+        if self.results is not None:
+            return self.results
+        for encoder in self.encoders:
+            encoder.queue.put(None)
+        self.results = {}
+        for encoder in self.encoders:
+            encoder.thread.join()
+            self.results[encoder.target["format"]] = {
+                "path": encoder.path,
+                "bitrate": encoder.target["bitrate"],
+                "encode_time": encoder.encode_time,
+                "error": encoder.error
+            }
+        return self.results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def export_blocks(blocks: Iterable,
+                  output_base: str,
+                  frame_rate: int,
+                  channels: int,
+                  targets=DEFAULT_TARGETS) -> Dict[str, Dict]:
+    """Encode a stream of float blocks into all target formats concurrently.
+
+    Encoding starts with the first block, so a generator that is still
+    rendering overlaps with the encoders.
+    """
+    exporter = MultiFormatExporter(output_base, frame_rate, channels, targets)
+    try:
+        for block in blocks:
+            exporter.write(block)
+    finally:
+        results = exporter.close()
+    return results
+
+
+def export_segment(segment: AudioSegment,
+                   output_base: str,
+                   targets=DEFAULT_TARGETS,
+                   block_ms: int = 10000) -> Dict[str, Dict]:
+    """Encode an AudioSegment into all target formats concurrently."""
+    segment = segment.set_sample_width(2)
+    data = segment.raw_data
+    block_bytes = segment.frame_width * (segment.frame_rate * block_ms // 1000)
+    blocks = (data[i:i + block_bytes] for i in range(0, len(data), block_bytes))
+    return export_blocks(blocks, output_base, segment.frame_rate, segment.channels, targets)
+
+
+def print_export_report(results: Dict[str, Dict]):
+    """Print per-format output path and encode time"""
+    for name, result in results.items():
+        if result["error"]:
+            print(f"  {name}: FAILED ({result['error']})")
+        else:
+            print(f"  {name}: {result['path']} ({result['encode_time']:.2f}s)")
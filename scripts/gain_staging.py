@@ -0,0 +1,269 @@
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from math import gcd
+from pydub import AudioSegment
+from scipy import signal
+from typing import Dict, Iterable, Optional, Tuple
+
+# Gain staging for the mixer
+# Every gain stage of a layer (normalize, RMS match, balance offset) is folded
+# into a single scalar that is applied while the layer is summed into the mix,
+# so each source is scanned once for its levels and copied at most once.
+
+NORMALIZE_HEADROOM = 0.1  # dB, same default as pydub.effects.normalize
+STREAM_BLOCK_FRAMES = 65536  # Frames read at a time from stream sources
+
+_SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+# Level cache: (abspath, mtime_ns, size) -> {"rms_dbfs": ..., "peak_dbfs": ...}
+_level_cache: Dict[Tuple[str, int, int], Dict[str, float]] = {}
+
+# Decoded source cache, disabled unless a long-running process enables it
+_segment_cache: "OrderedDict[Tuple[str, int, int], AudioSegment]" = OrderedDict()
+_segment_cache_size = 0
+_segment_cache_lock = threading.Lock()
+
+
+def source_key(path: str) -> Tuple[str, int, int]:
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def enable_segment_cache(max_items: int = 16):
+    """Keep up to max_items decoded sources in memory for load_segment (0 disables)"""
+    global _segment_cache_size
+    with _segment_cache_lock:
+        _segment_cache_size = max_items
+        while len(_segment_cache) > max_items:
+            _segment_cache.popitem(last=False)
+
+
+def load_segment(path: str) -> AudioSegment:
+    """Decode an audio file, reusing the decoded copy if the segment cache is enabled"""
+    if _segment_cache_size <= 0:
+        return AudioSegment.from_file(path)
+    key = source_key(path)
+    with _segment_cache_lock:
+        segment = _segment_cache.get(key)
+        if segment is not None:
+            _segment_cache.move_to_end(key)
+            return segment
+    segment = AudioSegment.from_file(path)
+    with _segment_cache_lock:
+        _segment_cache[key] = segment
+        while len(_segment_cache) > _segment_cache_size:
+            _segment_cache.popitem(last=False)
+    return segment
+
+
+def db_to_gain(db: float) -> float:
+    """Convert a gain in dB to a linear amplitude factor"""
+    return float(10 ** (db / 20.0))
+
+
+def segment_to_array(segment: AudioSegment) -> np.ndarray:
+    """Convert an AudioSegment to a float32 array of shape (frames, channels) in [-1, 1]"""
+    samples = np.array(segment.get_array_of_samples(), dtype=np.float32)
+    samples /= float(1 << (8 * segment.sample_width - 1))
+    return samples.reshape(-1, segment.channels)
+
+
+def resample(samples: np.ndarray, frame_rate: int, target_rate: int) -> np.ndarray:
+    """Polyphase resampling of float samples of shape (frames, channels)"""
+    if frame_rate == target_rate:
+        return samples
+    g = gcd(frame_rate, target_rate)
+    samples = signal.resample_poly(samples, target_rate // g, frame_rate // g, axis=0)
+    return samples.astype(np.float32, copy=False)
+
+
+def match_channels(samples: np.ndarray, channels: int) -> np.ndarray:
+    """Broadcast mono, or down-mix and broadcast, samples to channels"""
+    if samples.shape[1] == channels:
+        return samples
+    if samples.shape[1] == 1:
+        return np.repeat(samples, channels, axis=1)
+    return samples.mean(axis=1, keepdims=True).repeat(channels, axis=1)
+
+
+def array_to_segment(samples: np.ndarray, frame_rate: int, sample_width: int = 2) -> AudioSegment:
+    """Convert a float array of shape (frames, channels) back to an AudioSegment"""
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    scale = float(1 << (8 * sample_width - 1))
+    pcm = np.clip(samples * scale, -scale, scale - 1).astype(_SAMPLE_DTYPES[sample_width])
+    return AudioSegment(
+        pcm.tobytes(),
+        frame_rate=frame_rate,
+        sample_width=sample_width,
+        channels=samples.shape[1]
+    )
+
+
+def measure_levels(samples: np.ndarray) -> Dict[str, float]:
+    """Measure RMS and peak level of float samples in dBFS (pydub's dBFS/max_dBFS)"""
+    if samples.size == 0:
+        return {"rms_dbfs": -float("inf"), "peak_dbfs": -float("inf")}
+    flat = samples.reshape(-1)
+    rms = float(np.sqrt(np.dot(flat, flat) / flat.size))
+    peak = float(max(flat.max(), -flat.min()))
+    return {
+        "rms_dbfs": 20 * np.log10(rms) if rms > 0 else -float("inf"),
+        "peak_dbfs": 20 * np.log10(peak) if peak > 0 else -float("inf")
+    }
+
+
+def source_levels(path: str, samples=None) -> Dict[str, float]:
+    """Return cached RMS/peak levels of a source file, measuring them on first use.
+
+    Args:
+        path: Path to the source file (used as cache key together with mtime/size)
+        samples: Decoded samples of the file (array or AudioSegment);
+            decoded from path if not given
+
+    Returns:
+        Dictionary with "rms_dbfs" and "peak_dbfs"
+    """
+    key = source_key(path)
+    levels = _level_cache.get(key)
+    if levels is None:
+        if samples is None:
+            samples = load_segment(path)
+        if isinstance(samples, AudioSegment):
+            samples = segment_to_array(samples)
+        levels = measure_levels(samples)
+        _level_cache[key] = levels
+    return levels
+
+
+def plan_gain_db(levels: Dict[str, float], target_level: float, offset_db: float = 0.0) -> float:
+    """Fold a layer's gain stages into one gain in dB.
+
+    A peak normalization before the RMS match cancels out, so only the RMS
+    match and the balance offset remain.
+
+    Args:
+        levels: Source levels from source_levels()/measure_levels()
+        target_level: RMS level in dBFS the layer is matched to
+        offset_db: Balance offset added after the RMS match
+
+    Returns:
+        Total gain in dB (0 for silent sources)
+    """
+    if not np.isfinite(levels["rms_dbfs"]):
+        return 0.0
+    return target_level - levels["rms_dbfs"] + offset_db
+
+
+def add_looped(mix: np.ndarray,
+               source: np.ndarray,
+               gain: float,
+               start: int = 0,
+               stop: Optional[int] = None,
+               envelope: Optional[np.ndarray] = None,
+               phase: int = 0):
+    """Add a looped, scaled source into mix[start:stop] in place.
+
+    The source is read as if it were tiled from frame -phase of the mix, so
+    the looping never materializes a full-length copy of the layer. Unbounded
+    stream sources (anything with read(start, stop), e.g.
+    noise_generator.NoiseGenerator) are read without looping.
+
+    Args:
+        mix: Accumulator of shape (frames, channels)
+        source: Layer samples of shape (frames, channels or 1), or a stream source
+        gain: Linear gain applied during the sum
+        start, stop: Frame range of mix to write
+        envelope: Optional per-frame gain of length stop - start (fades)
+        phase: Timeline position of mix[0], for rendering a window of a longer mix
+    """
+    if stop is None:
+        stop = len(mix)
+    if hasattr(source, "read"):
+        for position in range(start, stop, STREAM_BLOCK_FRAMES):
+            end = min(position + STREAM_BLOCK_FRAMES, stop)
+            chunk = source.read(position + phase, end + phase) * gain
+            if envelope is not None:
+                chunk *= envelope[position - start:end - start, np.newaxis]
+            mix[position:end] += chunk
+        return
+    period = len(source)
+    if period == 0:
+        return
+    position = start
+    while position < stop:
+        offset = (position + phase) % period
+        count = min(period - offset, stop - position)
+        chunk = source[offset:offset + count] * gain
+        if envelope is not None:
+            chunk *= envelope[position - start:position - start + count, np.newaxis]
+        mix[position:position + count] += chunk
+        position += count
+
+
+def mix_layers(layers: Iterable[Tuple[np.ndarray, float, int]],
+               num_frames: int,
+               channels: int,
+               start: int = 0,
+               stop: Optional[int] = None) -> np.ndarray:
+    """Sum looped layers into a new mix buffer, applying gains and fades in the same pass.
+
+    Args:
+        layers: Iterable of (samples, gain_db, fade_frames); fade_frames > 0 adds
+            a linear fade in/out of that length to the layer
+        num_frames: Length of the whole mix in frames
+        channels: Number of output channels
+        start, stop: Window of the mix to render (default: all of it)
+
+    Returns:
+        Mix buffer of shape (stop - start, channels)
+    """
+    if stop is None:
+        stop = num_frames
+    mix = np.zeros((stop - start, channels), dtype=np.float32)
+    for samples, gain_db, fade_frames in layers:
+        gain = db_to_gain(gain_db)
+        fade_frames = min(int(fade_frames), num_frames // 2)
+        if fade_frames <= 0:
+            add_looped(mix, samples, gain, phase=start)
+            continue
+        ramp = np.linspace(0.0, 1.0, fade_frames, dtype=np.float32)
+        regions = [
+            (0, fade_frames, ramp),
+            (fade_frames, num_frames - fade_frames, None),
+            (num_frames - fade_frames, num_frames, ramp[::-1]),
+        ]
+        for region_start, region_stop, envelope in regions:
+            a, b = max(region_start, start), min(region_stop, stop)
+            if a >= b:
+                continue
+            if envelope is not None:
+                envelope = envelope[a - region_start:b - region_start]
+            add_looped(mix, samples, gain, a - start, b - start, envelope, phase=start)
+    return mix
+
+
+def peak_bound(layers: Iterable[Tuple[float, float]]) -> float:
+    """Upper bound of the mix peak from (peak_dbfs, gain_db) of each layer.
+
+    Used to normalize a mix that is rendered block by block, where the true
+    peak is not known until the last block.
+    """
+    return sum(db_to_gain(peak_db + gain_db) for peak_db, gain_db in layers
+               if np.isfinite(peak_db))
+
+
+def peak_normalize_gain(mix: np.ndarray, headroom: float = NORMALIZE_HEADROOM) -> float:
+    """Linear gain that puts the peak of mix at -headroom dBFS (1.0 for silence)"""
+    if mix.size == 0:
+        return 1.0
+    peak = float(max(mix.max(), -mix.min()))
+    return db_to_gain(-headroom) / peak if peak > 0 else 1.0
+
+
+def normalize_peak(mix: np.ndarray, headroom: float = NORMALIZE_HEADROOM) -> np.ndarray:
+    """Scale mix in place so its peak sits at -headroom dBFS (fused peak scan + scale)"""
+    mix *= peak_normalize_gain(mix, headroom)
+    return mix
@@ -0,0 +1,327 @@
+import json
+import os
+import shutil
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Dict, List, Optional
+from results_store import atomic_write_json, publish_directory, relocate_json_paths
+from render_cache import DEFAULT_CACHE_MB, DEFAULT_SEGMENTS, enable_render_caches
+
+# Shared-filesystem job queue
+# A queue is a directory (on storage every node mounts) with one JSON file per
+# job in pending/, leases/, done/ or failed/. A worker claims a job by renaming
+# it from pending/ into leases/ - rename is atomic, so exactly one worker wins.
+# While it renders, the worker touches the lease file as a heartbeat; leases
+# whose heartbeat is older than the lease time are moved back to pending/ by
+# any worker (or to failed/ after MAX_ATTEMPTS). A lease is only rewritten,
+# moved or kept alive by the worker that claimed it (same worker id and claim
+# time), so a stalled worker cannot touch a lease that was reaped and claimed
+# again meanwhile. Each job renders into a
+# staging directory under the results directory and is moved into place in
+# one rename, so results/ never holds a half-written mix.
+
+STATES = ("pending", "leases", "done", "failed")
+LEASE_S = 120         # A lease expires this long after the last heartbeat
+POLL_S = 5            # Idle workers look for new jobs this often
+MAX_ATTEMPTS = 3
+STAGING_DIR = ".staging"
+
+
+def _path(queue_dir: str, state: str, job_id: str) -> str:
+    return os.path.join(queue_dir, state, f"{job_id}.json")
+
+
+def _read(path: str) -> Dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _same_lease(a: Dict, b: Dict) -> bool:
+    return a.get("worker") == b.get("worker") and a.get("claimed") == b.get("claimed")
+
+
+def _move(queue_dir: str, job: Dict, source: str, target: str) -> bool:
+    """Rewrite a job file and move it between states.
+
+    Returns:
+        False if someone else moved it first, or if the file now holds
+        another lease of the job than job (reaped and claimed again)
+    """
+    # Take the file out of sight first, so only one process can rewrite and move it
+    path = _path(queue_dir, source, job["id"])
+    owned = os.path.join(queue_dir, source, f".{job['id']}.{uuid.uuid4().hex[:8]}.moving")
+    try:
+        os.rename(path, owned)
+    except FileNotFoundError:
+        return False
+    if not _same_lease(_read(owned), job):
+        os.rename(owned, path)
+        return False
+    atomic_write_json(owned, job)
+    os.rename(owned, _path(queue_dir, target, job["id"]))
+    return True
+
+
+def _recover_moving(queue_dir: str, state: str, lease_s: float) -> List[str]:
+    """Put job files back whose _move was interrupted (older than lease_s)"""
+    directory = os.path.join(queue_dir, state)
+    recovered = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not (name.startswith(".") and name.endswith(".moving")):
+            continue
+        job_id = name[1:-len(".moving")].rsplit(".", 1)[0]
+        moving, path = os.path.join(directory, name), _path(queue_dir, state, job_id)
+        try:
+            if _heartbeat_age(moving) < lease_s or os.path.exists(path):
+                continue
+            os.rename(moving, path)
+        except FileNotFoundError:
+            continue  # Finished or recovered by someone else
+        recovered.append(job_id)
+    return recovered
+
+
+def _heartbeat_age(path: str) -> float:
+    # rename and utime both update ctime, so a fresh claim is never mistaken for an expired one
+    stat = os.stat(path)
+    return time.time() - max(stat.st_mtime, stat.st_ctime)
+
+
+def list_jobs(queue_dir: str, state: str) -> List[str]:
+    """Job ids in a state, oldest first (temp files from atomic writes are skipped)"""
+    directory = os.path.join(queue_dir, state)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(f[:-5] for f in os.listdir(directory) if f.endswith(".json") and not f.startswith("."))
+
+
+def init_queue(queue_dir: str):
+    """Create the state directories of a queue"""
+    for state in STATES:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+
+def submit(queue_dir: str, kwargs: Dict, max_attempts: int = MAX_ATTEMPTS) -> str:
+    """Queue an analyze_mix_with_components job.
+
+    Args:
+        queue_dir: Queue directory
+        kwargs: analyze_mix_with_components arguments (JSON-serializable,
+            output_name is required so every attempt writes the same result)
+        max_attempts: Attempts before the job is moved to failed/
+
+    Returns:
+        The job id
+    """
+    init_queue(queue_dir)
+    job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    job = {
+        "id": job_id,
+        "kwargs": kwargs,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "submitted": time.time(),
+        "errors": []
+    }
+    atomic_write_json(_path(queue_dir, "pending", job_id), job)
+    return job_id
+
+
+def claim(queue_dir: str, worker_id: str) -> Optional[Dict]:
+    """Lease the oldest pending job, None if there is none"""
+    for job_id in list_jobs(queue_dir, "pending"):
+        lease_path = _path(queue_dir, "leases", job_id)
+        try:
+            os.rename(_path(queue_dir, "pending", job_id), lease_path)
+        except FileNotFoundError:
+            continue  # Another worker was faster
+        job = _read(lease_path)
+        job["attempts"] += 1
+        job["worker"] = worker_id
+        job["claimed"] = time.time()
+        atomic_write_json(lease_path, job)
+        return job
+    return None
+
+
+def reap_expired(queue_dir: str, lease_s: float = LEASE_S) -> List[str]:
+    """Return expired leases to pending/ (or failed/ after max_attempts).
+
+    Lease files left hidden by a _move that crashed halfway are restored
+    first and expire like any other lease.
+
+    Returns:
+        Ids of the reaped jobs
+    """
+    _recover_moving(queue_dir, "leases", lease_s)
+    reaped = []
+    for job_id in list_jobs(queue_dir, "leases"):
+        path = _path(queue_dir, "leases", job_id)
+        try:
+            if _heartbeat_age(path) < lease_s:
+                continue
+            job = _read(path)
+        except FileNotFoundError:
+            continue
+        job["errors"].append(f"lease of {job.get('worker')} expired")
+        target = "failed" if job["attempts"] >= job["max_attempts"] else "pending"
+        if _move(queue_dir, job, "leases", target):
+            reaped.append(job_id)
+    return reaped
+
+
+class _Heartbeat(threading.Thread):
+    def __init__(self, path: str, interval: float, job: Dict):
+        """Touch the lease of job at path every interval seconds until stopped or the lease is gone"""
+        super().__init__(daemon=True)
+        self.path = path
+        self.interval = interval
+        self.job = job
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                if not _same_lease(_read(self.path), self.job):
+                    return  # Reaped and claimed by another worker
+                os.utime(self.path)
+            except (FileNotFoundError, ValueError):
+                return  # Lease expired and was reaped (or is being moved)
+
+
+def run_job(job: Dict, results_dir: str = "results", worker_id: str = "") -> str:
+    """Render and analyze one job into a staging directory, then publish it.
+
+    Returns:
+        The published result directory
+    """
+    from analyze_mix import analyze_mix_with_components
+    from mix_graph import default_renderer
+
+    kwargs = job["kwargs"]
+    staging = os.path.join(results_dir, STAGING_DIR, f"{job['id']}-{worker_id}")
+    shutil.rmtree(staging, ignore_errors=True)
+    try:
+        # Memoized graph nodes carry over to the next job (bounded in run_worker)
+        analyze_mix_with_components(**kwargs, results_dir=staging, renderer=default_renderer)
+        output_dir = os.path.join(results_dir, kwargs["output_name"])
+        # Paths in the metadata must point at the published files, not at staging
+        relocate_json_paths(os.path.join(staging, kwargs["output_name"]),
+                            os.path.join(staging, ""), os.path.join(results_dir, ""))
+        publish_directory(os.path.join(staging, kwargs["output_name"]), output_dir)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return output_dir
+
+
+def run_worker(queue_dir: str,
+               results_dir: str = "results",
+               worker_id: Optional[str] = None,
+               lease_s: float = LEASE_S,
+               poll_s: float = POLL_S,
+               exit_when_empty: bool = False,
+               cache_mb: int = DEFAULT_CACHE_MB,
+               segments: int = DEFAULT_SEGMENTS) -> Dict[str, int]:
+    """Process jobs from the queue until interrupted (or until it is empty).
+
+    Args:
+        queue_dir: Queue directory
+        results_dir: Where finished results are published
+        worker_id: Name recorded in leases (default: host-pid)
+        lease_s: Lease expiry; heartbeats are sent every lease_s / 4
+        poll_s: Sleep between polls of an empty queue
+        exit_when_empty: Return once no job is pending or leased
+        cache_mb: Memory limit of the mix graph node cache (as mix_worker)
+        segments: Number of decoded sources kept in memory
+
+    Returns:
+        Counts of done, retried and failed jobs
+    """
+    enable_render_caches(cache_mb, segments)
+
+    init_queue(queue_dir)
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    counts = {"done": 0, "retried": 0, "failed": 0}
+
+    while True:
+        for job_id in reap_expired(queue_dir, lease_s):
+            print(f"[{worker_id}] Reaped expired lease {job_id}")
+        job = claim(queue_dir, worker_id)
+        if job is None:
+            if exit_when_empty and not list_jobs(queue_dir, "pending") and not list_jobs(queue_dir, "leases"):
+                return counts
+            time.sleep(poll_s)
+            continue
+
+        print(f"[{worker_id}] Job {job['id']} attempt {job['attempts']}: {job['kwargs']['output_name']}")
+        lease_path = _path(queue_dir, "leases", job["id"])
+        heartbeat = _Heartbeat(lease_path, lease_s / 4, job)
+        heartbeat.start()
+        start = time.perf_counter()
+        try:
+            job["output_dir"] = run_job(job, results_dir, worker_id)
+            job["elapsed"] = time.perf_counter() - start
+            target = "done"
+        except Exception as e:
+            traceback.print_exc()
+            job["errors"].append(f"{worker_id}: {type(e).__name__}: {e}")
+            target = "failed" if job["attempts"] >= job["max_attempts"] else "pending"
+        finally:
+            heartbeat.stopped.set()
+            heartbeat.join()
+
+        if not _move(queue_dir, job, "leases", target):
+            print(f"[{worker_id}] Lease of {job['id']} was lost; the job has been requeued")
+            continue
+        counts["retried" if target == "pending" else target] += 1
+        print(f"[{worker_id}] Job {job['id']} -> {target}")
+
+
+def queue_status(queue_dir: str) -> Dict[str, List[str]]:
+    """Job ids per state"""
+    return {state: list_jobs(queue_dir, state) for state in STATES}
+
+
+if __name__ == "__main__":
+    import sys
+
+    usage = [
+        "Usage: python job_queue.py submit <queue_dir> <analyze_mix.py arguments>",
+        "       python job_queue.py worker <queue_dir> [--results=results] [--lease=120] [--poll=5] [--cache-mb=2048] [--segments=16] [--exit-when-empty]",
+        "       python job_queue.py status <queue_dir>",
+        "Example: python job_queue.py worker /mnt/shared/rainybird-queue --results=/mnt/shared/results"
+    ]
+    if len(sys.argv) < 3 or sys.argv[1] not in ("submit", "worker", "status"):
+        print("\n".join(usage))
+        sys.exit(1)
+    command, queue_dir, rest = sys.argv[1], sys.argv[2], sys.argv[3:]
+
+    if command == "submit":
+        from analyze_mix import parse_cli_args
+        kwargs = parse_cli_args(rest)
+        if kwargs is None:
+            print("\n".join(usage))
+            sys.exit(1)
+        kwargs.pop("preview")
+        print(f"Submitted {submit(queue_dir, kwargs)} ({kwargs['output_name']})")
+    elif command == "worker":
+        options = dict(a[2:].split("=", 1) for a in rest if a.startswith("--") and "=" in a)
+        counts = run_worker(
+            queue_dir,
+            results_dir=options.get("results", "results"),
+            lease_s=float(options.get("lease", LEASE_S)),
+            poll_s=float(options.get("poll", POLL_S)),
+            exit_when_empty="--exit-when-empty" in rest,
+            cache_mb=int(options.get("cache-mb", DEFAULT_CACHE_MB)),
+            segments=int(options.get("segments", DEFAULT_SEGMENTS))
+        )
+        print(f"Queue empty: {counts['done']} done, {counts['retried']} retried, {counts['failed']} failed")
+    else:
+        for state, jobs in queue_status(queue_dir).items():
+            print(f"{state:>8}: {len(jobs)}")
+        for job_id in list_jobs(queue_dir, "failed"):
+            job = _read(_path(queue_dir, "failed", job_id))
+            print(f"  {job_id} {job['kwargs']['output_name']}: {job['errors'][-1] if job['errors'] else ''}")
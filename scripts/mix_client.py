@@ -0,0 +1,102 @@
+import json
+import os
+import socket
+import sys
+from typing import Dict, List, Optional
+
+# Thin client for mix_worker.py
+# Only imports the standard library, so it starts instantly. Takes the same
+# arguments as analyze_mix.py and sends them to the warm worker; if no worker
+# is running it runs analyze_mix.py in this process instead.
+
+SOCKET_PATH = os.environ.get("RAINYBIRD_SOCKET", "/tmp/rainybird-worker.sock")
+ANALYZE_MIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "analyze_mix.py")
+
+
+def connect(socket_path: str = SOCKET_PATH) -> Optional[socket.socket]:
+    """Connect to the worker, None if it is not running"""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sock.close()
+        return None
+    return sock
+
+
+def submit(job: Dict, socket_path: str = SOCKET_PATH) -> Dict:
+    """Send a job to the worker and print its progress as it arrives.
+
+    Returns:
+        The job result
+
+    Raises:
+        ConnectionError: If no worker is listening
+        RuntimeError: If the job failed in the worker
+    """
+    sock = connect(socket_path)
+    if sock is None:
+        raise ConnectionError(f"No worker listening on {socket_path}")
+    with sock, sock.makefile("rwb") as stream:
+        stream.write((json.dumps({**job, "cwd": os.getcwd()}) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event["event"] == "progress":
+                print(event["message"], flush=True)
+            elif event["event"] == "done":
+                return event["result"]
+            else:
+                raise RuntimeError(event["message"])
+    raise RuntimeError("Worker closed the connection")
+
+
+def confirm(prompt: str = "Accept preview and render the full mix? [y/N] ") -> bool:
+    """Ask for confirmation; non-interactive runs count as no (as preview.confirm)"""
+    try:
+        return input(prompt).strip().lower() in ("y", "yes")
+    except EOFError:
+        return False
+
+
+def run_analyze_mix(argv: List[str], socket_path: str = SOCKET_PATH) -> Dict:
+    """Run analyze_mix.py argv on the worker, asking locally before rendering a previewed mix
+
+    A previewed mix is rendered from the kwargs the worker parsed for the
+    preview, so both use the same seed and output name.
+    """
+    if "--preview" in argv:
+        kwargs = submit({"job": "preview", "argv": argv}, socket_path)["kwargs"]
+        if not confirm():
+            sys.exit(0)
+        return submit({"job": "analyze_mix", "kwargs": kwargs}, socket_path)
+    return submit({"job": "analyze_mix", "argv": argv}, socket_path)
+
+
+if __name__ == "__main__":
+    # Usage: python mix_client.py [--socket=PATH] <analyze_mix.py arguments>
+    #        python mix_client.py [--socket=PATH] ping
+    socket_path = next((a.split("=", 1)[1] for a in sys.argv[1:] if a.startswith("--socket=")), SOCKET_PATH)
+    argv = [a for a in sys.argv[1:] if not a.startswith("--socket=")]
+
+    if argv == ["ping"]:
+        try:
+            print(json.dumps(submit({"job": "ping"}, socket_path), indent=2))
+        except ConnectionError as e:
+            print(e)
+            sys.exit(1)
+        sys.exit(0)
+
+    probe = connect(socket_path)
+    if probe is None or len([a for a in argv if not a.startswith("--")]) < 3:
+        if probe is None:
+            print(f"No worker on {socket_path}, running in-process "
+                  f"(start one with: python scripts/mix_worker.py)")
+        os.execv(sys.executable, [sys.executable, ANALYZE_MIX] + argv)
+    probe.close()
+
+    try:
+        run_analyze_mix(argv, socket_path)
+    except RuntimeError as e:
+        print(f"Job failed: {e}")
+        sys.exit(1)
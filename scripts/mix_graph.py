@@ -0,0 +1,430 @@
+import json
+import hashlib
+import random
+import threading
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional, Sequence
+from pydub import AudioSegment
+from gain_staging import (
+    array_to_segment, db_to_gain, load_segment, match_channels, measure_levels, mix_layers,
+    normalize_peak, peak_normalize_gain, plan_gain_db, resample, segment_to_array, source_key
+)
+from noise_generator import is_noise_spec
+from ducking import Ducker
+from mix_recipe import (
+    BIRD_CALL_V, CALL_FADE_MS, CALL_INTERVAL_MS, CALL_JITTER_MS, CALL_MS, CROSSFADE_MS, TARGET_LEVEL,
+    event_positions_ms, mix_bed, plan_bed_layers
+)
+
+# Declarative mix graph
+# A mix recipe is a DAG of nodes (source, bed plan, bed track, level, fade,
+# event track, crossfade, ...). Every node is identified by a hash of its
+# type, its parameters and the keys of its inputs, and the renderer memoizes
+# node outputs under that key. Changing one node only re-renders the nodes
+# downstream of it, e.g. new bird calls reuse the rendered forest/rain/fire
+# bed, and a new rain layer reuses the decoded forest and fire. Independent
+# branches are evaluated in parallel.
+
+DEFAULT_CACHE_BYTES = 1 << 30  # Node outputs kept by the shared renderer
+
+
+class Audio(NamedTuple):
+    samples: np.ndarray  # float32, shape (frames, channels), read-only
+    frame_rate: int
+
+    @property
+    def channels(self) -> int:
+        return self.samples.shape[1]
+
+    def frames(self, ms: float) -> int:
+        """Number of frames in ms milliseconds"""
+        return int(ms * self.frame_rate // 1000)
+
+
+def _frozen(samples: np.ndarray) -> np.ndarray:
+    samples.flags.writeable = False
+    return samples
+
+
+class PlannedBed(NamedTuple):
+    layers: list  # (samples, gain_db, fade_frames) per layer, see mix_recipe.plan_bed_layers
+    frame_rate: int
+    channels: int
+
+    @property
+    def nbytes(self) -> int:
+        return sum(samples.nbytes for samples, _, _ in self.layers if isinstance(samples, np.ndarray))
+
+
+def _nbytes(output) -> int:
+    """Cache size of a node output (audio or a plan)"""
+    return output.samples.nbytes if isinstance(output, Audio) else output.nbytes
+
+
+def conform(audio: Audio, frame_rate: int, channels: int) -> np.ndarray:
+    """Return samples of audio at frame_rate with channels (mono is broadcast)"""
+    return match_channels(resample(audio.samples, audio.frame_rate, frame_rate), channels)
+
+
+def _common_format(inputs: List[Audio]):
+    return max(a.frame_rate for a in inputs), max(a.channels for a in inputs)
+
+
+class Node:
+    """Base class of graph nodes; subclasses implement evaluate()."""
+
+    def __init__(self, *inputs: "Node", **params):
+        self.inputs = list(inputs)
+        self.params = params
+        self._key = None
+
+    def identity(self) -> Dict:
+        """Parameters that determine the output (hashed into the key)"""
+        return self.params
+
+    @property
+    def key(self) -> str:
+        if self._key is None:
+            payload = json.dumps({
+                "type": type(self).__name__,
+                "params": self.identity(),
+                "inputs": [node.key for node in self.inputs]
+            }, sort_keys=True, default=str)
+            self._key = hashlib.sha1(payload.encode("utf-8")).hexdigest()
+        return self._key
+
+    def evaluate(self, inputs: List[Audio]) -> Audio:
+        raise NotImplementedError
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.params})"
+
+
+class Source(Node):
+    """Decoded audio file."""
+
+    def __init__(self, path: str):
+        super().__init__(path=path)
+
+    def identity(self) -> Dict:
+        # The file's mtime/size are part of the key, so edited files are re-decoded
+        return {**self.params, "source": source_key(self.params["path"])}
+
+    def evaluate(self, inputs):
+        print(f"Loading {self.params['path']} ")
+        segment = load_segment(self.params["path"])
+        return Audio(segment_to_array(segment), segment.frame_rate)
+
+
+class BedPlan(Node):
+    """Planned forest/rain/fire layers of the standard recipe (see mix_recipe.plan_bed_layers).
+
+    File layers are Source inputs, so changing one layer keeps the others
+    decoded; noise specs are generated by the plan. The output is the
+    PlannedBed that BedTrack nodes render, so a bed and its sidechain share
+    one decode and one auto-balance solution.
+    """
+
+    def __init__(self, paths: Sequence[str], auto_balance: bool = False):
+        sources = [Source(path) for path in paths if not is_noise_spec(path)]
+        super().__init__(*sources, paths=list(paths), auto_balance=auto_balance)
+
+    def evaluate(self, inputs):
+        decoded = iter(inputs)
+        sources = []
+        for path in self.params["paths"]:
+            audio = None if is_noise_spec(path) else next(decoded)
+            sources.append(None if audio is None else (audio.samples, audio.frame_rate))
+        layers, frame_rate, channels, _ = plan_bed_layers(self.params["paths"], sources,
+                                                          self.params["auto_balance"])
+        return PlannedBed(layers, frame_rate, channels)
+
+
+class BedTrack(Node):
+    """Planned bed rendered to duration_ms, fused like mix_recipe.
+
+    Every layer is looped, faded and scaled by its planned gain in one summing
+    pass, and normalized in place. With foreground only the forest layer is
+    rendered (e.g. as a ducking sidechain); with duck it ducks the others.
+    """
+
+    def __init__(self, bed: BedPlan, duration_ms: int, duck: bool = False, normalize: bool = True,
+                 foreground: bool = False):
+        super().__init__(bed, duration_ms=int(duration_ms), duck=duck, normalize=normalize,
+                         foreground=foreground)
+
+    def evaluate(self, inputs):
+        p, bed = self.params, inputs[0]
+        num_frames = p["duration_ms"] * bed.frame_rate // 1000
+        if p["foreground"]:
+            samples = mix_layers(bed.layers[:1], num_frames, bed.channels)
+        else:
+            samples = mix_bed(bed.layers, num_frames, bed.channels,
+                              ducker=Ducker(bed.frame_rate) if p["duck"] else None)
+        if p["normalize"]:
+            normalize_peak(samples)
+        return Audio(samples, bed.frame_rate)
+
+
+class Level(Node):
+    """Match RMS to target_level dBFS, then add offset_db (one gain pass)."""
+
+    def __init__(self, node: Node, target_level: float, offset_db: float = 0.0):
+        super().__init__(node, target_level=target_level, offset_db=offset_db)
+
+    def evaluate(self, inputs):
+        audio = inputs[0]
+        gain_db = plan_gain_db(measure_levels(audio.samples),
+                               self.params["target_level"], self.params["offset_db"])
+        return Audio(audio.samples * db_to_gain(gain_db), audio.frame_rate)
+
+
+class MatchLevel(Node):
+    """Match the RMS level of the first input to the second (reference) input."""
+
+    def __init__(self, node: Node, reference: Node):
+        super().__init__(node, reference)
+
+    def evaluate(self, inputs):
+        audio, reference = inputs
+        target = measure_levels(reference.samples)["rms_dbfs"]
+        gain_db = plan_gain_db(measure_levels(audio.samples), target)
+        return Audio(audio.samples * db_to_gain(gain_db), audio.frame_rate)
+
+
+class Trim(Node):
+    """Cut to at most duration_ms."""
+
+    def __init__(self, node: Node, duration_ms: int):
+        super().__init__(node, duration_ms=int(duration_ms))
+
+    def evaluate(self, inputs):
+        audio = inputs[0]
+        return Audio(audio.samples[:audio.frames(self.params["duration_ms"])], audio.frame_rate)
+
+
+class Fade(Node):
+    """Linear fade in / fade out."""
+
+    def __init__(self, node: Node, fade_in_ms: int = 0, fade_out_ms: int = 0):
+        super().__init__(node, fade_in_ms=int(fade_in_ms), fade_out_ms=int(fade_out_ms))
+
+    def evaluate(self, inputs):
+        audio = inputs[0]
+        samples = audio.samples.copy()
+        fade_in = min(audio.frames(self.params["fade_in_ms"]), len(samples))
+        fade_out = min(audio.frames(self.params["fade_out_ms"]), len(samples))
+        if fade_in:
+            samples[:fade_in] *= np.linspace(0.0, 1.0, fade_in, dtype=np.float32)[:, np.newaxis]
+        if fade_out:
+            samples[len(samples) - fade_out:] *= np.linspace(1.0, 0.0, fade_out, dtype=np.float32)[:, np.newaxis]
+        return Audio(samples, audio.frame_rate)
+
+
+class Normalize(Node):
+    """Peak normalize to -headroom dBFS.
+
+    With a reference node the gain that normalizes the reference is applied
+    instead (e.g. to keep a sidechain on the level scale of the normalized bed).
+    """
+
+    def __init__(self, node: Node, headroom: float = 0.1, reference: Optional[Node] = None):
+        nodes = (node,) if reference is None else (node, reference)
+        super().__init__(*nodes, headroom=headroom)
+
+    def evaluate(self, inputs):
+        audio = inputs[0]
+        reference = inputs[-1].samples
+        gain = peak_normalize_gain(reference, self.params["headroom"])
+        return Audio(audio.samples * np.float32(gain), audio.frame_rate)
+
+
+class EventTrack(Node):
+    """Overlay an event (e.g. a bird call) roughly every interval_ms with seeded jitter.
+
+    With a sidechain node the events are ducked while it is loud (see ducking).
+    """
+
+    def __init__(self, base: Node, event: Node, interval_ms: int = CALL_INTERVAL_MS,
+                 jitter_ms: int = CALL_JITTER_MS, seed: int = 0, sidechain: Optional[Node] = None):
+        nodes = (base, event) if sidechain is None else (base, event, sidechain)
+        super().__init__(*nodes, interval_ms=int(interval_ms),
+                         jitter_ms=int(jitter_ms), seed=int(seed))
+
+    def positions_ms(self, total_ms: int, event_ms: int) -> List[int]:
+        """Start times of the events on a base of total_ms (see mix_recipe.event_positions_ms)"""
+        return event_positions_ms(total_ms, event_ms, self.params["interval_ms"],
+                                  self.params["jitter_ms"], self.params["seed"])
+
+    def evaluate(self, inputs):
+        base, event = inputs[:2]
+        event_samples = conform(event, base.frame_rate, base.channels)
+        result = base.samples.copy()
+        track = np.zeros_like(result) if len(inputs) > 2 else result
+        total_ms = len(result) * 1000 // base.frame_rate
+        event_ms = len(event_samples) * 1000 // base.frame_rate
+        for position in self.positions_ms(total_ms, event_ms):
+            start = base.frames(position)
+            end = min(start + len(event_samples), len(result))
+            track[start:end] += event_samples[:end - start]
+        if len(inputs) > 2:
+            sidechain = conform(inputs[2], base.frame_rate, base.channels)[:len(result)]
+            sidechain = np.pad(sidechain, ((0, len(result) - len(sidechain)), (0, 0)))
+            result += Ducker(base.frame_rate).process(sidechain, track)
+        return Audio(result, base.frame_rate)
+
+
+class Crossfade(Node):
+    """Append the second input to the first with a linear crossfade (like AudioSegment.append)."""
+
+    def __init__(self, first: Node, second: Node, crossfade_ms: int = CROSSFADE_MS):
+        super().__init__(first, second, crossfade_ms=int(crossfade_ms))
+
+    def evaluate(self, inputs):
+        frame_rate, channels = _common_format(inputs)
+        a, b = (conform(x, frame_rate, channels) for x in inputs)
+        overlap = min(int(self.params["crossfade_ms"] * frame_rate // 1000), len(a), len(b))
+        result = np.empty((len(a) + len(b) - overlap, channels), dtype=np.float32)
+        result[:len(a) - overlap] = a[:len(a) - overlap]
+        ramp = np.linspace(0.0, 1.0, overlap, dtype=np.float32)[:, np.newaxis]
+        result[len(a) - overlap:len(a)] = a[len(a) - overlap:] * ramp[::-1] + b[:overlap] * ramp
+        result[len(a):] = b[overlap:]
+        return Audio(result, frame_rate)
+
+
+class MixGraphRenderer:
+    def __init__(self, max_workers: Optional[int] = None, max_cache_bytes: Optional[int] = None):
+        """Evaluate mix graphs with memoized node outputs.
+
+        Args:
+            max_workers: Threads used to evaluate independent branches
+            max_cache_bytes: Evict least recently used outputs beyond this size
+        """
+        self.max_workers = max_workers
+        self.max_cache_bytes = max_cache_bytes
+        self.cache: "OrderedDict[str, Audio]" = OrderedDict()  # Audio or PlannedBed
+        self.stats = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key: str) -> Optional[Audio]:
+        with self._lock:
+            audio = self.cache.get(key)
+            if audio is not None:
+                self.cache.move_to_end(key)
+                self.stats["hits"] += 1
+            return audio
+
+    def _store(self, key: str, audio: Audio):
+        with self._lock:
+            self.stats["misses"] += 1
+            self.cache[key] = audio
+            if self.max_cache_bytes is None:
+                return
+            total = sum(_nbytes(output) for output in self.cache.values())
+            while total > self.max_cache_bytes and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                total -= _nbytes(evicted)
+
+    def _evaluate(self, node: Node, input_futures) -> Audio:
+        inputs = [future.result() for future in input_futures]
+        output = node.evaluate(inputs)
+        if isinstance(output, Audio):
+            output = Audio(_frozen(output.samples), output.frame_rate)
+        self._store(node.key, output)
+        return output
+
+    def render(self, node: Node) -> Audio:
+        """Render a node, reusing every memoized node output."""
+        # Topological order without duplicates; cached subtrees are not expanded
+        order, seen, ready = [], set(), {}
+
+        def visit(n: Node):
+            if n.key in seen:
+                return
+            seen.add(n.key)
+            cached = self._lookup(n.key)
+            if cached is not None:
+                done = Future()
+                done.set_result(cached)
+                ready[n.key] = done
+                return
+            for child in n.inputs:
+                visit(child)
+            order.append(n)
+        visit(node)
+        if node.key in ready:
+            return ready[node.key].result()
+
+        # Dependencies are always submitted first, so with the FIFO pool a
+        # task can only wait on tasks that are already running or done
+        futures = dict(ready)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for n in order:
+                futures[n.key] = pool.submit(self._evaluate, n, [futures[c.key] for c in n.inputs])
+        return futures[node.key].result()
+
+
+# Renderer shared by render_mix() calls in the same process
+default_renderer = MixGraphRenderer(max_cache_bytes=DEFAULT_CACHE_BYTES)
+
+
+def build_mix_graph(forest_sound: str,
+                    rain_sound: str,
+                    fire_sound: str,
+                    bird_call_sound: Optional[str] = None,
+                    duration_ms: int = 300000,
+                    intro_sound: Optional[str] = None,
+                    outro_sound: Optional[str] = None,
+                    auto_balance: bool = False,
+                    seed: Optional[int] = None,
+                    duck: bool = False) -> Node:
+    """Build the standard RainyBird recipe as a graph.
+
+    Bed (forest/rain/fire) -> timed bird calls -> intro/outro crossfades, with
+    the levels and timing of mix_recipe.plan_mix: the bed layers are planned
+    from their whole sources, and intro and outro are matched to bed and calls.
+    Bed layers can be noise specs ("noise:rain?seed=3").
+
+    Args:
+        seed: Seed of the bird call timing (random if None)
+        duck: Duck rain, fire and bird calls under the forest layer
+            (narration or songs in that slot)
+
+    Returns:
+        The final node of the graph
+    """
+    duration_ms = int(duration_ms)
+    layers = BedPlan([forest_sound, rain_sound, fire_sound], auto_balance)
+
+    if duck:
+        # Ducked bed and its sidechain share the bed's normalization gain
+        raw = BedTrack(layers, duration_ms, duck=True, normalize=False)
+        bed = Normalize(raw)
+        sidechain = Normalize(BedTrack(layers, duration_ms, normalize=False, foreground=True), reference=raw)
+    else:
+        bed = BedTrack(layers, duration_ms)
+        sidechain = None
+
+    mix = bed
+    if bird_call_sound:
+        call = Fade(Trim(Source(bird_call_sound), CALL_MS), CALL_FADE_MS, CALL_FADE_MS)
+        call = Level(call, TARGET_LEVEL, -BIRD_CALL_V)
+        if seed is None:
+            seed = random.randrange(2 ** 31)
+        mix = EventTrack(mix, call, seed=seed, sidechain=sidechain)
+
+    base = mix
+    if intro_sound:
+        mix = Crossfade(MatchLevel(Source(intro_sound), base), mix)
+    if outro_sound:
+        mix = Crossfade(mix, MatchLevel(Source(outro_sound), base))
+    return mix
+
+
+def render_mix(*args, renderer: Optional[MixGraphRenderer] = None, **kwargs) -> AudioSegment:
+    """Build the standard recipe (see build_mix_graph) and render it to an AudioSegment."""
+    renderer = renderer or default_renderer
+    audio = renderer.render(build_mix_graph(*args, **kwargs))
+    return array_to_segment(audio.samples, audio.frame_rate)
@@ -0,0 +1,371 @@
+import random
+import time
+import numpy as np
+from gain_staging import (
+    NORMALIZE_HEADROOM, db_to_gain, load_segment, match_channels, measure_levels, mix_layers,
+    peak_bound, plan_gain_db, resample, segment_to_array, source_levels
+)
+from auto_balance import balance_layers, print_balance_report
+from noise_generator import DEFAULT_RATE, NoiseGenerator, is_noise_spec
+from ducking import Ducker
+
+# Mix recipe
+# Levels and timing of the standard RainyBird recipe (forest/rain/fire bed ->
+# timed bird calls -> intro/outro crossfades) and its block renderer. A mix
+# is planned once (sources decoded, every gain stage folded into one gain per
+# source, the timeline laid out) and then rendered block by block, so it can
+# be streamed into the encoders without holding the whole mix. mix_graph
+# builds the same recipe as a memoized graph for long-running workers.
+
+# Configuration for volume parameters
+
+TARGET_LEVEL = -20
+
+BIRD_V  = -10  # Slightly reduce bird volume
+WATER_V = -7  # Reduce water more (as background)
+FIRE_V  = -20  # Fire as subtle background element
+BIRD_CALL_V = -18  
+
+# Recipe timing
+LAYER_FADE_MS = 3000     # Fade in/out of the forest and fire layers
+CALL_MS = 5000           # Bird calls are cut to this length
+CALL_FADE_MS = 500
+CALL_INTERVAL_MS = 30000
+CALL_JITTER_MS = 2000
+CROSSFADE_MS = 4000      # Intro/outro crossfade
+
+def load_audio(file_path):
+    """Load an audio file without any gain processing"""
+    print(f"Loading {file_path} ")
+    return load_segment(file_path)
+
+def plan_ambient_layers(bird_path, water_path, fire_path, auto_balance=False):
+    """
+    Decode the bed layers and fold their gain stages into one gain per layer
+    (see plan_bed_layers)
+    
+    Returns:
+        (plan, frame_rate, channels, sample_width, levels) as plan_bed_layers,
+        with the widest sample width of the decoded sources
+    """
+    paths = [bird_path, water_path, fire_path]
+    # Load audio files (noise layers are generated instead)
+    segments = [None if is_noise_spec(path) else load_audio(path) for path in paths]
+    sources = [None if seg is None else (segment_to_array(seg), seg.frame_rate) for seg in segments]
+    plan, frame_rate, channels, levels = plan_bed_layers(paths, sources, auto_balance)
+    sample_width = max([2] + [seg.sample_width for seg in segments if seg is not None])
+    return plan, frame_rate, channels, sample_width, levels
+
+def plan_bed_layers(paths, sources, auto_balance=False):
+    """
+    Fold the gain stages of the forest/rain/fire layers into one gain per layer
+    
+    With auto_balance the manual balance is refined by auto_balance.balance_layers:
+    per-layer gain and band EQ solved from the cached layer PSDs for the
+    flattest mix spectrum.
+    
+    A layer path can also be a procedural noise spec such as "noise:rain?seed=3"
+    (see noise_generator); it is generated while mixing, without file I/O.
+    
+    Parameters:
+        paths: forest, rain and fire paths (or noise specs)
+        sources: decoded (samples, frame_rate) of each file layer, None for noise specs
+        auto_balance: solve gains and EQ for the flattest mix
+    
+    Returns:
+        (plan, frame_rate, channels, levels) where plan is a list of
+        (samples, gain_db, fade_frames) for gain_staging.mix_layers and levels
+        holds each layer's source RMS/peak (see measure_levels)
+    """
+    # Balance offset and fade in/out per layer
+    balance = [(BIRD_V, True), (WATER_V, False), (FIRE_V, True)]
+    decoded = [source for source in sources if source is not None]
+    frame_rate = max((rate for _, rate in decoded), default=DEFAULT_RATE)
+    channels = max((samples.shape[1] for samples, _ in decoded), default=2)
+    
+    # Normalize to TARGET_LEVEL and balance in one gain per layer,
+    # applied while looping and summing the layers
+    plan = []
+    layer_levels = []
+    for path, source, (offset_db, fade) in zip(paths, sources, balance):
+        if source is None:
+            samples = NoiseGenerator.from_spec(path, frame_rate, channels)
+            levels = samples.levels()
+        else:
+            samples = resample(source[0], source[1], frame_rate)
+            levels = source_levels(path, samples)
+        gain_db = plan_gain_db(levels, TARGET_LEVEL, offset_db)
+        fade_frames = LAYER_FADE_MS * frame_rate // 1000 if fade else 0
+        plan.append((samples, gain_db, fade_frames))
+        layer_levels.append(levels)
+    
+    if auto_balance:
+        plan, solution = balance_layers(plan, frame_rate, paths)
+        print_balance_report(solution, ["forest", "rain", "fire"])
+        # EQ changes the waveform, so re-measure the levels used for block rendering
+        layer_levels = [samples.levels() if isinstance(samples, NoiseGenerator) else measure_levels(samples)
+                        for samples, _, _ in plan]
+    return plan, frame_rate, channels, layer_levels
+
+def mix_bed(plan, num_frames, channels, start=0, stop=None, ducker=None):
+    """
+    Sum the planned bed layers; with a ducker the first layer (forest slot,
+    e.g. narration) ducks the others
+    """
+    if ducker is None:
+        return mix_layers(plan, num_frames, channels, start, stop)
+    mix = mix_layers(plan[:1], num_frames, channels, start, stop)
+    mix += ducker.process(mix, mix_layers(plan[1:], num_frames, channels, start, stop))
+    return mix
+
+def event_positions_ms(total_ms, event_ms, interval_ms=CALL_INTERVAL_MS, jitter_ms=CALL_JITTER_MS, seed=0):
+    """
+    Start times of events (bird calls) roughly every interval_ms with seeded
+    jitter; events that would run past total_ms are dropped
+    """
+    rng = random.Random(seed)
+    positions = []
+    for i in range(total_ms // interval_ms):
+        position = max(0, i * interval_ms + rng.randint(-jitter_ms, jitter_ms))
+        if position + event_ms <= total_ms:
+            positions.append(position)
+    return positions
+
+def _linear_fades(samples, fade_frames):
+    """Linear fade in/out of fade_frames, in place"""
+    fade_frames = min(fade_frames, len(samples))
+    if fade_frames:
+        ramp = np.linspace(0.0, 1.0, fade_frames, dtype=np.float32)[:, np.newaxis]
+        samples[:fade_frames] *= ramp
+        samples[len(samples) - fade_frames:] *= ramp[::-1]
+    return samples
+
+def _load_conformed(path, frame_rate, channels):
+    """Decode a file to float samples at frame_rate with channels"""
+    segment = load_audio(path)
+    return match_channels(resample(segment_to_array(segment), segment.frame_rate, frame_rate), channels)
+
+def plan_mix(forest_sound, rain_sound, fire_sound, bird_call_sound=None, duration_ms=300000,
+             intro_sound=None, outro_sound=None, auto_balance=False, duck=False, seed=None):
+    """
+    Plan the standard recipe (bed -> timed bird calls -> intro/outro crossfades)
+    for block rendering with stream_mix or render_window
+    
+    Sources are decoded and every gain stage is folded here; the mix itself is
+    only rendered block by block. Until measure_mix has run, the bed's
+    normalization gain and the RMS level of bed and calls (which intro and
+    outro are matched to) are estimates from the layer levels.
+    
+    Parameters:
+        (as mix_graph.build_mix_graph)
+        seed: bird call timing seed (random if None)
+    
+    Returns:
+        Plan dictionary with frame_rate, channels, frames (total length), seed,
+        the bed, call and intro/outro plans and plan_time (decode and planning
+        time in seconds)
+    """
+    start_time = time.perf_counter()
+    duration_ms = int(duration_ms)
+    bed, frame_rate, channels, sample_width, levels = plan_ambient_layers(
+        forest_sound, rain_sound, fire_sound, auto_balance
+    )
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    bed_frames = duration_ms * frame_rate // 1000
+    plan = {
+        "frame_rate": frame_rate,
+        "channels": channels,
+        "sample_width": sample_width,
+        "bed": bed,
+        "bed_frames": bed_frames,
+        "duck": duck,
+        "seed": seed,
+        "call": None,
+        "call_positions": [],
+    }
+    
+    # Estimates: peak bound and the uncorrelated power sum of the layers
+    layers = [(level, gain_db) for level, (_, gain_db, _) in zip(levels, bed)]
+    bound = peak_bound((level["peak_dbfs"], gain_db) for level, gain_db in layers)
+    plan["scale"] = db_to_gain(-NORMALIZE_HEADROOM) / bound if bound > 0 else 1.0
+    power = sum(10 ** ((level["rms_dbfs"] + gain_db) / 10) for level, gain_db in layers
+                if np.isfinite(level["rms_dbfs"])) * plan["scale"] ** 2
+    plan["measured"] = False
+    
+    if bird_call_sound:
+        call = _load_conformed(bird_call_sound, frame_rate, channels)[:CALL_MS * frame_rate // 1000]
+        _linear_fades(call, CALL_FADE_MS * frame_rate // 1000)
+        call *= db_to_gain(plan_gain_db(measure_levels(call), TARGET_LEVEL, -BIRD_CALL_V))
+        positions = event_positions_ms(bed_frames * 1000 // frame_rate, len(call) * 1000 // frame_rate,
+                                       seed=seed)
+        plan["call"] = call
+        plan["call_positions"] = [position * frame_rate // 1000 for position in positions]
+        # Calls add their power for the share of the bed they cover
+        flat = call.reshape(-1)
+        power += float(np.dot(flat, flat)) / channels * len(positions) / max(1, bed_frames)
+    plan["mix_rms_dbfs"] = 10 * np.log10(power) if power > 0 else -float("inf")
+    
+    # Timeline: intro, bed (crossfaded into the intro), outro (crossfaded into the end)
+    crossfade = CROSSFADE_MS * frame_rate // 1000
+    for name, path in (("intro", intro_sound), ("outro", outro_sound)):
+        samples = None
+        if path:
+            samples = _load_conformed(path, frame_rate, channels)
+            plan[f"{name}_levels"] = measure_levels(samples)
+        plan[name] = samples
+    intro_frames = len(plan["intro"]) if plan["intro"] is not None else 0
+    plan["fade_in"] = min(crossfade, intro_frames, bed_frames)
+    plan["offset"] = intro_frames - plan["fade_in"]
+    bed_end = plan["offset"] + bed_frames
+    outro_frames = len(plan["outro"]) if plan["outro"] is not None else 0
+    plan["fade_out"] = min(crossfade, outro_frames, bed_end)
+    plan["outro_start"] = bed_end - plan["fade_out"]
+    plan["frames"] = plan["outro_start"] + outro_frames if outro_frames else bed_end
+    plan["plan_time"] = time.perf_counter() - start_time
+    return plan
+
+def measure_mix(plan, block_ms=10000):
+    """
+    Exact levels: one pass over the bed for its peak (the normalization gain)
+    and the RMS level of bed and calls, in constant memory, replacing the
+    estimates in plan
+    
+    The calls' share of the power follows from the bed pass unless they are
+    ducked, which depends on the normalized bed; then bed and calls are
+    rendered in a second pass.
+    """
+    frame_rate, channels, num_frames = plan["frame_rate"], plan["channels"], plan["bed_frames"]
+    block_frames = max(1, block_ms * frame_rate // 1000)
+    windows = [(start, min(start + block_frames, num_frames)) for start in range(0, num_frames, block_frames)]
+    ducker = Ducker(frame_rate) if plan["duck"] else None
+    calls = plan["call"] is not None and not plan["duck"]
+    peak, bed_power, cross, call_power = 0.0, 0.0, 0.0, 0.0
+    for start, stop in windows:
+        flat = mix_bed(plan["bed"], num_frames, channels, start, stop, ducker).reshape(-1)
+        peak = max(peak, float(max(flat.max(), -flat.min())))
+        bed_power += float(np.dot(flat, flat))
+        if calls:
+            track = np.zeros((stop - start, channels), dtype=np.float32)
+            _add_calls(plan, track, start, stop)
+            track = track.reshape(-1)
+            cross += float(np.dot(flat, track))
+            call_power += float(np.dot(track, track))
+    plan["scale"] = db_to_gain(-NORMALIZE_HEADROOM) / peak if peak > 0 else 1.0
+    
+    if plan["call"] is not None and plan["duck"]:
+        duckers = _duckers(plan)
+        power = 0.0
+        for start, stop in windows:
+            flat = _render_base(plan, start, stop, duckers).reshape(-1)
+            power += float(np.dot(flat, flat))
+    else:
+        power = plan["scale"] ** 2 * bed_power + 2 * plan["scale"] * cross + call_power
+    rms = np.sqrt(power / max(1, num_frames * channels))
+    plan["mix_rms_dbfs"] = 20 * np.log10(rms) if rms > 0 else -float("inf")
+    plan["measured"] = True
+    return plan
+
+def _duckers(plan):
+    if not plan["duck"]:
+        return None
+    return {"bed": Ducker(plan["frame_rate"]), "calls": Ducker(plan["frame_rate"])}
+
+def _add_calls(plan, track, start, stop):
+    """Add the bird calls sounding in frames [start, stop) of the bed timeline to track, in place"""
+    call = plan["call"]
+    for position in plan["call_positions"]:
+        a, b = max(start, position), min(stop, position + len(call))
+        if a < b:
+            track[a - start:b - start] += call[a - position:b - position]
+
+def _render_base(plan, start, stop, duckers):
+    """Normalized bed plus bird calls for frames [start, stop) of the bed timeline"""
+    bed, num_frames, channels = plan["bed"], plan["bed_frames"], plan["channels"]
+    if duckers:
+        # As mix_bed; the calls are then ducked by the normalized foreground
+        foreground = mix_layers(bed[:1], num_frames, channels, start, stop)
+        mix = mix_layers(bed[1:], num_frames, channels, start, stop)
+        duckers["bed"].process(foreground, mix)
+        mix += foreground
+        mix *= plan["scale"]
+        foreground *= plan["scale"]
+    else:
+        mix = mix_layers(bed, num_frames, channels, start, stop)
+        mix *= plan["scale"]
+    
+    if plan["call"] is not None:
+        track = np.zeros_like(mix) if duckers else mix
+        _add_calls(plan, track, start, stop)
+        if duckers:
+            mix += duckers["calls"].process(foreground, track)
+    return mix
+
+def _crossfade_ramp(fade_frames, a, b, offset):
+    """Linear crossfade ramp (as AudioSegment.append) for frames [a, b) of a fade starting at offset"""
+    ramp = np.arange(a - offset, b - offset, dtype=np.float32) / max(1, fade_frames - 1)
+    return ramp[:, np.newaxis]
+
+def _render(plan, start, stop, duckers):
+    block = np.zeros((stop - start, plan["channels"]), dtype=np.float32)
+    offset, fade_in = plan["offset"], plan["fade_in"]
+    
+    # Bed and calls, fading in over the end of the intro
+    a, b = max(start, offset), min(stop, offset + plan["bed_frames"])
+    if a < b:
+        base = _render_base(plan, a - offset, b - offset, duckers)
+        if a < offset + fade_in:
+            end = min(b, offset + fade_in)
+            base[:end - a] *= _crossfade_ramp(fade_in, a, end, offset)
+        block[a - start:b - start] = base
+    
+    intro = plan["intro"]
+    if intro is not None:
+        a, b = start, min(stop, len(intro))
+        if a < b:
+            chunk = intro[a:b] * db_to_gain(plan_gain_db(plan["intro_levels"], plan["mix_rms_dbfs"]))
+            if b > offset:
+                first = max(a, offset)
+                chunk[first - a:] *= 1 - _crossfade_ramp(fade_in, first, b, offset)
+            block[:b - a] += chunk
+    
+    outro, outro_start, fade_out = plan["outro"], plan["outro_start"], plan["fade_out"]
+    if outro is not None:
+        # Everything before the outro fades out under it
+        a, b = max(start, outro_start), min(stop, outro_start + fade_out)
+        if a < b:
+            block[a - start:b - start] *= 1 - _crossfade_ramp(fade_out, a, b, outro_start)
+        a, b = max(start, outro_start), min(stop, outro_start + len(outro))
+        if a < b:
+            chunk = outro[a - outro_start:b - outro_start] * db_to_gain(
+                plan_gain_db(plan["outro_levels"], plan["mix_rms_dbfs"]))
+            if a < outro_start + fade_out:
+                end = min(b, outro_start + fade_out)
+                chunk[:end - a] *= _crossfade_ramp(fade_out, a, end, outro_start)
+            block[a - start:b - start] += chunk
+    return block
+
+def render_window(plan, start, stop):
+    """
+    Render frames [start, stop) of a planned mix on their own (e.g. preview
+    excerpts); ducking starts from rest at start
+    """
+    return _render(plan, start, min(stop, plan["frames"]), _duckers(plan))
+
+def stream_mix(plan, block_ms=10000):
+    """
+    Render a planned mix block by block, e.g. straight into export_stage
+    
+    The mix is measured first (see measure_mix) so the stream matches the
+    in-memory render: exact peak normalization and intro/outro levels.
+    Ducking carries its envelope state across blocks.
+    
+    Yields:
+        Float blocks of shape (frames, channels)
+    """
+    if not plan["measured"]:
+        measure_mix(plan, block_ms)
+    duckers = _duckers(plan)
+    block_frames = max(1, block_ms * plan["frame_rate"] // 1000)
+    for start in range(0, plan["frames"], block_frames):
+        yield _render(plan, start, min(start + block_frames, plan["frames"]), duckers)
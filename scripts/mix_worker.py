@@ -0,0 +1,232 @@
+import importlib
+import io
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+import traceback
+from contextlib import redirect_stdout
+from typing import Callable, Dict
+from render_cache import DEFAULT_CACHE_MB, DEFAULT_SEGMENTS, enable_render_caches
+
+# Warm worker daemon
+# Keeps one Python process with librosa/scipy/matplotlib imported and warmed
+# up, the mix graph renderer's node cache and a cache of decoded sources, and
+# serves render/analyze jobs over a Unix socket. The protocol is newline
+# delimited JSON: the client sends one job line, the worker answers with
+# {"event": "progress", "message": ...} lines (everything the job prints)
+# followed by one {"event": "done", "result": ...} or {"event": "error", ...}.
+# Jobs run one at a time: they chdir into the client's working directory and
+# share the caches.
+
+SOCKET_PATH = os.environ.get("RAINYBIRD_SOCKET", "/tmp/rainybird-worker.sock")
+
+
+def warm_up():
+    """Import the heavy modules and run each expensive first call once"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import numpy as np
+    import librosa
+    from scipy import signal
+    from pydub import AudioSegment
+    importlib.import_module("analyze_mix")  # Pulls in the whole pipeline
+
+    noise = np.random.default_rng(0).standard_normal(22050).astype(np.float32)
+    librosa.feature.melspectrogram(y=noise, sr=22050, n_mels=128)
+    librosa.stft(noise, n_fft=2048)
+    signal.welch(noise, 22050, nperseg=2048)
+    subprocess.run([AudioSegment.converter, "-version"], capture_output=True)
+
+
+class _ProgressWriter(io.TextIOBase):
+    """File-like object that sends every printed line as a progress event"""
+
+    def __init__(self, send: Callable[[Dict], None]):
+        self.send = send
+        self.buffer = ""
+
+    def write(self, text: str) -> int:
+        self.buffer += text
+        *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            self.send({"event": "progress", "message": line})
+        return len(text)
+
+    def flush(self):
+        if self.buffer:
+            self.send({"event": "progress", "message": self.buffer})
+            self.buffer = ""
+
+
+def mix_kwargs(job: Dict) -> Dict:
+    """analyze_mix_with_components kwargs of a preview/analyze_mix job.
+
+    The command line is parsed once per request: a preview returns the
+    parsed kwargs (with its seed), and the analyze_mix job that follows it
+    sends them back instead of the argv, so both render the same mix into
+    the same output_name.
+    """
+    from analyze_mix import parse_cli_args
+
+    if job.get("kwargs") is not None:
+        return dict(job["kwargs"])
+    kwargs = parse_cli_args(job["argv"])
+    if kwargs is None:
+        raise ValueError("analyze_mix needs <forest_sound> <rain_sound> <fire_sound>")
+    kwargs.pop("preview")
+    return kwargs
+
+
+def run_job(job: Dict) -> Dict:
+    """Run one job in this process.
+
+    Jobs:
+        {"job": "ping"}
+        {"job": "preview", "argv": [analyze_mix.py arguments]}
+        {"job": "analyze_mix", "argv": [...], "seed": optional int}
+        {"job": "analyze_mix", "kwargs": {kwargs of the preview result}}
+        {"job": "analyze_audio", "path": ..., "name": optional}
+
+    Returns:
+        JSON-serializable job result
+    """
+    from analyze_mix import analyze_mix_with_components, preview_mix
+    from audio_pipeline import AudioAnalysisPipeline
+    from mix_graph import default_renderer
+    from preview import print_preview_report
+
+    kind = job.get("job")
+    if kind == "ping":
+        return {"pid": os.getpid(), "renderer": dict(default_renderer.stats),
+                "cached_nodes": len(default_renderer.cache)}
+    if kind == "analyze_audio":
+        return AudioAnalysisPipeline().analyze_audio(job["path"], job.get("name"))
+    if kind in ("preview", "analyze_mix"):
+        kwargs = mix_kwargs(job)
+        if kind == "preview":
+            preview = preview_mix(kwargs)
+            print_preview_report(preview)
+            return {"seed": preview["seed"], "output_path": preview["output_path"],
+                    "kwargs": {**kwargs, "seed": preview["seed"]}}
+        if job.get("seed") is not None:
+            kwargs["seed"] = job["seed"]
+        # Rendered in memory so the node cache carries over to the next job
+        return analyze_mix_with_components(**kwargs, renderer=default_renderer)
+    raise ValueError(f"Unknown job: {kind}")
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def send(self, event: Dict):
+        self.wfile.write((json.dumps(event, default=str) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            job = json.loads(line)
+            if job.get("job") == "ping":
+                self.send({"event": "done", "result": run_job(job)})
+                return
+            with self.server.job_lock:
+                start = time.perf_counter()
+                writer = _ProgressWriter(self.send)
+                cwd = os.getcwd()
+                try:
+                    os.chdir(job.get("cwd", cwd))
+                    with redirect_stdout(writer):
+                        result = run_job(job)
+                finally:
+                    writer.flush()
+                    os.chdir(cwd)
+                self.server.jobs_served += 1
+                print(f"{job['job']} done in {time.perf_counter() - start:.1f}s")
+            self.send({"event": "done", "result": result})
+        except BrokenPipeError:
+            print("Client disconnected")
+        except Exception as e:
+            traceback.print_exc()
+            try:
+                self.send({"event": "error", "message": f"{type(e).__name__}: {e}"})
+            except BrokenPipeError:
+                pass
+
+
+def worker_listening(socket_path: str) -> bool:
+    """True if a worker accepts connections on socket_path"""
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+class MixWorker(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: str = SOCKET_PATH):
+        """Unix socket server running jobs one at a time (see run_job)
+
+        Raises:
+            RuntimeError: Another worker is listening on socket_path
+        """
+        if os.path.exists(socket_path):
+            if worker_listening(socket_path):
+                raise RuntimeError(f"A worker is already listening on {socket_path}")
+            os.unlink(socket_path)  # Stale socket from a previous worker
+        super().__init__(socket_path, _JobHandler)
+        self.socket_path = socket_path
+        self.job_lock = threading.Lock()
+        self.jobs_served = 0
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve(socket_path: str = SOCKET_PATH,
+          cache_mb: int = DEFAULT_CACHE_MB,
+          segments: int = DEFAULT_SEGMENTS):
+    """Warm up, then serve jobs until interrupted.
+
+    Args:
+        socket_path: Unix socket to listen on
+        cache_mb: Memory limit of the mix graph node cache
+        segments: Number of decoded sources kept in memory
+    """
+    if worker_listening(socket_path):
+        raise RuntimeError(f"A worker is already listening on {socket_path}")
+    start = time.perf_counter()
+    warm_up()
+    enable_render_caches(cache_mb, segments)
+    print(f"Warmed up in {time.perf_counter() - start:.1f}s")
+
+    with MixWorker(socket_path) as server:
+        print(f"Listening on {socket_path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print(f"\nStopped after {server.jobs_served} jobs")
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Options: --socket=/tmp/rainybird-worker.sock --cache-mb=2048 --segments=16
+    options = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    if any(not a.startswith("--") or "=" not in a for a in sys.argv[1:]):
+        print("Usage: python mix_worker.py [--socket=PATH] [--cache-mb=2048] [--segments=16]")
+        sys.exit(1)
+
+    serve(options.get("socket", SOCKET_PATH),
+          int(options.get("cache-mb", DEFAULT_CACHE_MB)),
+          int(options.get("segments", DEFAULT_SEGMENTS)))
@@ -0,0 +1,337 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from scipy import signal
+from urllib.parse import parse_qsl
+from typing import Dict, Iterator, Optional
+
+# Procedural noise beds
+# Seeded, unbounded white/pink/brown noise and rain/crackle textures, so a
+# broadband bed layer needs no decoding or looping of multi-megabyte
+# recordings. The bed is Gaussian noise through a tilt filter (pole/zero pairs
+# spaced evenly on a log frequency axis give any slope between -6 and +6
+# dB/octave), the textures add Poisson-scheduled droplet/crackle transients,
+# and a soft limiter bounds the peaks. Each transient is an exponentially
+# decaying noise burst; as the bursts are independent, their sum is rendered
+# as one noise carrier shaped by the square root of the summed burst power
+# (an impulse train of event energies through a one-pole decay), which costs
+# the same for a few crackles or hundreds of droplets per second. The stream is cut into fixed chunks whose noise and events are drawn
+# from generators seeded with (seed, chunk index), and the tilt filter is run
+# in from silence over a short warm-up before each read, so any window can be
+# read in any order (and from several threads) at a cost that only depends
+# on its length, and the output does not depend on how it is cut into blocks.
+#
+# Layers are given as specs wherever a sound file path is accepted, e.g.
+# "noise:pink", "noise:rain?seed=3" or "noise:brown?flatness=0.2&level=-24".
+
+NOISE_PREFIX = "noise:"
+DEFAULT_RATE = 44100
+DEFAULT_LEVEL = -20.0       # RMS level in dBFS
+CREST_DB = 18.0             # Output is limited to this far above the RMS level
+LIMIT_KNEE_DB = 6.0         # The limiter starts this far below the ceiling
+BLOCK_FRAMES = 65536        # Default block of blocks()
+CHUNK_FRAMES = 16384        # Frames per seeded chunk
+WARMUP_S = 0.5              # Tilt filter run-in before a read (its slowest pole decays by ~e^-30)
+WHITE_CACHE_CHUNKS = 16     # Recent noise chunks kept for sequential reads
+LEVEL_EXCERPT_S = 30        # Output measured by levels()
+SECTIONS_PER_DECADE = 3     # Tilt filter pole/zero pairs
+TILT_RANGE = (10.0, 20000.0)  # Hz, frequency range of the tilt
+
+COLORS = {"white": 0.0, "pink": -3.01, "brown": -6.02}  # Slope in dB/octave
+
+# Texture parameters: bed slope, events per second, event level relative to
+# the bed (dB), event decay (ms), amplitude spread (lognormal sigma), bright
+# (high-passed) event bursts
+TEXTURES = {
+    "rain": {"tilt_db": -2.0, "rate": 600.0, "event_db": -3.0, "event_ms": 8.0, "spread": 0.9, "bright": True},
+    "crackle": {"tilt_db": -6.02, "rate": 8.0, "event_db": 3.0, "event_ms": 2.0, "spread": 1.3, "bright": False},
+}
+
+# Measured levels: (options, FIR bytes) -> {"rms_dbfs": ..., "peak_dbfs": ...}
+_level_cache: Dict[tuple, Dict[str, float]] = {}
+
+
+def is_noise_spec(path: Optional[str]) -> bool:
+    """True if path is a procedural noise spec instead of a file"""
+    return bool(path) and path.startswith(NOISE_PREFIX)
+
+
+def parse_noise_spec(spec: str) -> Dict:
+    """Parse "noise:<kind>?key=value&..." into NoiseGenerator arguments.
+
+    Keys: seed, tilt (dB/octave), flatness (target, overrides tilt),
+    level (dBFS RMS), rate (events/s), events (event level in dB)
+    """
+    if not is_noise_spec(spec):
+        raise ValueError(f"Not a noise spec: {spec}")
+    kind, _, query = spec[len(NOISE_PREFIX):].partition("?")
+    if kind not in COLORS and kind not in TEXTURES:
+        raise ValueError(f"Unknown noise kind '{kind}', choose from {', '.join([*COLORS, *TEXTURES])}")
+    names = {"seed": "seed", "tilt": "tilt_db", "flatness": "flatness", "level": "level_dbfs",
+             "rate": "rate", "events": "event_db"}
+    options = {"kind": kind}
+    for key, value in parse_qsl(query):
+        if key not in names:
+            raise ValueError(f"Unknown noise option '{key}' in {spec}")
+        options[names[key]] = int(value) if key == "seed" else float(value)
+    return options
+
+
+def tilt_sos(tilt_db: float, sample_rate: int) -> np.ndarray:
+    """Filter with a constant spectral slope of tilt_db dB/octave (clamped to +-6.02).
+
+    Each section has a pole and a zero a fraction of the pole spacing apart;
+    together they approximate a fractional-order integrator (pink: half).
+    """
+    beta = float(np.clip(-tilt_db / (20 * np.log10(2)), -1.0, 1.0))
+    f_lo, f_hi = TILT_RANGE[0], min(TILT_RANGE[1], 0.45 * sample_rate)
+    count = max(1, int(np.ceil(np.log10(f_hi / f_lo) * SECTIONS_PER_DECADE)))
+    poles = np.geomspace(f_lo, f_hi, count)
+    zeros = poles * 10 ** (beta / SECTIONS_PER_DECADE)
+    z, p, k = signal.bilinear_zpk(-2 * np.pi * zeros, -2 * np.pi * poles, 1.0, sample_rate)
+    return signal.zpk2sos(z, p, k)
+
+
+def _power_response(sos: np.ndarray, n_fft: int = 2048) -> np.ndarray:
+    """|H|^2 on the rfft bins of an n_fft frame"""
+    _, h = signal.sosfreqz(sos, worN=np.linspace(0, np.pi, n_fft // 2 + 1))
+    return np.abs(h) ** 2
+
+
+def predicted_flatness(tilt_db: float, sample_rate: int, n_fft: int = 2048) -> float:
+    """Expected signal_analysis.compute_spectral_flatness of Gaussian noise with this tilt.
+
+    Per STFT frame the periodogram of Gaussian noise is |H|^2 times
+    exponentially distributed bins, whose log-mean is -Euler's constant.
+    """
+    power = _power_response(tilt_sos(tilt_db, sample_rate), n_fft)
+    return float(np.exp(np.mean(np.log(power + 1e-20)) - np.euler_gamma) / np.mean(power))
+
+
+def fit_tilt(target_flatness: float, sample_rate: int = DEFAULT_RATE, n_fft: int = 2048) -> float:
+    """Tilt in dB/octave (between brown and white) whose noise has target_flatness.
+
+    Targets above white noise's flatness (~0.56) give white noise, targets
+    below brown noise's give brown noise.
+    """
+    lo, hi = COLORS["brown"], COLORS["white"]
+    if target_flatness >= predicted_flatness(hi, sample_rate, n_fft):
+        return hi
+    if target_flatness <= predicted_flatness(lo, sample_rate, n_fft):
+        return lo
+    for _ in range(30):
+        mid = (lo + hi) / 2
+        if predicted_flatness(mid, sample_rate, n_fft) < target_flatness:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def _soft_limit(x: np.ndarray, knee: float, ceiling: float) -> np.ndarray:
+    """Leave |x| <= knee unchanged and bend larger values smoothly towards ceiling, in place"""
+    over = np.abs(x) > knee
+    if over.any():
+        values = x[over]
+        room = ceiling - knee
+        x[over] = np.sign(values) * (knee + room * np.tanh((np.abs(values) - knee) / room))
+    return x
+
+
+class NoiseGenerator:
+    def __init__(self,
+                 kind: str = "pink",
+                 sample_rate: int = DEFAULT_RATE,
+                 channels: int = 2,
+                 seed: int = 0,
+                 tilt_db: Optional[float] = None,
+                 flatness: Optional[float] = None,
+                 level_dbfs: float = DEFAULT_LEVEL,
+                 rate: Optional[float] = None,
+                 event_db: Optional[float] = None,
+                 fir: Optional[np.ndarray] = None):
+        """Seeded, unbounded noise stream with random access.
+
+        Args:
+            kind: "white", "pink", "brown", "rain" or "crackle"
+            sample_rate, channels: Output format
+            seed: Same seed, same stream
+            tilt_db: Bed slope in dB/octave (default: from kind)
+            flatness: Target spectral flatness; fits tilt_db (see fit_tilt)
+            level_dbfs: Nominal RMS level of the output (levels() reports the measured one)
+            rate: Transient events per second (textures; 0 disables)
+            event_db: Transient level relative to the bed
+            fir: Optional FIR applied to the output (e.g. an auto-balance EQ)
+        """
+        self.options = {k: v for k, v in locals().items() if k not in ("self", "__class__")}
+        texture = TEXTURES.get(kind, {"tilt_db": COLORS.get(kind, 0.0), "rate": 0.0, "event_db": 0.0,
+                                      "event_ms": 1.0, "spread": 0.0, "bright": False})
+        if flatness is not None:
+            tilt_db = fit_tilt(flatness, sample_rate)
+        self.tilt_db = texture["tilt_db"] if tilt_db is None else tilt_db
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.seed = seed
+        self.level_dbfs = level_dbfs
+        self.rate = texture["rate"] if rate is None else rate
+        self.event_db = texture["event_db"] if event_db is None else event_db
+        self.spread = texture["spread"]
+        self.fir = fir
+
+        # Unit-variance bed; the tilt filter settles within the warm-up chunks
+        self.sos = tilt_sos(self.tilt_db, sample_rate)
+        self.bed_scale = 1 / np.sqrt(np.mean(_power_response(self.sos, 8192)))
+        self.warmup = int(np.ceil(WARMUP_S * sample_rate / CHUNK_FRAMES))
+
+        # Transient bursts decay by exp(-t / event_ms); their power envelope by twice that
+        self.decay = np.exp(-2 / (texture["event_ms"] / 1000 * sample_rate))
+        self.bright = texture["bright"]
+        # Mean event power (lognormal amplitudes) matches event_db relative to the bed
+        event_power = 10 ** (self.event_db / 10) if self.rate > 0 else 0.0
+        if self.rate > 0:
+            self.event_scale = np.sqrt(event_power * sample_rate / (self.rate * np.exp(2 * self.spread ** 2)))
+        self.output_scale = 10 ** (level_dbfs / 20) / np.sqrt(1 + event_power)
+        self.ceiling = 10 ** ((level_dbfs + CREST_DB) / 20)
+        self.knee = self.ceiling * 10 ** (-LIMIT_KNEE_DB / 20)
+
+        self._white_cache: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_spec(cls, spec: str, sample_rate: int = DEFAULT_RATE, channels: int = 2) -> "NoiseGenerator":
+        """Generator for a "noise:<kind>?..." spec (see parse_noise_spec)"""
+        return cls(sample_rate=sample_rate, channels=channels, **parse_noise_spec(spec))
+
+    def _white(self, chunk: int) -> np.ndarray:
+        """Gaussian noise of one chunk, drawn from its own (seed, chunk) generator"""
+        if chunk < 0:
+            return np.zeros((CHUNK_FRAMES, self.channels))
+        with self._lock:
+            white = self._white_cache.get(chunk)
+            if white is not None:
+                self._white_cache.move_to_end(chunk)
+                return white
+        white = np.random.default_rng([self.seed, 0, chunk]).standard_normal((CHUNK_FRAMES, self.channels))
+        with self._lock:
+            self._white_cache[chunk] = white
+            while len(self._white_cache) > WHITE_CACHE_CHUNKS:
+                self._white_cache.popitem(last=False)
+        return white
+
+    def _events(self, chunk: int):
+        """Poisson events starting in one chunk: (frames, (channels, n) amplitudes)"""
+        rng = np.random.default_rng([self.seed, 1, chunk])
+        count = rng.poisson(self.rate * CHUNK_FRAMES / self.sample_rate)
+        times = chunk * CHUNK_FRAMES + rng.integers(0, CHUNK_FRAMES, count)
+        amp = np.exp(self.spread * rng.standard_normal(count)) * self.event_scale
+        if self.channels == 2:
+            pan = rng.uniform(0, np.pi / 2, count)
+            gains = np.stack([np.cos(pan), np.sin(pan)]) * np.sqrt(2)  # Equal power pan
+        else:
+            gains = np.ones((self.channels, count))
+        return times, gains * amp
+
+    def _transients(self, chunk: int) -> np.ndarray:
+        """Transients sounding in one chunk (events of the chunk and tails of the previous one)"""
+        if chunk < 0:
+            return np.zeros((CHUNK_FRAMES, self.channels))
+        # Event energies on the previous and this chunk, through the burst
+        # power decay (unit gain for the total energy of a burst)
+        first = max(chunk - 1, 0)
+        times, amps = (np.concatenate(parts, axis=-1)
+                       for parts in zip(*(self._events(c) for c in range(first, chunk + 1))))
+        frames = (chunk + 1 - first) * CHUNK_FRAMES
+        energy = np.stack([np.bincount(times - first * CHUNK_FRAMES, amps[channel] ** 2, minlength=frames)
+                           for channel in range(self.channels)], axis=1)
+        power = signal.lfilter([1 - self.decay], [1, -self.decay], energy, axis=0)[-CHUNK_FRAMES:]
+        carrier = np.random.default_rng([self.seed, 3, chunk]).standard_normal((CHUNK_FRAMES + 1, self.channels))
+        carrier = np.diff(carrier, axis=0) / np.sqrt(2) if self.bright else carrier[1:]
+        return carrier * np.sqrt(power)
+
+    def _chunks(self, first: int, last: int) -> np.ndarray:
+        """Output of chunks [first, last) before the FIR"""
+        white = np.concatenate([self._white(c) for c in range(first - self.warmup, last)])
+        bed = signal.sosfilt(self.sos, white, axis=0)[self.warmup * CHUNK_FRAMES:]
+        bed *= self.bed_scale
+        if self.rate > 0:
+            for i, chunk in enumerate(range(first, last)):
+                bed[i * CHUNK_FRAMES:(i + 1) * CHUNK_FRAMES] += self._transients(chunk)
+        bed *= self.output_scale
+        if first < 0:
+            bed[:-first * CHUNK_FRAMES] = 0.0  # Nothing plays before the start of the stream
+        return _soft_limit(bed, self.knee, self.ceiling)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Frames [start, stop) of the stream, shape (frames, channels).
+
+        Any window can be read in any order; its cost only depends on its length.
+        """
+        history = 0 if self.fir is None else len(self.fir) - 1
+        first = (start - history) // CHUNK_FRAMES
+        last = -(-stop // CHUNK_FRAMES)
+        offset = start - history - first * CHUNK_FRAMES
+        out = self._chunks(first, last)[offset:offset + stop - start + history]
+        if self.fir is not None:
+            out = signal.oaconvolve(out, self.fir[:, np.newaxis], mode="valid", axes=0)
+        return out.astype(np.float32)
+
+    def blocks(self, block_frames: int = BLOCK_FRAMES) -> Iterator[np.ndarray]:
+        """Unbounded stream of (block_frames, channels) blocks from the start"""
+        position = 0
+        while True:
+            yield self.read(position, position + block_frames)
+            position += block_frames
+
+    def excerpt(self, frames: int) -> np.ndarray:
+        """The first frames of the stream"""
+        return self.read(0, frames)
+
+    def with_fir(self, fir: Optional[np.ndarray]) -> "NoiseGenerator":
+        """The same stream filtered by fir"""
+        if fir is None:
+            return self
+        return NoiseGenerator(**{**self.options, "fir": fir})
+
+    def levels(self) -> Dict[str, float]:
+        """Measured RMS level and a peak bound, like gain_staging.measure_levels, without rendering.
+
+        The RMS is measured on LEVEL_EXCERPT_S of output (transient peaks lose
+        energy in the limiter, so it can be below level_dbfs) and cached.
+        """
+        fir = self.options["fir"]
+        key = (tuple((k, v) for k, v in sorted(self.options.items()) if k != "fir"),
+               None if fir is None else np.asarray(fir).tobytes())
+        levels = _level_cache.get(key)
+        if levels is None:
+            rms = np.sqrt(np.mean(np.square(self.excerpt(int(LEVEL_EXCERPT_S * self.sample_rate)),
+                                            dtype=np.float64)))
+            gain = 1.0 if fir is None else float(np.sum(np.abs(fir)))
+            levels = {
+                "rms_dbfs": float(20 * np.log10(rms + 1e-12)),
+                "peak_dbfs": float(20 * np.log10(self.ceiling * gain))
+            }
+            _level_cache[key] = levels
+        return levels
+
+
+if __name__ == "__main__":
+    import sys
+    from gain_staging import array_to_segment
+    from signal_analysis import compute_spectral_flatness
+
+    args = sys.argv[1:]
+    if not args or not is_noise_spec(args[0]):
+        print("Usage: python noise_generator.py <noise:kind?seed=0&tilt=-3&flatness=0.3&level=-20> [duration_s] [output.wav]")
+        print(f"Kinds: {', '.join([*COLORS, *TEXTURES])}")
+        print("Example: python noise_generator.py 'noise:rain?seed=3' 30 results/rain.wav")
+        sys.exit(1)
+
+    generator = NoiseGenerator.from_spec(args[0])
+    duration_s = float(args[1]) if len(args) > 1 else 30
+    samples = generator.read(0, int(duration_s * generator.sample_rate))
+    print(f"Tilt: {generator.tilt_db:+.2f} dB/octave, predicted bed flatness "
+          f"{predicted_flatness(generator.tilt_db, generator.sample_rate):.4f}")
+    print(f"Measured spectral flatness: {compute_spectral_flatness(samples.mean(axis=1)):.4f}")
+    if len(args) > 2:
+        array_to_segment(samples, generator.sample_rate).export(args[2], format="wav")
+        print(f"Saved {args[2]}")
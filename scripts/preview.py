@@ -0,0 +1,142 @@
+import os
+import time
+import numpy as np
+from math import gcd
+from scipy import signal, stats
+from typing import Dict, List, Optional, Tuple
+from gain_staging import array_to_segment
+from mix_recipe import render_window
+from signal_analysis import compute_spectral_flatness
+
+# Low-fidelity preview
+# Renders only a few representative windows of a planned mix (intro/outro
+# crossfades, the first bird call, the bed) with mix_recipe.render_window,
+# down-mixes them to mono at a reduced sample rate and runs a reduced metric
+# set. The cost depends on the window count, not on the mix duration, and
+# the plan is reused for the full render, so the sources are decoded once.
+# The bed is scaled by the plan's estimated normalization (the exact one
+# needs a pass over the whole bed), so levels can differ slightly from the
+# full render.
+
+PREVIEW_RATE = 11025   # Hz
+WINDOW_MS = 10000      # Length of each preview window
+JOIN_FADE_MS = 150     # Fade between concatenated windows
+
+
+def preview_windows(plan: Dict, window_ms: int = WINDOW_MS) -> List[Tuple[str, int]]:
+    """Pick (label, start frame) windows that cover the interesting parts of a planned mix.
+
+    Args:
+        plan: Plan from mix_recipe.plan_mix
+        window_ms: Window length
+
+    Returns:
+        Sorted, non-overlapping windows on the final timeline
+    """
+    frame_rate, total = plan["frame_rate"], plan["frames"]
+    window = window_ms * frame_rate // 1000
+    candidates = []
+    if plan["intro"] is not None:
+        candidates.append(("intro crossfade", plan["offset"] + plan["fade_in"] // 2 - window // 2))
+    if plan["call_positions"]:
+        candidates.append(("bird call", plan["offset"] + plan["call_positions"][0] - window // 4))
+    if plan["outro"] is not None:
+        candidates.append(("outro crossfade", plan["outro_start"] + plan["fade_out"] // 2 - window // 2))
+    candidates.append(("bed", plan["offset"] + plan["bed_frames"] // 2 - window // 2))
+
+    windows = []
+    for label, start in sorted(candidates, key=lambda c: c[1]):
+        start = int(min(max(0, start), max(0, total - window)))
+        if windows and start < windows[-1][1] + window:
+            continue  # Already covered by the previous window
+        windows.append((label, start))
+    return windows
+
+
+def preview_metrics(samples: np.ndarray, sample_rate: int) -> Dict:
+    """Reduced metric set: flatness and moments (no KS test, autocorrelation or plots)"""
+    return {
+        "spectral_flatness": compute_spectral_flatness(samples, n_fft=1024),
+        "rms_dbfs": float(20 * np.log10(np.sqrt(np.mean(np.square(samples))) + 1e-12)),
+        "std": float(np.std(samples)),
+        "skewness": float(stats.skew(samples)),
+        "kurtosis": float(stats.kurtosis(samples))
+    }
+
+
+def _downsample(samples: np.ndarray, frame_rate: int) -> np.ndarray:
+    """Mono downmix at PREVIEW_RATE"""
+    mono = samples.mean(axis=1)
+    g = gcd(frame_rate, PREVIEW_RATE)
+    return signal.resample_poly(mono, PREVIEW_RATE // g, frame_rate // g).astype(np.float32)
+
+
+def render_preview(plan: Dict, output_path: Optional[str] = None, window_ms: int = WINDOW_MS) -> Dict:
+    """Render a fast low-fidelity preview of a planned mix.
+
+    Args:
+        plan: Plan from mix_recipe.plan_mix; pass the same plan to the full
+            render to hear the same mix
+        output_path: Optional WAV path for listening to the excerpt
+        window_ms: Window length
+
+    Returns:
+        Dictionary with the windows, per-window and overall metrics, the
+        seed, the plan time (decoding and planning, see plan_mix), the render
+        time including it and the output path
+    """
+    start_time = time.perf_counter()
+    frame_rate = plan["frame_rate"]
+    window = window_ms * frame_rate // 1000
+    fade = JOIN_FADE_MS * PREVIEW_RATE // 1000
+    ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+
+    windows, pieces = [], []
+    for label, start in preview_windows(plan, window_ms):
+        piece = _downsample(render_window(plan, start, start + window), frame_rate)
+        if len(piece) > 2 * fade:
+            piece[:fade] *= ramp
+            piece[-fade:] *= ramp[::-1]
+        pieces.append(piece)
+        windows.append({
+            "label": label,
+            "start_s": start / frame_rate,
+            "metrics": preview_metrics(piece, PREVIEW_RATE)
+        })
+    excerpt = np.concatenate(pieces)
+
+    if output_path:
+        os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+        array_to_segment(excerpt, PREVIEW_RATE).export(output_path, format="wav")
+
+    return {
+        "seed": plan["seed"],
+        "windows": windows,
+        "metrics": preview_metrics(excerpt, PREVIEW_RATE),
+        "plan_time": plan["plan_time"],
+        "render_time": plan["plan_time"] + time.perf_counter() - start_time,
+        "output_path": output_path
+    }
+
+
+def print_preview_report(preview: Dict):
+    """Print the preview windows and metrics"""
+    print(f"\nPreview rendered in {preview['render_time']:.2f}s "
+          f"({preview['plan_time']:.2f}s decoding and planning, seed {preview['seed']})")
+    if preview["output_path"]:
+        print(f"Listen: {preview['output_path']}")
+    for w in preview["windows"]:
+        m = w["metrics"]
+        print(f"  {w['label']:>16} @ {w['start_s']:7.1f}s  flatness {m['spectral_flatness']:.4f}  "
+              f"RMS {m['rms_dbfs']:6.1f} dBFS  kurtosis {m['kurtosis']:.2f}")
+    m = preview["metrics"]
+    print(f"  {'overall':>16}            flatness {m['spectral_flatness']:.4f}  "
+          f"RMS {m['rms_dbfs']:6.1f} dBFS  kurtosis {m['kurtosis']:.2f}")
+
+
+def confirm(prompt: str = "Accept preview and render the full mix? [y/N] ") -> bool:
+    """Ask for confirmation; non-interactive runs count as no"""
+    try:
+        return input(prompt).strip().lower() in ("y", "yes")
+    except EOFError:
+        return False
@@ -0,0 +1,22 @@
+# Render caches of long-running workers
+# Defaults and setup shared by mix_worker (warm socket daemon) and job_queue
+# (shared-filesystem workers): the memory limit of the mix graph renderer's
+# node cache and the number of decoded sources kept in memory. Importing
+# this module is cheap; the mixer modules are only loaded when the caches
+# are enabled.
+
+DEFAULT_CACHE_MB = 2048   # Mix graph node cache
+DEFAULT_SEGMENTS = 16     # Decoded sources kept in memory
+
+
+def enable_render_caches(cache_mb: int = DEFAULT_CACHE_MB, segments: int = DEFAULT_SEGMENTS):
+    """Bound the shared mix graph renderer's node cache and keep decoded sources in memory
+
+    Args:
+        cache_mb: Memory limit of mix_graph.default_renderer's node cache
+        segments: Number of decoded sources kept by gain_staging.load_segment
+    """
+    from gain_staging import enable_segment_cache
+    from mix_graph import default_renderer
+    default_renderer.max_cache_bytes = cache_mb * 2 ** 20
+    enable_segment_cache(segments)
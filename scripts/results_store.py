@@ -0,0 +1,279 @@
+import os
+import io
+import json
+import fcntl
+import shutil
+import tempfile
+import numpy as np
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# Results storage
+# Compact mode keeps the raw analysis arrays of every component of a mix in a
+# single compressed .npz instead of two 300-dpi PNGs and indented JSON per
+# component. Figures are rendered from the arrays only when someone asks for
+# them. Every write goes to a temp file in the target directory followed by
+# os.replace, so concurrent batch workers never leave half-written results.
+
+COMPACT_FILENAME = "analysis.npz"
+
+# mkstemp creates 0600 files; results are readable like files written by open()
+# under the usual 022 umask (set explicitly: reading the umask means changing it)
+RESULT_FILE_MODE = 0o644
+
+
+def _atomic_write(path: str, write):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp_path, RESULT_FILE_MODE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write_json(path: str, data: Dict, indent: Optional[int] = 4):
+    """Write JSON to path atomically"""
+    payload = json.dumps(data, indent=indent, ensure_ascii=False).encode("utf-8")
+    _atomic_write(path, lambda f: f.write(payload))
+
+
+def atomic_savefig(path: str, **kwargs):
+    """Save the current matplotlib figure to path atomically"""
+    import matplotlib.pyplot as plt
+    buffer = io.BytesIO()
+    plt.savefig(buffer, format=os.path.splitext(path)[1][1:] or "png", **kwargs)
+    _atomic_write(path, lambda f: f.write(buffer.getvalue()))
+
+
+def atomic_savez(path: str, **arrays):
+    """Write a compressed npz atomically"""
+    _atomic_write(path, lambda f: np.savez_compressed(f, **arrays))
+
+
+@contextmanager
+def locked(path: str):
+    """Hold an exclusive lock on path + ".lock" (read-modify-write of shared files)"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def publish_directory(staging_dir: str, target_dir: str):
+    """Move a finished result directory into place, replacing any previous one.
+
+    staging_dir must be on the same filesystem as target_dir; readers never
+    see a partially written directory. Replacing an existing directory takes
+    two renames, so in between target_dir is briefly missing and readers
+    that find it missing should retry.
+    """
+    os.makedirs(os.path.dirname(target_dir) or ".", exist_ok=True)
+    try:
+        os.rename(staging_dir, target_dir)
+        return
+    except OSError:
+        if not os.path.isdir(target_dir):
+            raise
+    # Target exists: swap the old directory out, then drop it
+    old_dir = tempfile.mkdtemp(dir=os.path.dirname(target_dir) or ".", prefix=".old-")
+    os.rename(target_dir, os.path.join(old_dir, "result"))
+    os.rename(staging_dir, target_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+
+def _relocate(value, old_prefix: str, new_prefix: str):
+    if isinstance(value, str) and value.startswith(old_prefix):
+        return new_prefix + value[len(old_prefix):]
+    if isinstance(value, dict):
+        return {key: _relocate(item, old_prefix, new_prefix) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_relocate(item, old_prefix, new_prefix) for item in value]
+    return value
+
+
+def relocate_json_paths(directory: str, old_prefix: str, new_prefix: str):
+    """Rewrite paths starting with old_prefix in every JSON file under directory.
+
+    Used before publish_directory, so metadata written in a staging
+    directory points at the published files.
+    """
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            relocated = _relocate(data, old_prefix, new_prefix)
+            if relocated != data:
+                atomic_write_json(path, relocated)
+
+
+def save_compact_results(path: str, components: Dict[str, Dict]):
+    """Store analysis arrays and metadata of all components in one compressed npz.
+
+    Args:
+        path: Output .npz path
+        components: Component name -> {"metadata": dict, "arrays": {name: ndarray}}
+    """
+    entries = {}
+    for name, data in components.items():
+        entries[f"{name}/metadata"] = np.array(json.dumps(data["metadata"], ensure_ascii=False))
+        for key, value in data["arrays"].items():
+            entries[f"{name}/{key}"] = np.asarray(value)
+    atomic_savez(path, **entries)
+
+
+def load_compact_results(path: str) -> Dict[str, Dict]:
+    """Load a compact results file.
+
+    Returns:
+        Component name -> {"metadata": dict, "arrays": {name: ndarray}}
+    """
+    components = {}
+    with np.load(path) as data:
+        for key in data.files:
+            name, _, field = key.rpartition("/")
+            component = components.setdefault(name, {"metadata": {}, "arrays": {}})
+            if field == "metadata":
+                component["metadata"] = json.loads(str(data[key]))
+            else:
+                component["arrays"][field] = data[key]
+    return components
+
+
+def decimate_columns(spectrogram: np.ndarray, max_columns: int) -> np.ndarray:
+    """Average groups of power spectrogram frames down to at most max_columns"""
+    factor = -(-spectrogram.shape[1] // max_columns)
+    if factor <= 1:
+        return spectrogram
+    pad = (-spectrogram.shape[1]) % factor
+    padded = np.pad(spectrogram, ((0, 0), (0, pad)), mode="edge")
+    return padded.reshape(spectrogram.shape[0], -1, factor).mean(axis=2)
+
+
+def waveform_envelope(samples: np.ndarray, points: int = 4096) -> np.ndarray:
+    """Min/max envelope of samples, shape (2, <=points), for waveform plots"""
+    factor = max(1, -(-len(samples) // points))
+    pad = (-len(samples)) % factor
+    blocks = np.pad(samples, (0, pad)).reshape(-1, factor)
+    return np.stack([blocks.min(axis=1), blocks.max(axis=1)])
+
+
+def render_figures(arrays: Dict[str, np.ndarray],
+                   metadata: Dict,
+                   output_prefix: str,
+                   dpi: int = 150) -> Dict[str, str]:
+    """Render the analysis and noise analysis figures of one component from stored arrays.
+
+    Args:
+        arrays: Arrays of the component from load_compact_results()
+        metadata: Metadata of the component
+        output_prefix: Prefix for the PNG files (without suffix)
+        dpi: Resolution of the PNGs
+
+    Returns:
+        Dictionary with "analysis_image" and "noise_analysis_image" paths
+    """
+    import matplotlib.pyplot as plt
+    from scipy import stats
+
+    duration = metadata.get("duration", 0)
+    mel_db = 10 * np.log10(np.maximum(arrays["mel_spectrogram"], 1e-10))
+    mel_db -= mel_db.max()
+
+    # Waveform + mel spectrogram
+    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 8))
+    envelope = arrays["waveform_envelope"]
+    t = np.linspace(0, duration, envelope.shape[1])
+    ax1.fill_between(t, envelope[0], envelope[1], color='navy')
+    ax1.set_title("Waveform")
+    ax1.set_xlabel("Time [s]")
+    ax1.set_ylabel("Amplitude")
+    img = ax2.imshow(mel_db, origin="lower", aspect="auto", cmap="magma",
+                     extent=[0, duration, 0, mel_db.shape[0]])
+    fig.colorbar(img, ax=ax2, format='%+2.0f dB')
+    ax2.set_title("Mel Spectrogram")
+    ax2.set_xlabel("Time [s]")
+    ax2.set_ylabel("Mel band")
+    plt.tight_layout()
+    analysis_path = f"{output_prefix}_analysis.png"
+    atomic_savefig(analysis_path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+    # PSD, autocorrelation, distribution, spectrogram
+    fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(15, 10))
+    ax1.semilogy(arrays["psd_frequencies"], arrays["psd"])
+    ax1.set_title('Power Spectral Density')
+    ax1.set_xlabel('Frequency [Hz]')
+    ax1.set_ylabel('PSD [V**2/Hz]')
+    ax1.grid(True)
+
+    autocorr = arrays["autocorrelation"]
+    ax2.plot(np.arange(len(autocorr)), autocorr)
+    ax2.set_title('Autocorrelation Function')
+    ax2.set_xlabel('Lag')
+    ax2.set_ylabel('Correlation')
+    ax2.grid(True)
+
+    edges = arrays["histogram_edges"]
+    ax3.stairs(arrays["histogram_density"], edges, fill=True, alpha=0.7)
+    distribution = metadata.get("noise_analysis", {}).get("distribution_analysis", {})
+    x = np.linspace(edges[0], edges[-1], 100)
+    ax3.plot(x, stats.norm.pdf(x, distribution.get("mean", 0), distribution.get("std", 1) or 1),
+             'k', linewidth=2)
+    ax3.set_title('Sample Distribution')
+    ax3.set_xlabel('Amplitude')
+    ax3.set_ylabel('Density')
+    ax3.grid(True)
+
+    img = ax4.imshow(mel_db, origin="lower", aspect="auto",
+                     extent=[0, duration, 0, mel_db.shape[0]])
+    fig.colorbar(img, ax=ax4, format='%+2.0f dB')
+    ax4.set_title('Spectrogram (mel, decimated)')
+    ax4.set_xlabel('Time [s]')
+    ax4.set_ylabel('Mel band')
+
+    plt.tight_layout()
+    noise_path = f"{output_prefix}_noise_analysis.png"
+    atomic_savefig(noise_path, dpi=dpi, bbox_inches='tight')
+    plt.close()
+
+    return {"analysis_image": analysis_path, "noise_analysis_image": noise_path}
+
+
+def render_component(result_dir: str, component: str, dpi: int = 150) -> Dict[str, str]:
+    """Render the figures of one component of a compact results directory.
+
+    The PNGs are written next to where the non-compact mode would put them,
+    i.e. <result_dir>/<component>/<basename>_*.png.
+    """
+    components = load_compact_results(os.path.join(result_dir, COMPACT_FILENAME))
+    data = components[component]
+    base_name = os.path.splitext(data["metadata"]["filename"])[0]
+    prefix = os.path.join(result_dir, component, base_name)
+    return render_figures(data["arrays"], data["metadata"], prefix, dpi=dpi)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("Usage: python results_store.py <result_dir> [component ...]")
+        print("Example: python results_store.py results/mix_0214_2006 final_mix")
+        sys.exit(1)
+
+    result_dir = sys.argv[1]
+    names = sys.argv[2:] or list(load_compact_results(os.path.join(result_dir, COMPACT_FILENAME)))
+    for name in names:
+        paths = render_component(result_dir, name)
+        print(f"{name}: {paths['analysis_image']}, {paths['noise_analysis_image']}")
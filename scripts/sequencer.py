@@ -0,0 +1,355 @@
+import json
+import os
+import numpy as np
+from typing import Dict, Iterator, List, Optional
+from gain_staging import NORMALIZE_HEADROOM, db_to_gain, peak_bound, plan_gain_db
+from mix_recipe import TARGET_LEVEL, mix_bed, plan_ambient_layers
+from export_stage import DEFAULT_TARGETS, MultiFormatExporter, print_export_report
+from results_store import atomic_write_json
+from streaming_analysis import stream_pcm
+from ducking import Ducker
+
+# Chapter sequencer
+# Lays an ordered list of chapters (intros, narration, interludes, outro) over
+# one continuous ambient bed. The whole timeline is planned up front from the
+# chapter lengths: consecutive chapters overlap by their crossfade (or are
+# separated by a gap of bed only), and every chapter fades in and out with
+# equal-power sin/cos curves, so crossfaded pairs keep a constant power. The
+# programme is then rendered block by block straight into the encoders: at
+# most two chapters are decoded at a time, samples outside the fade regions
+# are only scaled, and the curves are computed for the overlap frames alone.
+# Chapters are decoded twice by ffmpeg in the programme format, block by
+# block: once while planning to measure their length and levels, and again
+# while they play. Neither pass keeps a whole chapter in memory, so memory
+# depends on the block size, not on the chapter lengths.
+
+CROSSFADE_MS = 4000    # Default chapter crossfade, as the intro/outro crossfade
+BED_DB = -12.0         # Bed level relative to the chapters
+BLOCK_MS = 10000
+
+
+def _frames(ms: float, frame_rate: int) -> int:
+    return int(ms) * frame_rate // 1000
+
+
+def load_playlist(path: str) -> Dict:
+    """Read a playlist JSON file.
+
+    Format:
+        {
+            "bed": {"forest": "...", "rain": "...", "fire": "..."},
+            "bed_db": -12, "crossfade_ms": 4000, "lead_ms": 0, "tail_ms": 0, "duck": false,
+            "chapters": [
+                {"path": "...", "role": "intro"},
+                {"path": "...", "role": "narration", "crossfade_ms": 6000, "gain_db": 2},
+                {"path": "...", "role": "interlude", "gap_ms": 3000},
+                ...
+            ]
+        }
+
+    Bed layers can be noise specs (see noise_generator). A chapter overlaps
+    the previous one by its crossfade_ms unless it has a gap_ms > 0, in which
+    case the bed plays alone in between and both chapters fade against it.
+    """
+    with open(path) as f:
+        playlist = json.load(f)
+    if not playlist.get("chapters"):
+        raise ValueError(f"{path}: playlist has no chapters")
+    return playlist
+
+
+def probe_chapter(path: str, frame_rate: int, channels: int, block_ms: int = BLOCK_MS) -> Dict:
+    """Length and levels of a chapter in the programme format, from one streaming pass.
+
+    Returns:
+        Dictionary with frames, rms_dbfs and peak_dbfs (see gain_staging.measure_levels)
+    """
+    frames, power, peak = 0, 0.0, 0.0
+    for block in stream_pcm(path, frame_rate, max(1, block_ms * frame_rate // 1000), channels):
+        flat = block.reshape(-1)
+        frames += len(block)
+        power += float(np.dot(flat, flat))
+        if flat.size:
+            peak = max(peak, float(flat.max()), float(-flat.min()))
+    rms = np.sqrt(power / (frames * channels)) if frames else 0.0
+    return {
+        "frames": frames,
+        "rms_dbfs": 20 * np.log10(rms) if rms > 0 else -float("inf"),
+        "peak_dbfs": 20 * np.log10(peak) if peak > 0 else -float("inf")
+    }
+
+
+def plan_chapters(entries: List[Dict], frame_rate: int, crossfade_ms: int = CROSSFADE_MS,
+                  lead_frames: int = 0, channels: int = 2) -> List[Dict]:
+    """Compute start, length, fades and gain of every chapter.
+
+    Returns:
+        List of chapter dicts with path, role, start, frames, fade_in,
+        fade_out (frames), gain_db and peak_dbfs
+    """
+    chapters = []
+    for entry in entries:
+        levels = probe_chapter(entry["path"], frame_rate, channels)
+        frames = levels["frames"]
+        fade = _frames(entry.get("crossfade_ms", crossfade_ms), frame_rate)
+        gap = _frames(entry.get("gap_ms", 0), frame_rate)
+        chapter = {
+            "path": entry["path"],
+            "role": entry.get("role", "chapter"),
+            "frames": frames,
+            "fade_out": min(fade, frames // 2),
+            "gain_db": plan_gain_db(levels, TARGET_LEVEL, entry.get("gain_db", 0.0)),
+            "peak_dbfs": levels["peak_dbfs"]
+        }
+        if not chapters:
+            chapter["start"] = lead_frames + gap
+            chapter["fade_in"] = min(fade, frames // 2)
+        else:
+            previous = chapters[-1]
+            previous_end = previous["start"] + previous["frames"]
+            if gap > 0:
+                chapter["start"] = previous_end + gap
+                chapter["fade_in"] = min(fade, frames // 2)
+                previous["fade_out"] = min(fade, previous["frames"] // 2)
+            else:
+                overlap = min(fade, frames // 2, previous["frames"] // 2)
+                chapter["start"] = previous_end - overlap
+                chapter["fade_in"] = previous["fade_out"] = overlap
+        chapters.append(chapter)
+    return chapters
+
+
+def chapter_peak_bound(chapters: List[Dict]) -> float:
+    """Upper bound of the chapter track's peak (equal-power pairs add as sqrt(a^2 + b^2))"""
+    peaks = [db_to_gain(c["peak_dbfs"] + c["gain_db"]) if np.isfinite(c["peak_dbfs"]) else 0.0
+             for c in chapters]
+    bound = max(peaks, default=0.0)
+    for i in range(1, len(chapters)):
+        if chapters[i]["start"] < chapters[i - 1]["start"] + chapters[i - 1]["frames"]:
+            bound = max(bound, float(np.hypot(peaks[i - 1], peaks[i])))
+    return bound
+
+
+def plan_programme(playlist: Dict, auto_balance: bool = False, duck: Optional[bool] = None) -> Dict:
+    """Plan bed layers and the chapter timeline of a playlist.
+
+    Returns:
+        Dictionary with frame_rate, channels, frames, bed (gain_staging plan),
+        chapters (see plan_chapters), scale and duck
+    """
+    bed = playlist["bed"]
+    plan, frame_rate, channels, _, levels = plan_ambient_layers(
+        bed["forest"], bed["rain"], bed["fire"], auto_balance
+    )
+    bed_db = playlist.get("bed_db", BED_DB)
+    plan = [(samples, gain_db + bed_db, fade_frames) for samples, gain_db, fade_frames in plan]
+
+    chapters = plan_chapters(
+        playlist["chapters"],
+        frame_rate,
+        playlist.get("crossfade_ms", CROSSFADE_MS),
+        _frames(playlist.get("lead_ms", 0), frame_rate),
+        channels
+    )
+    end = max(c["start"] + c["frames"] for c in chapters)
+
+    # Streamed, so scale by the peak bound instead of normalizing
+    bound = peak_bound((level["peak_dbfs"], gain_db) for level, (_, gain_db, _) in zip(levels, plan))
+    bound += chapter_peak_bound(chapters)
+    return {
+        "frame_rate": frame_rate,
+        "channels": channels,
+        "frames": end + _frames(playlist.get("tail_ms", 0), frame_rate),
+        "bed": plan,
+        "chapters": chapters,
+        "scale": db_to_gain(-NORMALIZE_HEADROOM) / bound if bound > 0 else 1.0,
+        "duck": playlist.get("duck", False) if duck is None else duck
+    }
+
+
+class ChapterReader:
+    def __init__(self, blocks: Iterator[np.ndarray], frames: int, channels: int):
+        """Sequential reader over decoded (frames, channels) blocks of one chapter.
+
+        Args:
+            blocks: Blocks in the programme format (e.g. from stream_pcm)
+            frames: Planned chapter length; a shorter stream is padded with silence
+            channels: Programme channels
+        """
+        self.blocks = blocks
+        self.frames = frames
+        self.channels = channels
+        self.position = 0  # Chapter frames returned so far
+        self.pending = np.zeros((0, channels), dtype=np.float32)
+
+    @classmethod
+    def open(cls, chapter: Dict, frame_rate: int, channels: int, block_frames: int) -> "ChapterReader":
+        """Decode a chapter in the programme format while it plays"""
+        return cls(stream_pcm(chapter["path"], frame_rate, block_frames, channels), chapter["frames"], channels)
+
+    def read(self, start: int, stop: int) -> np.ndarray:
+        """Chapter frames [start, stop); reads must continue where the previous one stopped"""
+        if start != self.position:
+            raise ValueError(f"{start} is not the next frame of the chapter ({self.position})")
+        count = min(stop, self.frames) - start
+        parts, have = [self.pending], len(self.pending)
+        while have < count:
+            block = next(self.blocks, None)
+            if block is None:
+                parts.append(np.zeros((count - have, self.channels), dtype=np.float32))
+                break
+            block = block.reshape(len(block), self.channels)
+            parts.append(block)
+            have += len(block)
+        data = np.concatenate(parts) if len(parts) > 1 else self.pending
+        self.pending = data[count:]
+        self.position += count
+        return data[:count]
+
+    def close(self):
+        """Stop decoding (e.g. when the programme stops early)"""
+        close = getattr(self.blocks, "close", None)
+        if close:
+            close()
+
+
+def add_chapter(block: np.ndarray, block_start: int, chapter: Dict, reader):
+    """Add the part of a chapter that falls into block, with its equal-power fades.
+
+    reader provides the chapter frames with read(start, stop) (see ChapterReader).
+    """
+    start = chapter["start"]
+    a = max(block_start, start)
+    b = min(block_start + len(block), start + chapter["frames"])
+    if a >= b:
+        return
+    chunk = reader.read(a - start, b - start) * db_to_gain(chapter["gain_db"])
+
+    # Curves only for the frames inside the fade regions
+    fade_in_end = start + chapter["fade_in"]
+    if a < fade_in_end:
+        stop = min(b, fade_in_end)
+        t = (np.arange(a, stop) - start + 0.5) / chapter["fade_in"]
+        chunk[:stop - a] *= np.sin(0.5 * np.pi * t)[:, np.newaxis]
+    fade_out_start = start + chapter["frames"] - chapter["fade_out"]
+    if b > fade_out_start:
+        first = max(a, fade_out_start)
+        t = (np.arange(first, b) - fade_out_start + 0.5) / chapter["fade_out"]
+        chunk[first - a:] *= np.cos(0.5 * np.pi * t)[:, np.newaxis]
+    block[a - block_start:b - block_start] += chunk
+
+
+def iter_programme(programme: Dict, block_ms: int = BLOCK_MS) -> Iterator[np.ndarray]:
+    """Render a planned programme block by block.
+
+    Yields:
+        Float blocks of shape (frames, channels)
+    """
+    frame_rate, channels, frames = programme["frame_rate"], programme["channels"], programme["frames"]
+    chapters = programme["chapters"]
+    block_frames = max(1, block_ms * frame_rate // 1000)
+    ducker = Ducker(frame_rate) if programme["duck"] else None
+    playing = {}  # Chapter index -> ChapterReader
+
+    try:
+        for block_start in range(0, frames, block_frames):
+            block_stop = min(block_start + block_frames, frames)
+            voice = np.zeros((block_stop - block_start, channels), dtype=np.float32)
+            for index, chapter in enumerate(chapters):
+                end = chapter["start"] + chapter["frames"]
+                if chapter["start"] >= block_stop or end <= block_start:
+                    continue
+                if index not in playing:
+                    playing[index] = ChapterReader.open(chapter, frame_rate, channels, block_frames)
+                add_chapter(voice, block_start, chapter, playing[index])
+                if end <= block_stop:
+                    playing.pop(index).close()
+
+            bed = mix_bed(programme["bed"], frames, channels, block_start, block_stop)
+            if ducker:
+                ducker.process(voice, bed)
+            bed += voice
+            bed *= programme["scale"]
+            yield bed
+    finally:
+        for reader in playing.values():
+            reader.close()
+
+
+def timeline(programme: Dict) -> List[Dict]:
+    """Chapter timeline in seconds (for chapter markers and reports)"""
+    rate = programme["frame_rate"]
+    return [{
+        "role": c["role"],
+        "path": c["path"],
+        "start": c["start"] / rate,
+        "end": (c["start"] + c["frames"]) / rate,
+        "fade_in": c["fade_in"] / rate,
+        "fade_out": c["fade_out"] / rate,
+        "gain_db": c["gain_db"]
+    } for c in programme["chapters"]]
+
+
+def render_programme(playlist: Dict,
+                     output_base: str,
+                     targets=DEFAULT_TARGETS,
+                     auto_balance: bool = False,
+                     duck: Optional[bool] = None,
+                     block_ms: int = BLOCK_MS) -> Dict:
+    """Plan a playlist and stream it into all target formats.
+
+    Also writes the timeline to <output_base>_timeline.json.
+
+    Returns:
+        Dictionary with "timeline", "duration" (seconds) and "exports"
+    """
+    programme = plan_programme(playlist, auto_balance, duck)
+    chapters = timeline(programme)
+    atomic_write_json(f"{output_base}_timeline.json", {"chapters": chapters})
+
+    exporter = MultiFormatExporter(output_base, programme["frame_rate"], programme["channels"], targets)
+    try:
+        for block in iter_programme(programme, block_ms):
+            exporter.write(block)
+    finally:
+        exports = exporter.close()
+    return {
+        "timeline": chapters,
+        "duration": programme["frames"] / programme["frame_rate"],
+        "exports": exports
+    }
+
+
+def print_timeline(chapters: List[Dict]):
+    """Print the chapter timeline"""
+    for c in chapters:
+        print(f"  {c['start'] / 60:7.2f} - {c['end'] / 60:7.2f} min  {c['role']:<10} "
+              f"{os.path.basename(c['path'])} ({c['gain_db']:+.1f} dB, fades {c['fade_in']:.1f}/{c['fade_out']:.1f}s)")
+
+
+if __name__ == "__main__":
+    import sys
+    import datetime
+
+    # Options: --formats=mp3:320k,opus:160k,flac --auto-balance --duck
+    options = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    flags = {a[2:] for a in sys.argv[1:] if a.startswith("--") and "=" not in a}
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+
+    if len(args) < 1:
+        print("Usage: python sequencer.py <playlist.json> [output_base] [--formats=mp3:320k,opus:160k,flac] [--auto-balance] [--duck]")
+        print("Example: python sequencer.py configs/reading_at_night.json results/reading_at_night")
+        sys.exit(1)
+
+    output_base = args[1] if len(args) > 1 else f"results/programme_{datetime.datetime.now().strftime('%m%d_%H%M')}"
+    result = render_programme(
+        load_playlist(args[0]),
+        output_base,
+        targets=options.get("formats", ",".join(DEFAULT_TARGETS)),
+        auto_balance="auto-balance" in flags,
+        duck=True if "duck" in flags else None
+    )
+    print(f"Programme of {result['duration'] / 60:.1f} min:")
+    print_timeline(result["timeline"])
+    print("Results are stored in:")
+    print_export_report(result["exports"])
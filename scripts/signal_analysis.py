@@ -3,13 +3,253 @@ from scipy import signal
 from scipy import stats
 import librosa
 import matplotlib.pyplot as plt
-from typing import Dict, Tuple, Optional
-import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Optional
+from results_store import atomic_savefig, atomic_write_json
 
 # Digital Signal Processing 
 # FSD analysis from ECE459: Communications Systems
 # Tony Wang - 2025-02-13 V1
 # 
+# The module level functions are the stateless core: they only read the
+# samples they are given (as read-only views), so they can run concurrently
+# in threads - the heavy NumPy/SciPy FFT and reduction calls release the GIL.
+# SignalAnalyzer is a thin stateful wrapper kept for plotting and old callers.
+
+DEFAULT_CONFIG = {
+    "psd_segment_length": 2048,
+    "psd_overlap": 0.5,
+    "flatness_n_fft": 2048,
+    "autocorr_max_lag": 1000,
+    "histogram_bins": 100,
+    "arrays": False  # Also return the arrays behind the plots
+}
+
+
+def readonly(samples: np.ndarray) -> np.ndarray:
+    """Return a read-only view of samples, so shared buffers cannot be modified"""
+    view = np.asarray(samples).view()
+    view.flags.writeable = False
+    return view
+
+
+def compute_psd(samples: np.ndarray,
+                sample_rate: int,
+                segment_length: int = 2048,
+                overlap: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute Power Spectral Density using Welch's method.
+
+    Args:
+        samples: Audio samples
+        sample_rate: Sample rate of samples
+        segment_length: Length of each segment for Welch's method
+        overlap: Overlap between segments (0 to 1)
+
+    Returns:
+        Tuple of (frequencies, psd)
+    """
+    return signal.welch(
+        samples,
+        sample_rate,
+        nperseg=segment_length,
+        noverlap=int(segment_length * overlap)
+    )
+
+
+def compute_psd_slope(frequencies: np.ndarray,
+                      psd: np.ndarray,
+                      f_min: float = 50.0,
+                      f_max: float = 16000.0) -> float:
+    """Fit the PSD slope in dB per octave (0 for white, about -3 for pink, -6 for brown noise).
+
+    Args:
+        frequencies: Frequency grid of the PSD
+        psd: Power spectral density
+        f_min, f_max: Frequency range of the fit
+
+    Returns:
+        Slope of the least-squares line through 10*log10(psd) over log2(f)
+    """
+    mask = (frequencies >= f_min) & (frequencies <= f_max) & (psd > 0)
+    if mask.sum() < 2:
+        return 0.0
+    slope, _ = np.polyfit(np.log2(frequencies[mask]), 10 * np.log10(psd[mask]), 1)
+    return float(slope)
+
+
+def compute_autocorrelation(samples: np.ndarray, max_lag: Optional[int] = None) -> np.ndarray:
+    """Compute autocorrelation function.
+
+    Args:
+        samples: Audio samples
+        max_lag: Maximum lag to compute (default: len(samples)//2)
+
+    Returns:
+        Autocorrelation values
+    """
+    if max_lag is None:
+        max_lag = len(samples) // 2
+
+    autocorr = signal.correlate(samples, samples, mode='full')
+    # Keep only positive lags and normalize
+    autocorr = autocorr[len(autocorr)//2:len(autocorr)//2 + max_lag]
+    return autocorr / autocorr[0]
+
+
+def compute_spectral_flatness(samples: np.ndarray, n_fft: int = 2048) -> float:
+    """Compute spectral flatness (Wiener entropy).
+
+    Args:
+        samples: Audio samples
+        n_fft: FFT window size
+
+    Returns:
+        Spectral flatness value (0 to 1)
+    """
+    spectrum = np.abs(librosa.stft(np.ascontiguousarray(samples), n_fft=n_fft))
+    power_spectrum = np.square(spectrum)
+
+    # Compute geometric and arithmetic means
+    geometric_mean = np.exp(np.mean(np.log(power_spectrum + 1e-10), axis=0))
+    arithmetic_mean = np.mean(power_spectrum, axis=0)
+
+    # Compute flatness and average over time
+    flatness = geometric_mean / (arithmetic_mean + 1e-10)
+    return float(np.mean(flatness))
+
+
+def compute_histogram(samples: np.ndarray, bins: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the sample amplitude histogram as a density.
+
+    Args:
+        samples: Audio samples
+        bins: Number of histogram bins
+
+    Returns:
+        Tuple of (density, bin_edges)
+    """
+    return np.histogram(samples, bins=bins, density=True)
+
+
+def analyze_distribution(samples: np.ndarray) -> Dict:
+    """Analyze the statistical distribution of the samples.
+
+    Returns:
+        Dictionary containing distribution statistics and test results
+    """
+    # Compute basic statistics
+    mean = np.mean(samples)
+    std = np.std(samples)
+    skewness = stats.skew(samples)
+    kurtosis = stats.kurtosis(samples)
+
+    # Perform Kolmogorov-Smirnov test for normality
+    ks_statistic, ks_pvalue = stats.kstest(
+        (samples - mean) / std,  # Normalize samples
+        'norm'  # Test against normal distribution
+    )
+
+    return {
+        "mean": float(mean),
+        "std": float(std),
+        "skewness": float(skewness),
+        "kurtosis": float(kurtosis),
+        "ks_test": {
+            "statistic": float(ks_statistic),
+            "p_value": float(ks_pvalue)
+        }
+    }
+
+
+def compute_analysis_arrays(samples: np.ndarray,
+                            sample_rate: int,
+                            config: Optional[Dict] = None) -> Dict[str, np.ndarray]:
+    """Compute the arrays behind the noise analysis plots.
+
+    Returns:
+        Dictionary with PSD, autocorrelation and histogram arrays
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    freqs, psd = compute_psd(samples, sample_rate, config["psd_segment_length"], config["psd_overlap"])
+    density, edges = compute_histogram(samples, config["histogram_bins"])
+    autocorr = compute_autocorrelation(samples, config["autocorr_max_lag"])
+    return {
+        "psd_frequencies": freqs.astype(np.float32),
+        "psd": psd.astype(np.float32),
+        "autocorrelation": autocorr.astype(np.float32),
+        "histogram_density": density.astype(np.float32),
+        "histogram_edges": edges.astype(np.float32)
+    }
+
+
+def analyze(samples: np.ndarray, sample_rate: int, config: Optional[Dict] = None) -> Dict:
+    """Run the noise analysis on one buffer without touching any shared state.
+
+    Args:
+        samples: Mono audio samples (only read)
+        sample_rate: Sample rate of samples
+        config: Overrides for DEFAULT_CONFIG
+
+    Returns:
+        Dictionary with "spectral_flatness", "distribution_analysis" and,
+        if config["arrays"], the plot arrays under "arrays"
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    samples = readonly(samples)
+    result = {
+        "spectral_flatness": compute_spectral_flatness(samples, config["flatness_n_fft"]),
+        "distribution_analysis": analyze_distribution(samples)
+    }
+    if config["arrays"]:
+        result["arrays"] = compute_analysis_arrays(samples, sample_rate, config)
+    return result
+
+
+def analyze_channels(samples: np.ndarray,
+                     sample_rate: int,
+                     config: Optional[Dict] = None,
+                     max_workers: Optional[int] = None) -> List[Dict]:
+    """Analyze every channel of a (frames, channels) buffer in a thread pool.
+
+    Returns:
+        List with one analyze() result per channel
+    """
+    samples = readonly(samples)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(
+            lambda ch: analyze(samples[:, ch], sample_rate, config),
+            range(samples.shape[1])
+        ))
+
+
+def analyze_windows(samples: np.ndarray,
+                    sample_rate: int,
+                    window_s: float = 10.0,
+                    config: Optional[Dict] = None,
+                    max_workers: Optional[int] = None) -> List[Dict]:
+    """Analyze consecutive windows of a mono buffer in a thread pool.
+
+    Args:
+        samples: Mono audio samples
+        sample_rate: Sample rate of samples
+        window_s: Window length in seconds (the last window may be shorter)
+        config: Overrides for DEFAULT_CONFIG
+        max_workers: Thread pool size (default: ThreadPoolExecutor's)
+
+    Returns:
+        List of analyze() results with the window "start" time in seconds added
+    """
+    samples = readonly(samples)
+    window = max(1, int(window_s * sample_rate))
+
+    def run(start):
+        result = analyze(samples[start:start + window], sample_rate, config)
+        result["start"] = start / sample_rate
+        return result
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, range(0, len(samples), window)))
+
 
 class SignalAnalyzer:
     def __init__(self):
@@ -19,93 +259,25 @@ class SignalAnalyzer:
         
     def load_samples(self, samples: np.ndarray, sample_rate: int):
         """Load audio samples and sample rate for analysis"""
-        self.samples = samples
+        self.samples = readonly(samples)
         self.sample_rate = sample_rate
         
     def compute_psd(self, segment_length: int = 2048, overlap: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
-        """Compute Power Spectral Density using Welch's method.
+        """Compute Power Spectral Density using Welch's method (see compute_psd)."""
+        return compute_psd(self.samples, self.sample_rate, segment_length, overlap)
         
-        Args:
-            segment_length: Length of each segment for Welch's method
-            overlap: Overlap between segments (0 to 1)
-            
-        Returns:
-            Tuple of (frequencies, psd)
-        """
-        frequencies, psd = signal.welch(
-            self.samples,
-            self.sample_rate,
-            nperseg=segment_length,
-            noverlap=int(segment_length * overlap)
-        )
-        return frequencies, psd
-    
     def compute_autocorrelation(self, max_lag: Optional[int] = None) -> np.ndarray:
-        """Compute autocorrelation function.
+        """Compute autocorrelation function (see compute_autocorrelation)."""
+        return compute_autocorrelation(self.samples, max_lag)
         
-        Args:
-            max_lag: Maximum lag to compute (default: len(samples)//2)
-            
-        Returns:
-            Autocorrelation values
-        """
-        if max_lag is None:
-            max_lag = len(self.samples) // 2
-            
-        autocorr = signal.correlate(self.samples, self.samples, mode='full')
-        # Keep only positive lags and normalize
-        autocorr = autocorr[len(autocorr)//2:len(autocorr)//2 + max_lag]
-        return autocorr / autocorr[0]
-    
     def compute_spectral_flatness(self, n_fft: int = 2048) -> float:
-        """Compute spectral flatness (Wiener entropy).
+        """Compute spectral flatness (see compute_spectral_flatness)."""
+        return compute_spectral_flatness(self.samples, n_fft)
         
-        Args:
-            n_fft: FFT window size
-            
-        Returns:
-            Spectral flatness value (0 to 1)
-        """
-        spectrum = np.abs(librosa.stft(self.samples, n_fft=n_fft))
-        power_spectrum = np.square(spectrum)
-        
-        # Compute geometric and arithmetic means
-        geometric_mean = np.exp(np.mean(np.log(power_spectrum + 1e-10), axis=0))
-        arithmetic_mean = np.mean(power_spectrum, axis=0)
-        
-        # Compute flatness and average over time
-        flatness = geometric_mean / (arithmetic_mean + 1e-10)
-        return float(np.mean(flatness))
-    
     def analyze_distribution(self) -> Dict:
-        """Analyze the statistical distribution of the samples.
+        """Analyze the statistical distribution of the samples (see analyze_distribution)."""
+        return analyze_distribution(self.samples)
         
-        Returns:
-            Dictionary containing distribution statistics and test results
-        """
-        # Compute basic statistics
-        mean = np.mean(self.samples)
-        std = np.std(self.samples)
-        skewness = stats.skew(self.samples)
-        kurtosis = stats.kurtosis(self.samples)
-        
-        # Perform Kolmogorov-Smirnov test for normality
-        ks_statistic, ks_pvalue = stats.kstest(
-            (self.samples - mean) / std,  # Normalize samples
-            'norm'  # Test against normal distribution
-        )
-        
-        return {
-            "mean": float(mean),
-            "std": float(std),
-            "skewness": float(skewness),
-            "kurtosis": float(kurtosis),
-            "ks_test": {
-                "statistic": float(ks_statistic),
-                "p_value": float(ks_pvalue)
-            }
-        }
-    
     def plot_noise_analysis(self, output_path: str):
         """Generate comprehensive noise analysis plots.
         
@@ -149,7 +321,7 @@ class SignalAnalyzer:
         ax4.set_title('Spectrogram')
         
         plt.tight_layout()
-        plt.savefig(output_path, dpi=300, bbox_inches='tight')
+        atomic_savefig(output_path, dpi=300, bbox_inches='tight')
         plt.close()
     
     def analyze_noise(self, output_path_prefix: str) -> Dict:
@@ -162,8 +334,9 @@ class SignalAnalyzer:
             Dictionary containing all analysis results
         """
         # Compute all metrics
-        spectral_flatness = self.compute_spectral_flatness()
-        distribution_stats = self.analyze_distribution()
+        metrics = analyze(self.samples, self.sample_rate)
+        spectral_flatness = metrics["spectral_flatness"]
+        distribution_stats = metrics["distribution_analysis"]
         
         # Generate plots
         plot_path = f"{output_path_prefix}_noise_analysis.png"
@@ -178,7 +351,6 @@ class SignalAnalyzer:
         
         # Save results to JSON
         json_path = f"{output_path_prefix}_noise_analysis.json"
-        with open(json_path, 'w') as f:
-            json.dump(results, f, indent=4)
+        atomic_write_json(json_path, results)
             
         return results 
\ No newline at end of file
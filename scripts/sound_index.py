@@ -0,0 +1,228 @@
+import os
+import time
+import numpy as np
+import librosa
+from pydub import AudioSegment
+from typing import Dict, List, Optional, Sequence
+from gain_staging import segment_to_array
+from results_store import atomic_savez
+from signal_analysis import compute_psd, compute_psd_slope, compute_spectral_flatness
+
+# Sound library index
+# One compact feature vector per file in sounds/ and voices/ (mel-band energy
+# profile, spectral flatness, PSD slope), extracted once and stored as a NumPy
+# matrix. Queries score the whole matrix at once, so finding the source that
+# best complements a mix takes milliseconds.
+
+INDEX_PATH = "results/sound_index.npz"
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".flac", ".wav", ".ogg", ".opus")
+INDEX_RATE = 22050      # Hz, sources are down-mixed and resampled before analysis
+MAX_SECONDS = 120       # Only the first two minutes are analyzed
+N_MELS = 32
+MIX_WEIGHTS_DB = np.array([-12.0, -6.0, 0.0])  # Candidate levels relative to the mix
+
+
+def extract_features(path: str) -> Dict:
+    """Extract the index features of one audio file.
+
+    Returns:
+        Dictionary with "mel_profile" (unit-sum band power densities),
+        "spectral_flatness" and "psd_slope" (dB/octave)
+    """
+    # ffmpeg stops after the excerpt, so long sources are not decoded in full
+    segment = AudioSegment.from_file(path, duration=MAX_SECONDS)[:MAX_SECONDS * 1000]
+    segment = segment.set_channels(1).set_frame_rate(INDEX_RATE)
+    samples = segment_to_array(segment)[:, 0]
+    # Slaney-normalized mel filters average the power density within each band
+    mel = librosa.feature.melspectrogram(y=samples, sr=INDEX_RATE, n_mels=N_MELS).mean(axis=1)
+    return {
+        "mel_profile": (mel / (mel.sum() + 1e-20)).astype(np.float32),
+        "spectral_flatness": compute_spectral_flatness(samples),
+        "psd_slope": compute_psd_slope(*compute_psd(samples, INDEX_RATE), f_max=INDEX_RATE / 2)
+    }
+
+
+def _scan(directories: Sequence[str]) -> List[str]:
+    paths = []
+    for directory in directories:
+        for root, _, files in os.walk(os.path.abspath(directory)):
+            paths += [os.path.join(root, f) for f in sorted(files)
+                      if f.lower().endswith(AUDIO_EXTENSIONS)]
+    return sorted(paths)
+
+
+def _under(path: str, directories: Sequence[str]) -> bool:
+    return any(path.startswith(os.path.join(os.path.abspath(d), "")) for d in directories)
+
+
+def load_index(index_path: str = INDEX_PATH) -> Optional[Dict[str, np.ndarray]]:
+    """Load the index, None if it has not been built yet"""
+    if not os.path.exists(index_path):
+        return None
+    with np.load(index_path) as data:
+        return {key: data[key] for key in data.files}
+
+
+def build_index(directories: Sequence[str] = ("sounds", "voices"),
+                index_path: str = INDEX_PATH) -> Dict[str, np.ndarray]:
+    """Index all audio files under directories; unchanged files are not re-analyzed.
+
+    Entries outside the given directories are kept, so rebuilding one
+    directory updates it without dropping the others. Paths are stored
+    absolute.
+
+    Returns:
+        The index arrays: paths, mtimes, sizes, mel_profiles, flatness, slope
+    """
+    previous = load_index(index_path) or {"paths": np.array([], dtype=str)}
+    known = {os.path.abspath(str(p)): i for i, p in enumerate(previous["paths"])}
+
+    rows = {"paths": [], "mtimes": [], "sizes": [], "mel_profiles": [], "flatness": [], "slope": []}
+
+    def add(path, mtime, size, features):
+        rows["paths"].append(path)
+        rows["mtimes"].append(mtime)
+        rows["sizes"].append(size)
+        rows["mel_profiles"].append(features["mel_profile"])
+        rows["flatness"].append(features["spectral_flatness"])
+        rows["slope"].append(features["psd_slope"])
+
+    def stored(i):
+        return {
+            "mel_profile": previous["mel_profiles"][i],
+            "spectral_flatness": previous["flatness"][i],
+            "psd_slope": previous["slope"][i]
+        }
+
+    for path, i in known.items():
+        if not _under(path, directories):
+            add(path, previous["mtimes"][i], previous["sizes"][i], stored(i))
+
+    for path in _scan(directories):
+        stat = os.stat(path)
+        i = known.get(path)
+        if i is not None and previous["mtimes"][i] == stat.st_mtime_ns and previous["sizes"][i] == stat.st_size:
+            features = stored(i)
+        else:
+            print(f"Indexing {path}")
+            try:
+                features = extract_features(path)
+            except Exception as e:
+                print(f"  skipped: {e}")
+                continue
+        add(path, stat.st_mtime_ns, stat.st_size, features)
+
+    index = {
+        "paths": np.array(rows["paths"], dtype=str),
+        "mtimes": np.array(rows["mtimes"], dtype=np.int64),
+        "sizes": np.array(rows["sizes"], dtype=np.int64),
+        "mel_profiles": np.array(rows["mel_profiles"], dtype=np.float32).reshape(-1, N_MELS),
+        "flatness": np.array(rows["flatness"], dtype=np.float32),
+        "slope": np.array(rows["slope"], dtype=np.float32)
+    }
+    atomic_savez(index_path, **index)
+    return index
+
+
+def profile_flatness(profiles: np.ndarray) -> np.ndarray:
+    """Flatness (geometric / arithmetic mean) of band profiles along the last axis"""
+    profiles = profiles + 1e-20
+    return np.exp(np.mean(np.log(profiles), axis=-1)) / np.mean(profiles, axis=-1)
+
+
+def score_complement(mix_profile: np.ndarray, mel_profiles: np.ndarray) -> Dict[str, np.ndarray]:
+    """Flatness of the mix with each candidate added at each level of MIX_WEIGHTS_DB.
+
+    Returns:
+        Dictionary with the best "flatness" and its "level_db" per candidate
+    """
+    weights = 10 ** (MIX_WEIGHTS_DB / 10)  # power ratios
+    combined = (mix_profile[np.newaxis, np.newaxis, :]
+                + weights[np.newaxis, :, np.newaxis] * mel_profiles[:, np.newaxis, :])
+    flatness = profile_flatness(combined)  # candidates x weights
+    best = flatness.argmax(axis=1)
+    return {
+        "flatness": flatness[np.arange(len(mel_profiles)), best],
+        "level_db": MIX_WEIGHTS_DB[best]
+    }
+
+
+def score_similarity(profile: np.ndarray, mel_profiles: np.ndarray) -> np.ndarray:
+    """Cosine similarity of log band profiles"""
+    query = np.log10(profile + 1e-12)
+    matrix = np.log10(mel_profiles + 1e-12)
+    query = query - query.mean()
+    matrix = matrix - matrix.mean(axis=1, keepdims=True)
+    return matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+
+
+def query_index(audio_path: str,
+                top: int = 5,
+                mode: str = "complement",
+                index_path: str = INDEX_PATH) -> List[Dict]:
+    """Rank indexed sources for an audio file (usually a mix).
+
+    Args:
+        audio_path: File to query with
+        top: Number of results
+        mode: "complement" (flattens the mix spectrum most) or "similar"
+        index_path: Index to search
+
+    Returns:
+        Ranked list of dictionaries with path, score and source features
+    """
+    index = load_index(index_path)
+    if index is None or len(index["paths"]) == 0:
+        raise FileNotFoundError(f"No sound index at {index_path}, run: python scripts/sound_index.py build")
+
+    features = extract_features(audio_path)
+    start = time.perf_counter()
+    profiles = index["mel_profiles"]
+    if mode == "similar":
+        scores = score_similarity(features["mel_profile"], profiles)
+        levels = np.zeros(len(scores))
+    else:
+        complement = score_complement(features["mel_profile"], profiles)
+        scores, levels = complement["flatness"], complement["level_db"]
+    same = np.array([os.path.abspath(p) == os.path.abspath(audio_path) for p in index["paths"]])
+    scores = np.where(same, -np.inf, scores)
+    ranking = np.argsort(-scores)[:top]
+    elapsed_ms = (time.perf_counter() - start) * 1000
+
+    return [{
+        "path": str(index["paths"][i]),
+        "score": float(scores[i]),
+        "level_db": float(levels[i]),
+        "spectral_flatness": float(index["flatness"][i]),
+        "psd_slope": float(index["slope"][i]),
+        "query_flatness": float(profile_flatness(features["mel_profile"])),
+        "scoring_ms": elapsed_ms
+    } for i in ranking]
+
+
+if __name__ == "__main__":
+    import sys
+
+    options = dict(a[2:].split("=", 1) for a in sys.argv[1:] if a.startswith("--") and "=" in a)
+    flags = {a[2:] for a in sys.argv[1:] if a.startswith("--") and "=" not in a}
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+
+    if not args or args[0] not in ("build", "query") or (args[0] == "query" and len(args) < 2):
+        print("Usage: python sound_index.py build [directory ...]")
+        print("       python sound_index.py query <audio_file> [--top=5] [--similar]")
+        print("Example: python sound_index.py query results/dung-pie/dung-pie.mp3")
+        sys.exit(1)
+
+    if args[0] == "build":
+        index = build_index(args[1:] or ("sounds", "voices"))
+        print(f"Indexed {len(index['paths'])} files into {INDEX_PATH}")
+    else:
+        mode = "similar" if "similar" in flags else "complement"
+        results = query_index(args[1], top=int(options.get("top", 5)), mode=mode)
+        if results:
+            print(f"Query flatness (mel bands): {results[0]['query_flatness']:.4f}, "
+                  f"scored in {results[0]['scoring_ms']:.2f} ms")
+        for rank, r in enumerate(results, 1):
+            level = f" at {r['level_db']:+.0f} dB" if mode == "complement" else ""
+            print(f"{rank}. {r['path']}{level}  score {r['score']:.4f}  "
+                  f"(flatness {r['spectral_flatness']:.3f}, slope {r['psd_slope']:+.1f} dB/oct)")
@@ -0,0 +1,324 @@
+import os
+import queue
+import subprocess
+import threading
+import numpy as np
+import librosa
+from scipy import signal
+from scipy import stats
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+from typing import Callable, Dict, Iterator, Optional
+from signal_analysis import DEFAULT_CONFIG
+
+# Streaming analysis
+# Decodes with an ffmpeg subprocess straight into float32 PCM blocks (mono
+# downmix) on a reader thread and updates every statistic of the noise
+# analysis incrementally: Welch PSD averages, moments, a fine histogram (the
+# K-S test is computed from it), bounded-lag autocorrelation, spectral
+# flatness and a mel spectrogram / waveform envelope decimated on the fly.
+# Memory depends on the block size and the output sizes, not on the file
+# length, and the FFT work overlaps with decoding.
+
+BLOCK_FRAMES = 65536     # Frames per PCM block read from ffmpeg
+QUEUE_BLOCKS = 8         # Decoded blocks buffered ahead of the analysis
+HISTOGRAM_BINS = 8192    # Fine histogram over [-1, 1], re-binned at the end
+N_MELS = 128
+HOP_LENGTH = 512
+MAX_SPECTROGRAM_COLUMNS = 1024
+ENVELOPE_POINTS = 4096
+
+
+def stream_pcm(path: str, sample_rate: int, block_frames: int = BLOCK_FRAMES,
+               channels: int = 1) -> Iterator[np.ndarray]:
+    """Yield float32 blocks of an audio file decoded by ffmpeg on a reader thread.
+
+    Mono blocks (the default downmix) have shape (frames,), others
+    (frames, channels).
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    command = [
+        AudioSegment.converter, "-hide_banner", "-loglevel", "error", "-nostdin",
+        "-i", path, "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    blocks = queue.Queue(maxsize=QUEUE_BLOCKS)
+    frame_bytes = 4 * channels
+
+    def read():
+        try:
+            while True:
+                data = process.stdout.read(block_frames * frame_bytes)
+                if not data:
+                    break
+                block = np.frombuffer(data[:len(data) // frame_bytes * frame_bytes], dtype=np.float32)
+                blocks.put(block if channels == 1 else block.reshape(-1, channels))
+        finally:
+            blocks.put(None)
+
+    reader = threading.Thread(target=read, daemon=True)
+    reader.start()
+    finished = False
+    try:
+        while True:
+            block = blocks.get()
+            if block is None:
+                finished = True
+                break
+            yield block
+    finally:
+        if not finished:
+            # Consumer stopped early: stop ffmpeg and unblock the reader
+            process.kill()
+            while blocks.get() is not None:
+                pass
+        reader.join()
+        stderr = process.stderr.read().decode(errors="replace")
+        if process.wait() != 0 and finished:
+            raise RuntimeError(stderr.strip() or f"ffmpeg exited with code {process.returncode}")
+
+
+def _group(columns: np.ndarray, factor: int, combine: Callable) -> np.ndarray:
+    """Combine groups of factor columns (the last group is padded with its edge)"""
+    pad = (-columns.shape[1]) % factor
+    padded = np.pad(columns, ((0, 0), (0, pad)), mode="edge")
+    return combine(padded.reshape(columns.shape[0], -1, factor))
+
+
+def _mean_columns(groups: np.ndarray) -> np.ndarray:
+    return groups.mean(axis=2)
+
+
+def _envelope_columns(groups: np.ndarray) -> np.ndarray:
+    return np.stack([groups[0].min(axis=1), groups[1].max(axis=1)])
+
+
+class _ColumnDecimator:
+    def __init__(self, max_columns: int, combine: Callable):
+        """Keep at most 2 * max_columns columns by combining pairs whenever it overflows.
+
+        Incoming columns are combined pairwise once per doubling of the factor;
+        a column left without a partner is carried into the next add, so every
+        output column covers exactly factor input columns.
+        """
+        self.max_columns = max_columns
+        self.combine = combine
+        self.chunks = []   # Output columns, each covering factor input columns
+        self.count = 0
+        self.carry = []    # carry[k]: column covering 2**k inputs that waits for its partner
+
+    def _pair(self, columns: np.ndarray, level: int) -> np.ndarray:
+        """Combine adjacent pairs of level columns, carrying an odd trailing column"""
+        carried = self.carry[level]
+        if carried is not None:
+            columns = np.concatenate([carried, columns], axis=1)
+        even = columns.shape[1] // 2 * 2
+        self.carry[level] = columns[:, even:] if even < columns.shape[1] else None
+        return _group(columns[:, :even], 2, self.combine)
+
+    def add(self, columns: np.ndarray):
+        for level in range(len(self.carry)):
+            columns = self._pair(columns, level)
+        if columns.shape[1] == 0:
+            return
+        self.chunks.append(columns)
+        self.count += columns.shape[1]
+        while self.count > 2 * self.max_columns:
+            self.carry.append(None)
+            columns = self._pair(np.concatenate(self.chunks, axis=1), len(self.carry) - 1)
+            self.chunks = [columns]
+            self.count = columns.shape[1]
+
+    def result(self) -> np.ndarray:
+        # Partial columns at the end, coarsest (earliest) first
+        columns = self.chunks + [c for c in reversed(self.carry) if c is not None]
+        if not columns:
+            return np.zeros((0, 0), dtype=np.float32)
+        columns = np.concatenate(columns, axis=1)
+        factor = -(-columns.shape[1] // self.max_columns)
+        return _group(columns, factor, self.combine) if factor > 1 else columns
+
+
+class StreamingAnalyzer:
+    def __init__(self, sample_rate: int, config: Optional[Dict] = None):
+        """Incremental version of signal_analysis.analyze with the plot arrays.
+
+        Args:
+            sample_rate: Sample rate of the blocks passed to update()
+            config: Overrides for signal_analysis.DEFAULT_CONFIG
+        """
+        self.config = {**DEFAULT_CONFIG, **(config or {})}
+        self.sample_rate = sample_rate
+        self.frames = 0
+
+        # Welch PSD (scipy.signal.welch defaults: periodic Hann, constant detrend, density)
+        self.segment_length = self.config["psd_segment_length"]
+        self.hop = self.segment_length - int(self.segment_length * self.config["psd_overlap"])
+        self.window = signal.get_window("hann", self.segment_length)
+        self.psd_sum = np.zeros(self.segment_length // 2 + 1)
+        self.psd_segments = 0
+        self.psd_carry = np.zeros(0, dtype=np.float32)
+
+        # Raw power sums for the moments
+        self.power_sums = np.zeros(4)
+        self.min = np.inf
+        self.max = -np.inf
+        self.histogram = np.zeros(HISTOGRAM_BINS, dtype=np.int64)
+
+        # Autocorrelation up to max_lag, with the previous block's tail carried over
+        self.max_lag = self.config["autocorr_max_lag"]
+        self.autocorr = np.zeros(self.max_lag)
+        self.autocorr_carry = np.zeros(0, dtype=np.float32)
+
+        # One STFT feeds both the flatness and the mel spectrogram
+        self.n_fft = self.config["flatness_n_fft"]
+        self.mel_basis = librosa.filters.mel(sr=sample_rate, n_fft=self.n_fft, n_mels=N_MELS)
+        self.stft_carry = np.zeros(0, dtype=np.float32)
+        self.flatness_sum = 0.0
+        self.stft_frames = 0
+        self.spectrogram = _ColumnDecimator(MAX_SPECTROGRAM_COLUMNS, _mean_columns)
+        self.envelope = _ColumnDecimator(ENVELOPE_POINTS, _envelope_columns)
+
+    def _update_psd(self, block: np.ndarray):
+        data = np.concatenate([self.psd_carry, block])
+        if len(data) < self.segment_length:
+            self.psd_carry = data
+            return
+        segments = np.lib.stride_tricks.sliding_window_view(data, self.segment_length)[::self.hop]
+        segments = segments - segments.mean(axis=1, keepdims=True)
+        self.psd_sum += np.sum(np.abs(np.fft.rfft(segments * self.window, axis=1)) ** 2, axis=0)
+        self.psd_segments += len(segments)
+        self.psd_carry = data[len(segments) * self.hop:]
+
+    def _update_autocorrelation(self, block: np.ndarray):
+        data = np.concatenate([self.autocorr_carry, block])
+        tail = len(self.autocorr_carry)
+        # Products of every sample in block with the samples up to max_lag - 1 before it
+        full = signal.correlate(data, block, mode="full", method="fft")
+        lags = np.arange(min(self.max_lag, tail + len(block)))
+        self.autocorr[lags] += full[tail - lags + len(block) - 1]
+        self.autocorr_carry = data[-(self.max_lag - 1):] if self.max_lag > 1 else data[:0]
+
+    def _update_stft(self, block: np.ndarray):
+        data = np.concatenate([self.stft_carry, block])
+        if len(data) < self.n_fft:
+            self.stft_carry = data
+            return
+        power = np.abs(librosa.stft(data, n_fft=self.n_fft, hop_length=HOP_LENGTH, center=False)) ** 2
+        geometric_mean = np.exp(np.mean(np.log(power + 1e-10), axis=0))
+        self.flatness_sum += float(np.sum(geometric_mean / (np.mean(power, axis=0) + 1e-10)))
+        self.stft_frames += power.shape[1]
+        self.spectrogram.add(self.mel_basis @ power)
+        self.stft_carry = data[power.shape[1] * HOP_LENGTH:]
+
+    def update(self, block: np.ndarray):
+        """Add one block of mono float32 samples"""
+        block = np.asarray(block, dtype=np.float32)
+        if len(block) == 0:
+            return
+        self.frames += len(block)
+        x = block.astype(np.float64)
+        x2 = x * x
+        self.power_sums += [x.sum(), x2.sum(), (x2 * x).sum(), (x2 * x2).sum()]
+        self.min = min(self.min, float(block.min()))
+        self.max = max(self.max, float(block.max()))
+        self.histogram += np.histogram(np.clip(block, -1, 1), bins=HISTOGRAM_BINS, range=(-1, 1))[0]
+        self._update_psd(block)
+        self._update_autocorrelation(block)
+        self._update_stft(block)
+        self.envelope.add(np.stack([block, block]))
+
+    def _distribution(self) -> Dict:
+        n = self.frames
+        m1, m2, m3, m4 = self.power_sums / n
+        var = m2 - m1 ** 2
+        std = np.sqrt(max(var, 1e-30))
+        central3 = m3 - 3 * m1 * m2 + 2 * m1 ** 3
+        central4 = m4 - 4 * m1 * m3 + 6 * m1 ** 2 * m2 - 3 * m1 ** 4
+
+        # K-S statistic against the fitted normal, at the fine histogram's bin edges
+        edges = np.linspace(-1, 1, HISTOGRAM_BINS + 1)[1:]
+        empirical = np.cumsum(self.histogram) / n
+        ks_statistic = float(np.max(np.abs(empirical - stats.norm.cdf((edges - m1) / std))))
+        return {
+            "mean": float(m1),
+            "std": float(std),
+            "skewness": float(central3 / std ** 3),
+            "kurtosis": float(central4 / var ** 2 - 3) if var > 0 else 0.0,
+            "ks_test": {
+                "statistic": ks_statistic,
+                "p_value": float(stats.kstwo.sf(ks_statistic, n))
+            }
+        }
+
+    def _histogram_arrays(self):
+        # Re-bin the occupied part of the fine histogram to histogram_bins bins
+        width = 2 / HISTOGRAM_BINS
+        lo = int(np.clip((self.min + 1) / width, 0, HISTOGRAM_BINS - 1))
+        hi = int(np.clip((self.max + 1) / width, lo, HISTOGRAM_BINS - 1)) + 1
+        bounds = np.unique(np.linspace(lo, hi, self.config["histogram_bins"] + 1).round().astype(int))
+        counts = np.add.reduceat(self.histogram[:hi], bounds[:-1])
+        edges = bounds * width - 1
+        return counts / (self.frames * np.diff(edges)), edges
+
+    def result(self) -> Dict:
+        """Analysis in the format of signal_analysis.analyze(..., {"arrays": True}),
+        plus the mel spectrogram and waveform envelope arrays of compact results"""
+        if self.frames == 0:
+            raise ValueError("No samples were analyzed")
+        scale = 1 / (self.sample_rate * np.sum(self.window ** 2) * max(self.psd_segments, 1))
+        psd = self.psd_sum * scale
+        psd[1:-1 if self.segment_length % 2 == 0 else None] *= 2
+        density, edges = self._histogram_arrays()
+        return {
+            "spectral_flatness": self.flatness_sum / max(self.stft_frames, 1),
+            "distribution_analysis": self._distribution(),
+            "arrays": {
+                "psd_frequencies": np.fft.rfftfreq(self.segment_length, 1 / self.sample_rate).astype(np.float32),
+                "psd": psd.astype(np.float32),
+                "autocorrelation": (self.autocorr / (self.autocorr[0] + 1e-30)).astype(np.float32),
+                "histogram_density": density.astype(np.float32),
+                "histogram_edges": edges.astype(np.float32),
+                "mel_spectrogram": self.spectrogram.result().astype(np.float32),
+                "waveform_envelope": self.envelope.result().astype(np.float32)
+            }
+        }
+
+
+def analyze_file_streaming(path: str,
+                           sample_rate: Optional[int] = None,
+                           config: Optional[Dict] = None,
+                           block_frames: int = BLOCK_FRAMES) -> Dict:
+    """Analyze an audio file block by block without decoding it into memory.
+
+    Args:
+        path: Audio file
+        sample_rate: Analysis sample rate (default: the file's)
+        config: Overrides for signal_analysis.DEFAULT_CONFIG
+        block_frames: Frames per decoded block
+
+    Returns:
+        Metadata in the format of AudioAnalysisPipeline.analyze_audio(compact=True),
+        with the arrays under "arrays"
+    """
+    info = mediainfo(path)
+    sample_rate = sample_rate or int(info.get("sample_rate") or 44100)
+    analyzer = StreamingAnalyzer(sample_rate, config)
+    for block in stream_pcm(path, sample_rate, block_frames):
+        analyzer.update(block)
+    analysis = analyzer.result()
+    return {
+        "filename": os.path.basename(path),
+        "duration": analyzer.frames / sample_rate,
+        "channels": int(info.get("channels") or 1),
+        "sample_width": (int(info.get("bits_per_sample") or 16) // 8) or 2,
+        "frame_rate": sample_rate,
+        "streaming": True,
+        "noise_analysis": {
+            "spectral_flatness": analysis["spectral_flatness"],
+            "distribution_analysis": analysis["distribution_analysis"]
+        },
+        "arrays": analysis["arrays"]
+    }
@@ -0,0 +1,153 @@
+import json
+import os
+import numpy as np
+from typing import Dict, Optional
+from results_store import atomic_savez, locked
+
+# Metrics-gated VLM review
+# Every VLM review is indexed with the final mix's noise_analysis metrics and
+# a coarse mel spectrogram fingerprint. A new mix whose metrics and
+# fingerprint are both close to an already reviewed one reuses that feedback
+# instead of sending the prompt and two high-detail images again; only new
+# results escalate to the VLM. Hits, misses and the VLM time saved (the
+# recorded duration of the reused reviews) are kept in the index, which is
+# updated under a file lock so concurrent reviews do not drop each other's
+# entries. Fingerprints always come from the final mix audio (mono, at
+# FINGERPRINT_RATE), so mixes analyzed in any mode are compared like with like.
+
+GATE_INDEX_PATH = "results/vlm_review_index.npz"
+DEFAULT_THRESHOLD = 1.0  # Distance 1 = one "noticeable difference" in some metric
+
+# Difference in each metric that counts as noticeable
+METRIC_SCALES = {
+    "spectral_flatness": 0.02,
+    "mean": 0.005,
+    "std": 0.02,
+    "skewness": 0.1,
+    "kurtosis": 0.3,
+    "ks_statistic": 0.02
+}
+FINGERPRINT_BANDS = 16
+FINGERPRINT_FRAMES = 16
+FINGERPRINT_SCALE_DB = 3.0  # RMS difference of the fingerprints that counts as noticeable
+FINGERPRINT_RATE = 22050    # Sample rate the audio is fingerprinted at
+
+
+def metric_vector(noise_analysis: Dict) -> np.ndarray:
+    """noise_analysis metrics divided by their METRIC_SCALES"""
+    distribution = noise_analysis.get("distribution_analysis", {})
+    values = {
+        "spectral_flatness": noise_analysis.get("spectral_flatness", 0.0),
+        "ks_statistic": distribution.get("ks_test", {}).get("statistic", 0.0),
+        **{key: distribution.get(key, 0.0) for key in ("mean", "std", "skewness", "kurtosis")}
+    }
+    return np.array([values[key] / scale for key, scale in METRIC_SCALES.items()], dtype=np.float32)
+
+
+def spectrogram_fingerprint(mel_power: np.ndarray) -> np.ndarray:
+    """Mel power spectrogram (bands x frames) reduced to FINGERPRINT_BANDS x FINGERPRINT_FRAMES dB"""
+    bands = np.stack([rows.mean(axis=0) for rows in np.array_split(mel_power, FINGERPRINT_BANDS, axis=0)])
+    coarse = np.stack([cols.mean(axis=1) for cols in np.array_split(bands, FINGERPRINT_FRAMES, axis=1)], axis=1)
+    return (10 * np.log10(coarse + 1e-10) / FINGERPRINT_SCALE_DB).astype(np.float32)
+
+
+def file_fingerprint(path: str) -> np.ndarray:
+    """Fingerprint of an audio file, independent of its sample rate and channel layout"""
+    import librosa
+    samples, sr = librosa.load(path, sr=FINGERPRINT_RATE, mono=True)
+    return spectrogram_fingerprint(librosa.feature.melspectrogram(y=samples, sr=sr, n_mels=128))
+
+
+def review_distances(vector: np.ndarray,
+                     fingerprint: np.ndarray,
+                     vectors: np.ndarray,
+                     fingerprints: np.ndarray) -> np.ndarray:
+    """Distance of one mix to every indexed mix: the larger of the metric and fingerprint distances"""
+    metric = np.sqrt(np.mean(np.square(vectors - vector), axis=1))
+    spectral = np.sqrt(np.mean(np.square(fingerprints - fingerprint), axis=(1, 2)))
+    return np.maximum(metric, spectral)
+
+
+class ReviewGate:
+    def __init__(self, index_path: str = GATE_INDEX_PATH, threshold: float = DEFAULT_THRESHOLD):
+        """Index of VLM reviews keyed by metrics and spectrogram fingerprints.
+
+        Args:
+            index_path: Where the index is stored
+            threshold: Largest distance at which prior feedback is reused
+        """
+        self.index_path = index_path
+        self.threshold = threshold
+        self.entries = {
+            "result_dirs": np.array([], dtype=str),
+            "feedback": np.array([], dtype=str),
+            "review_times": np.zeros(0, dtype=np.float32),
+            "vectors": np.zeros((0, len(METRIC_SCALES)), dtype=np.float32),
+            "fingerprints": np.zeros((0, FINGERPRINT_BANDS, FINGERPRINT_FRAMES), dtype=np.float32)
+        }
+        self.stats = {"hits": 0, "misses": 0, "time_saved": 0.0}
+        self._load()
+
+    def _load(self):
+        if os.path.exists(self.index_path):
+            with np.load(self.index_path) as data:
+                self.entries = {key: data[key] for key in self.entries}
+                self.stats = json.loads(str(data["stats"]))
+
+    def lookup(self, vector: np.ndarray, fingerprint: np.ndarray) -> Optional[Dict]:
+        """Nearest reviewed mix within the threshold, None if the mix needs a new review"""
+        if len(self.entries["vectors"]) == 0:
+            return None
+        distances = review_distances(vector, fingerprint, self.entries["vectors"], self.entries["fingerprints"])
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > self.threshold:
+            return None
+        return {
+            "result_dir": str(self.entries["result_dirs"][nearest]),
+            "feedback": str(self.entries["feedback"][nearest]),
+            "review_time": float(self.entries["review_times"][nearest]),
+            "distance": float(distances[nearest])
+        }
+
+    def record_hit(self, match: Dict):
+        """Count a reused review and the VLM time it saved"""
+        with locked(self.index_path):
+            self._load()
+            self.stats["hits"] += 1
+            self.stats["time_saved"] += match["review_time"]
+            self.save()
+
+    def record_review(self, result_dir: str, vector: np.ndarray, fingerprint: np.ndarray,
+                      feedback: str, review_time: float):
+        """Add a new VLM review to the index (replacing an older review of the same directory)"""
+        additions = {
+            "result_dirs": np.array([os.path.abspath(result_dir)]),
+            "feedback": np.array([feedback]),
+            "review_times": np.array([review_time], dtype=np.float32),
+            "vectors": vector[np.newaxis],
+            "fingerprints": fingerprint[np.newaxis]
+        }
+        with locked(self.index_path):
+            self._load()
+            self.stats["misses"] += 1
+            keep = self.entries["result_dirs"] != os.path.abspath(result_dir)
+            self.entries = {key: np.concatenate([value[keep], additions[key]])
+                            for key, value in self.entries.items()}
+            self.save()
+
+    def save(self):
+        """Write the index (callers updating a shared index hold locked(index_path))"""
+        atomic_savez(self.index_path, stats=np.array(json.dumps(self.stats)), **self.entries)
+
+    def report(self) -> Dict:
+        """Hit rate and time saved so far"""
+        total = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "reviews": len(self.entries["vectors"]),
+                "hit_rate": self.stats["hits"] / total if total else 0.0}
+
+
+def print_gate_report(report: Dict):
+    """Print the gate's hit rate and time saved"""
+    print(f"VLM gate: {report['hits']} reused / {report['misses']} reviewed "
+          f"(hit rate {report['hit_rate']:.0%}), {report['time_saved']:.0f}s of VLM time saved, "
+          f"{report['reviews']} reviews indexed")
@@ -0,0 +1,36 @@
+import numpy as np
+from ducking import Ducker
+
+RATE = 8000
+
+
+def _signals():
+    rng = np.random.default_rng(0)
+    envelope = np.repeat(rng.uniform(0, 0.5, 40), RATE // 20)
+    foreground = (rng.standard_normal((len(envelope), 2)) * envelope[:, np.newaxis]).astype(np.float32)
+    background = rng.standard_normal((len(envelope), 2)).astype(np.float32)
+    return foreground, background
+
+
+def _process(foreground, background, bounds):
+    ducker = Ducker(RATE)
+    return np.concatenate([ducker.process(foreground[a:b], background[a:b].copy())
+                           for a, b in zip(bounds, bounds[1:])])
+
+
+def test_output_does_not_depend_on_chunking():
+    foreground, background = _signals()
+    total = len(foreground)
+    block = Ducker(RATE).block
+    whole = _process(foreground, background, [0, total])
+    # Includes chunks shorter than one envelope block, empty ones and ones crossing several blocks
+    bounds = [0, 3, block - 1, block - 1, block + 2, 5 * block + 7, 5 * block + 8, total // 2, total]
+    assert np.allclose(_process(foreground, background, bounds), whole, atol=1e-6)
+    frame_by_frame = list(range(0, 4 * block)) + [total]
+    assert np.allclose(_process(foreground, background, frame_by_frame), whole, atol=1e-6)
+
+
+def test_silent_foreground_leaves_background_untouched():
+    _, background = _signals()
+    ducked = Ducker(RATE).process(np.zeros_like(background), background.copy())
+    assert np.allclose(ducked, background)
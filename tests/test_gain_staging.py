@@ -0,0 +1,25 @@
+import os
+import numpy as np
+from gain_staging import array_to_segment, plan_gain_db, source_levels
+
+
+def _write(path, amplitude, mtime):
+    samples = np.full((4410, 2), amplitude, dtype=np.float32)
+    array_to_segment(samples, 44100).export(path, format="wav")
+    os.utime(path, ns=(mtime, mtime))
+
+
+def test_edited_source_is_measured_again(tmp_path):
+    path = str(tmp_path / "layer.wav")
+    _write(path, 0.5, 1_000_000_000)
+    quiet = source_levels(path)
+    assert source_levels(path) == quiet
+    _write(path, 0.25, 2_000_000_000)
+    louder_by = quiet["rms_dbfs"] - source_levels(path)["rms_dbfs"]
+    assert abs(louder_by - 20 * np.log10(2)) < 0.01
+
+
+def test_plan_gain_matches_rms_and_offset():
+    levels = {"rms_dbfs": -30.0, "peak_dbfs": -12.0}
+    assert plan_gain_db(levels, -20, -7) == 3.0
+    assert plan_gain_db({"rms_dbfs": -float("inf"), "peak_dbfs": -float("inf")}, -20) == 0.0
@@ -0,0 +1,119 @@
+import multiprocessing
+import os
+import signal
+import time
+import job_queue
+from job_queue import _Heartbeat, _move, _path, _read, claim, list_jobs, reap_expired, submit
+
+
+def _expire_and_reclaim(queue_dir):
+    """Worker A's lease expires and worker C claims the job again"""
+    submit(str(queue_dir), {"output_name": "mix"})
+    stalled = claim(str(queue_dir), "A")
+    assert reap_expired(str(queue_dir), lease_s=0) == [stalled["id"]]
+    current = claim(str(queue_dir), "C")
+    return stalled, current
+
+
+def test_stalled_worker_cannot_finish_a_reclaimed_lease(tmp_path):
+    stalled, current = _expire_and_reclaim(tmp_path)
+    assert not _move(str(tmp_path), stalled, "leases", "done")
+    assert list_jobs(str(tmp_path), "done") == []
+    lease = _read(_path(str(tmp_path), "leases", current["id"]))
+    assert lease["worker"] == "C"
+    assert _move(str(tmp_path), current, "leases", "done")
+    assert list_jobs(str(tmp_path), "done") == [current["id"]]
+
+
+def test_stalled_heartbeat_does_not_renew_a_reclaimed_lease(tmp_path):
+    stalled, current = _expire_and_reclaim(tmp_path)
+    lease_path = _path(str(tmp_path), "leases", current["id"])
+    os.utime(lease_path, (1000, 1000))
+    heartbeat = _Heartbeat(lease_path, 0.01, stalled)
+    heartbeat.start()
+    heartbeat.join(timeout=5)
+    assert not heartbeat.is_alive()
+    assert os.stat(lease_path).st_mtime == 1000
+
+
+def test_heartbeat_renews_own_lease(tmp_path):
+    submit(str(tmp_path), {"output_name": "mix"})
+    job = claim(str(tmp_path), "A")
+    lease_path = _path(str(tmp_path), "leases", job["id"])
+    os.utime(lease_path, (1000, 1000))
+    heartbeat = _Heartbeat(lease_path, 0.01, job)
+    heartbeat.start()
+    time.sleep(0.1)
+    heartbeat.stopped.set()
+    heartbeat.join()
+    assert os.stat(lease_path).st_mtime > 1000
+
+
+def test_interrupted_move_is_recovered(tmp_path, monkeypatch):
+    submit(str(tmp_path), {"output_name": "mix"})
+    job = claim(str(tmp_path), "A")
+
+    def crash(*args, **kwargs):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(job_queue, "atomic_write_json", crash)
+    try:
+        _move(str(tmp_path), job, "leases", "done")
+    except KeyboardInterrupt:
+        pass
+    monkeypatch.undo()
+    assert list_jobs(str(tmp_path), "leases") == []
+
+    assert reap_expired(str(tmp_path), lease_s=0) == [job["id"]]
+    assert list_jobs(str(tmp_path), "pending") == [job["id"]]
+    assert not [f for f in os.listdir(tmp_path / "leases") if f.endswith(".moving")]
+
+
+def _fake_run_job(job, results_dir="results", worker_id=""):
+    """Stand-in for the render: records each run; the first attempt of "stuck" hangs"""
+    if job["kwargs"]["output_name"] == "stuck" and job["attempts"] == 1:
+        open(os.path.join(results_dir, "stuck-claimed"), "w").close()
+        time.sleep(600)
+    time.sleep(0.02)
+    with open(os.path.join(results_dir, "runs.log"), "a") as log:
+        log.write(f"{job['id']} {worker_id}\n")
+    return os.path.join(results_dir, job["kwargs"]["output_name"])
+
+
+def _worker_process(queue_dir, results_dir, worker_id):
+    job_queue.run_job = _fake_run_job
+    job_queue.run_worker(queue_dir, results_dir, worker_id, lease_s=0.5, poll_s=0.02,
+                         exit_when_empty=True, cache_mb=16, segments=0)
+
+
+def test_worker_processes_run_each_job_once(tmp_path):
+    import mix_graph  # noqa: F401 - the forked workers start with the mixer already imported
+    context = multiprocessing.get_context("fork")
+    queue_dir, results_dir = str(tmp_path / "queue"), str(tmp_path / "results")
+    os.makedirs(results_dir)
+
+    # A worker claims this job and dies with it; its lease has to expire
+    stuck = submit(queue_dir, {"output_name": "stuck"})
+    doomed = context.Process(target=_worker_process, args=(queue_dir, results_dir, "doomed"))
+    doomed.start()
+    deadline = time.time() + 30
+    while not os.path.exists(os.path.join(results_dir, "stuck-claimed")) and time.time() < deadline:
+        time.sleep(0.01)
+    os.kill(doomed.pid, signal.SIGKILL)
+    doomed.join()
+
+    jobs = {stuck} | {submit(queue_dir, {"output_name": f"mix{i}"}) for i in range(16)}
+    workers = [context.Process(target=_worker_process, args=(queue_dir, results_dir, f"w{i}"))
+               for i in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=60)
+        assert worker.exitcode == 0
+
+    with open(os.path.join(results_dir, "runs.log")) as log:
+        runs = [line.split()[0] for line in log]
+    assert sorted(runs) == sorted(jobs)
+    assert set(list_jobs(queue_dir, "done")) == jobs
+    assert all(not list_jobs(queue_dir, state) for state in ("pending", "leases", "failed"))
+    finished = _read(_path(queue_dir, "done", stuck))
+    assert finished["attempts"] == 2 and finished["worker"] != "doomed"
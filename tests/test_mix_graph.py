@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+from gain_staging import array_to_segment, segment_to_array
+from mix_graph import MixGraphRenderer, build_mix_graph
+from mix_recipe import plan_mix, stream_mix
+
+RATE = 8000
+DURATION_MS = 65000  # Long enough for two bird calls
+
+
+class RecordingRenderer(MixGraphRenderer):
+    """Renderer that records every node it evaluates (cache misses)"""
+
+    def __init__(self):
+        super().__init__()
+        self.evaluated = []
+
+    def _evaluate(self, node, input_futures):
+        self.evaluated.append(node)
+        return super()._evaluate(node, input_futures)
+
+
+@pytest.fixture
+def sounds(tmp_path):
+    rng = np.random.default_rng(0)
+
+    def write(name, seconds, channels=2, rate=RATE):
+        samples = rng.standard_normal((int(seconds * rate), channels)).astype(np.float32) * 0.1
+        path = str(tmp_path / f"{name}.wav")
+        array_to_segment(samples, rate).export(path, format="wav")
+        return path
+
+    return {
+        "forest": write("forest", 3),
+        "rain": write("rain", 2, channels=1),
+        "fire": write("fire", 2.5, rate=RATE // 2),  # Resampled to the bed rate
+        "other_rain": write("other_rain", 2),
+        "call": write("call", 6),
+        "intro": write("intro", 5),
+        "outro": write("outro", 6),
+    }
+
+
+def _graph(sounds, rain=None, **options):
+    return build_mix_graph(sounds["forest"], rain or sounds["rain"], sounds["fire"], sounds["call"],
+                           DURATION_MS, sounds["intro"], sounds["outro"], **options)
+
+
+def _sources(nodes):
+    return sorted(node.params["path"] for node in nodes if type(node).__name__ == "Source")
+
+
+def test_call_change_reuses_bed_and_sources(sounds):
+    renderer = RecordingRenderer()
+    renderer.render(_graph(sounds, seed=1))
+    renderer.evaluated.clear()
+    renderer.render(_graph(sounds, seed=2))
+    # Only the call track and what follows it are rendered again
+    assert [type(node).__name__ for node in renderer.evaluated] == [
+        "EventTrack", "MatchLevel", "Crossfade", "MatchLevel", "Crossfade"
+    ]
+
+
+def test_layer_change_keeps_other_sources_decoded(sounds):
+    renderer = RecordingRenderer()
+    renderer.render(_graph(sounds, seed=1))
+    renderer.evaluated.clear()
+    renderer.render(_graph(sounds, rain=sounds["other_rain"], seed=1))
+    assert _sources(renderer.evaluated) == [sounds["other_rain"]]
+
+
+def test_ducked_bed_and_sidechain_share_one_plan(sounds):
+    renderer = RecordingRenderer()
+    renderer.render(_graph(sounds, seed=1, duck=True))
+    names = [type(node).__name__ for node in renderer.evaluated]
+    assert names.count("BedPlan") == 1
+    assert names.count("BedTrack") == 2
+    assert len(_sources(renderer.evaluated)) == len(set(_sources(renderer.evaluated)))
+
+
+@pytest.mark.parametrize("duck", [False, True])
+@pytest.mark.parametrize("rain", [None, "noise:rain?seed=1"])
+def test_graph_render_matches_stream(sounds, duck, rain):
+    graph = MixGraphRenderer().render(_graph(sounds, rain=rain, seed=3, duck=duck))
+    plan = plan_mix(sounds["forest"], rain or sounds["rain"], sounds["fire"], sounds["call"], DURATION_MS,
+                    sounds["intro"], sounds["outro"], duck=duck, seed=3)
+    stream = np.concatenate(list(stream_mix(plan, block_ms=7000)))
+    assert graph.frame_rate == plan["frame_rate"]
+    assert graph.samples.shape == stream.shape
+
+    # Compared as exported, after 16-bit conversion
+    def pcm(samples):
+        return segment_to_array(array_to_segment(samples, RATE))
+    assert np.abs(pcm(graph.samples) - pcm(stream)).max() < 1e-4
@@ -0,0 +1,12 @@
+import json
+from mix_worker import mix_kwargs
+
+
+def test_previewed_request_keeps_its_parsed_arguments():
+    argv = ["forest.wav", "rain.wav", "fire.wav", "--preview", "--duck"]
+    parsed = mix_kwargs({"job": "preview", "argv": argv})
+    assert parsed["output_name"].startswith("mix_") and parsed["duck"]
+    assert "preview" not in parsed
+    # The analyze_mix job gets the preview's kwargs back over JSON, not the argv
+    sent = json.loads(json.dumps({"job": "analyze_mix", "kwargs": {**parsed, "seed": 7}}))
+    assert mix_kwargs(sent) == {**parsed, "seed": 7}
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from noise_generator import NoiseGenerator
+
+KINDS = ["white", "pink", "brown", "rain", "crackle"]
+RATE = 22050
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_same_seed_same_stream(kind):
+    a = NoiseGenerator(kind, sample_rate=RATE, seed=7).read(0, RATE)
+    b = NoiseGenerator(kind, sample_rate=RATE, seed=7).read(0, RATE)
+    assert np.array_equal(a, b)
+    c = NoiseGenerator(kind, sample_rate=RATE, seed=8).read(0, RATE)
+    assert not np.array_equal(a, c)
+
+
+@pytest.mark.parametrize("kind", KINDS)
+def test_block_split_reads_match_one_read(kind):
+    whole = NoiseGenerator(kind, sample_rate=RATE, seed=3).read(0, 3 * RATE)
+    generator = NoiseGenerator(kind, sample_rate=RATE, seed=3)
+    bounds = [0, 1, 1000, 1001, 2 * RATE + 17, 3 * RATE]
+    split = np.concatenate([generator.read(a, b) for a, b in zip(bounds, bounds[1:])])
+    assert np.allclose(split, whole, atol=1e-6)
+
+
+def test_seek_and_rewind_match_one_read():
+    generator = NoiseGenerator("rain", sample_rate=RATE, seed=1, fir=np.array([0.5, 0.3, 0.2]))
+    whole = generator.excerpt(2 * RATE)
+    assert np.allclose(generator.read(RATE, 2 * RATE), whole[RATE:], atol=1e-6)
+    assert np.allclose(generator.read(0, RATE), whole[:RATE], atol=1e-6)
+
+
+def test_far_window_does_not_depend_on_earlier_reads():
+    far = 3600 * RATE
+    fresh = NoiseGenerator("crackle", sample_rate=RATE, seed=5).read(far, far + RATE)
+    generator = NoiseGenerator("crackle", sample_rate=RATE, seed=5)
+    generator.read(0, RATE)
+    longer = generator.read(far - RATE // 2, far + RATE)
+    assert np.allclose(longer[RATE // 2:], fresh, atol=1e-6)
+
+
+@pytest.mark.parametrize("kind", ["pink", "rain", "crackle"])
+def test_levels_report_the_measured_output(kind):
+    generator = NoiseGenerator(kind, sample_rate=RATE, seed=2)
+    samples = generator.read(0, 60 * RATE)
+    rms_dbfs = 20 * np.log10(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+    levels = generator.levels()
+    assert abs(levels["rms_dbfs"] - rms_dbfs) < 0.5
+    assert 20 * np.log10(np.abs(samples).max()) <= levels["peak_dbfs"]
@@ -0,0 +1,24 @@
+import os
+import numpy as np
+from gain_staging import array_to_segment
+from mix_recipe import plan_mix
+
+RATE = 8000
+
+
+def _write(path, seconds, seed):
+    samples = np.random.default_rng(seed).standard_normal((seconds * RATE, 2)).astype(np.float32) * 0.1
+    array_to_segment(samples, RATE).export(path, format="wav")
+    return path
+
+
+def test_preview_is_written_to_results_dir_and_timed_with_the_plan(tmp_path):
+    from analyze_mix import preview_mix
+    forest = _write(str(tmp_path / "forest.wav"), 3, 0)
+    plan = plan_mix(forest, "noise:rain?seed=1", "noise:crackle", duration_ms=40000, seed=1)
+    results_dir = str(tmp_path / "out")
+    preview = preview_mix({"plan": plan, "output_name": "mix", "results_dir": results_dir})
+    assert preview["output_path"] == os.path.join(results_dir, "mix", "preview.wav")
+    assert os.path.exists(preview["output_path"])
+    assert preview["plan_time"] == plan["plan_time"] > 0
+    assert preview["render_time"] > preview["plan_time"]
@@ -0,0 +1,18 @@
+import json
+import os
+import stat
+from results_store import RESULT_FILE_MODE, atomic_write_json
+
+
+def test_atomic_write_sets_mode_and_leaves_umask_alone(tmp_path):
+    previous = os.umask(0o077)
+    try:
+        path = str(tmp_path / "nested" / "result.json")
+        atomic_write_json(path, {"ok": True})
+        assert os.umask(0o077) == 0o077
+    finally:
+        os.umask(previous)
+    assert stat.S_IMODE(os.stat(path).st_mode) == RESULT_FILE_MODE
+    with open(path) as f:
+        assert json.load(f) == {"ok": True}
+    assert os.listdir(os.path.dirname(path)) == ["result.json"]
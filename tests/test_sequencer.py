@@ -0,0 +1,57 @@
+import numpy as np
+from sequencer import ChapterReader, add_chapter
+
+FRAMES = 20000
+FADE = 4000
+BLOCK = 3001  # Not a divisor of the chapter length or the fade
+
+
+def _chapters():
+    first = {"start": 0, "frames": FRAMES, "fade_in": FADE, "fade_out": FADE, "gain_db": 0.0}
+    second = {"start": FRAMES - FADE, "frames": FRAMES, "fade_in": FADE, "fade_out": FADE, "gain_db": 0.0}
+    return first, second
+
+
+def _reader(samples, decode_frames=4096):
+    blocks = (samples[i:i + decode_frames] for i in range(0, len(samples), decode_frames))
+    return ChapterReader(blocks, len(samples), samples.shape[1])
+
+
+def _render(chapter, samples, total):
+    out = np.zeros((total, samples.shape[1]), dtype=np.float32)
+    reader = _reader(samples)
+    for start in range(0, total, BLOCK):
+        add_chapter(out[start:start + BLOCK], start, chapter, reader)
+    return out
+
+
+def test_crossfade_keeps_constant_power():
+    first, second = _chapters()
+    total = 2 * FRAMES - FADE
+    ones = np.ones((FRAMES, 2), dtype=np.float32)
+    a, b = _render(first, ones, total), _render(second, ones, total)
+    overlap = slice(FRAMES - FADE, FRAMES)
+    # sin^2 + cos^2 = 1 in every frame of the overlap
+    assert np.allclose(a[overlap] ** 2 + b[overlap] ** 2, 1.0, atol=1e-5)
+    assert np.allclose(a[FADE:FRAMES - FADE], 1.0)
+
+    # Uncorrelated chapters keep their RMS through the crossfade
+    rng = np.random.default_rng(0)
+    noise = [rng.standard_normal((FRAMES, 2)).astype(np.float32) for _ in range(2)]
+    mix = _render(first, noise[0], total) + _render(second, noise[1], total)
+    windows = mix[FADE:total - FADE].reshape(-1, 1000, 2)
+    rms = np.sqrt(np.mean(np.square(windows), axis=(1, 2)))
+    assert np.all(np.abs(20 * np.log10(rms)) < 0.5)
+
+
+def test_reader_matches_samples_and_pads_short_streams():
+    samples = np.arange(2 * 10000, dtype=np.float32).reshape(-1, 2)
+    reader = _reader(samples, decode_frames=777)
+    parts = [reader.read(a, b) for a, b in [(0, 1), (1, 1500), (1500, 1500), (1500, 10000)]]
+    assert np.array_equal(np.concatenate(parts), samples)
+
+    short = ChapterReader(iter([samples[:100]]), 150, 2)
+    data = short.read(0, 200)
+    assert data.shape == (150, 2)
+    assert np.array_equal(data[:100], samples[:100])
+    assert not data[100:].any()
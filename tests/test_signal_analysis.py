@@ -0,0 +1,35 @@
+import numpy as np
+import audio_pipeline
+from audio_pipeline import AudioAnalysisPipeline
+from gain_staging import array_to_segment
+from signal_analysis import analyze, analyze_channels, analyze_windows
+
+RATE = 8000
+
+
+def _noise(frames, channels):
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal((frames, channels)) * [0.1, 0.3][:channels]).astype(np.float32)
+
+
+def test_channel_and_window_pools_match_sequential_analysis():
+    samples = _noise(5 * RATE, 2)
+    channels = analyze_channels(samples, RATE, max_workers=2)
+    assert channels == [analyze(samples[:, ch], RATE) for ch in range(2)]
+
+    mono = samples.mean(axis=1)
+    windows = analyze_windows(mono, RATE, window_s=2.0, max_workers=3)
+    assert [w["start"] for w in windows] == [0.0, 2.0, 4.0]
+    expected = analyze(mono[2 * RATE:4 * RATE], RATE)
+    assert windows[1]["distribution_analysis"] == expected["distribution_analysis"]
+
+
+def test_pipeline_adds_channel_and_window_analysis(tmp_path, monkeypatch):
+    path = str(tmp_path / "stereo.wav")
+    array_to_segment(_noise(5 * RATE, 2), RATE).export(path, format="wav")
+    monkeypatch.setattr(audio_pipeline, "LONG_FILE_S", 3.0)
+    monkeypatch.setattr(audio_pipeline, "WINDOW_S", 2.0)
+    metadata = AudioAnalysisPipeline(str(tmp_path)).analyze_audio(path, compact=True)
+    left, right = metadata["channel_analysis"]
+    assert right["distribution_analysis"]["std"] > 2 * left["distribution_analysis"]["std"]
+    assert len(metadata["window_analysis"]) == 3
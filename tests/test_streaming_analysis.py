@@ -0,0 +1,36 @@
+import numpy as np
+from streaming_analysis import _ColumnDecimator, _envelope_columns, _mean_columns
+
+
+def test_decimator_stays_bounded_with_odd_blocks():
+    decimator = _ColumnDecimator(64, _mean_columns)
+    # First STFT block is shorter than the rest, as with the n_fft carry
+    decimator.add(np.ones((4, 125)))
+    for _ in range(200):
+        decimator.add(np.ones((4, 128)))
+        assert decimator.count <= 2 * decimator.max_columns
+    columns = decimator.result()
+    assert columns.shape[0] == 4 and 0 < columns.shape[1] <= 64
+    assert np.allclose(columns, 1.0)
+
+
+def test_decimator_means_match_one_shot_average():
+    values = np.arange(4096, dtype=np.float64)[np.newaxis]
+    decimator = _ColumnDecimator(16, _mean_columns)
+    for start in range(0, values.shape[1], 96):
+        decimator.add(values[:, start:start + 96])
+    expected = values.reshape(1, 16, -1).mean(axis=2)
+    assert np.allclose(decimator.result(), expected)
+
+
+def test_envelope_decimator_keeps_extremes():
+    rng = np.random.default_rng(0)
+    samples = rng.uniform(-1, 1, 100003).astype(np.float32)
+    decimator = _ColumnDecimator(256, _envelope_columns)
+    for start in range(0, len(samples), 4099):
+        block = samples[start:start + 4099]
+        decimator.add(np.stack([block, block]))
+    envelope = decimator.result()
+    assert envelope.shape[1] <= 256
+    assert envelope[0].min() == samples.min()
+    assert envelope[1].max() == samples.max()
@@ -0,0 +1,33 @@
+import numpy as np
+from scipy import signal
+from vlm_gate import FINGERPRINT_BANDS, FINGERPRINT_FRAMES, METRIC_SCALES, ReviewGate, file_fingerprint
+from gain_staging import array_to_segment
+
+
+def _key(value):
+    return (np.full(len(METRIC_SCALES), value, dtype=np.float32),
+            np.full((FINGERPRINT_BANDS, FINGERPRINT_FRAMES), value, dtype=np.float32))
+
+
+def test_concurrent_gates_keep_each_others_reviews(tmp_path):
+    index_path = str(tmp_path / "index.npz")
+    first, second = ReviewGate(index_path), ReviewGate(index_path)
+    first.record_review(str(tmp_path / "a"), *_key(0.0), "feedback a", 10.0)
+    second.record_review(str(tmp_path / "b"), *_key(5.0), "feedback b", 20.0)
+    second.record_hit({"review_time": 10.0})
+
+    gate = ReviewGate(index_path)
+    assert sorted(gate.entries["feedback"]) == ["feedback a", "feedback b"]
+    assert gate.stats == {"hits": 1, "misses": 2, "time_saved": 10.0}
+    assert gate.lookup(*_key(0.1))["feedback"] == "feedback a"
+
+
+def test_file_fingerprint_ignores_rate_and_layout(tmp_path):
+    rng = np.random.default_rng(0)
+    samples = np.repeat(rng.standard_normal((3 * 44100, 1)) * 0.1, 2, axis=1).astype(np.float32)
+    stereo = str(tmp_path / "stereo.wav")
+    mono = str(tmp_path / "mono.wav")
+    array_to_segment(samples, 44100).export(stereo, format="wav")
+    array_to_segment(signal.resample_poly(samples[:, :1], 1, 2).astype(np.float32), 22050).export(mono, format="wav")
+    distance = np.sqrt(np.mean(np.square(file_fingerprint(stereo) - file_fingerprint(mono))))
+    assert distance < 0.1